@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+import matplotlib
+
+# county name corrections of the raw website data (see 1.0-hs-Preprocess-module-examples)
+county_name_map = {'COLIN': 'COLLIN', 'QUAY (NM)': None}
+results_filename_default = 'Data/Benchmarks/results.jsonl'
+
+
+def get_commit():
+
+    """
+    Get the current git commit (with a '+' suffix if the working tree has changes)
+    :return: str commit hash (or 'unknown' outside of a git repository)
+    """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('+' if dirty else '')
+
+
+def scale_raw_data(df, factor):
+
+    """
+    Scale a raw dataset by repeating its rows. The civilian names of the copies get a suffix
+    so that Preprocess does not remove them as duplicates.
+    :param pd.DataFrame df: raw civilian or officer dataset
+    :param int factor: no. copies
+    :return: scaled dataframe
+    """
+
+    if factor == 1:
+        return df
+    dfs = []
+    for i in range(factor):
+        df_copy = df.copy()
+        if i > 0 and 'civilian_name_full' in df_copy.columns:
+            df_copy['civilian_name_full'] = df_copy['civilian_name_full'] + ' {}'.format(i)
+        dfs.append(df_copy)
+    return pd.concat(dfs, axis=0, ignore_index=True)
+
+
+def get_benchmarks(df_cd_raw, df_os_raw, df_census, years, df_oag=None):
+
+    """
+    List of the benchmarks of the preprocess.py and plot.py hot paths.
+    Each benchmark is a (name, function) tuple; the function runs the code to time.
+    :param pd.DataFrame df_cd_raw: raw civilian dataset
+    :param pd.DataFrame df_os_raw: raw officer dataset
+    :param pd.DataFrame df_census: census population by county (index) and race (columns)
+    :param list or np.array years: years to select
+    :param pd.DataFrame df_oag: summary of the OAG reports (year columns, if None the
+    OAG comparison is not benchmarked)
+    :return: list of (str, function)
+    """
+
+    import plot
+    import preprocess
+    import render
+    import report
+
+    counties = df_census.index
+    df_cd = preprocess.Preprocess(df_cd_raw.copy(), counties, years=years).get_civilian_data()
+    df_os = preprocess.Preprocess(df_os_raw.copy(), counties, years=years).get_officer_data()
+    datasets = render.get_report_datasets(df_cd, df_os, df_census)
+    agency_names_cd = list(preprocess.get_wide_cols(df_cd, ['agency_'])['agency_name'].values())
+
+    benchmarks = [
+        ('Preprocess.get_civilian_data', lambda: preprocess.Preprocess(
+            df_cd_raw.copy(), counties, years=years).get_civilian_data()),
+        ('Preprocess.get_officer_data', lambda: preprocess.Preprocess(
+            df_os_raw.copy(), counties, years=years).get_officer_data()),
+        ('crosstab_by_topN_cities', lambda: preprocess.crosstab_by_topN_cities(
+            df_cd, 'civilian_race', 'incident_county', N=5, ratio=True)),
+        ('count_agencies_by_year_type', lambda: preprocess.count_agencies_by_year_type(
+            df_cd, agency_names_cd, 5)),
+    ]
+
+    for figure in render.get_report_figures(years):
+        def run(figure=figure):
+            func = getattr(plot, figure['func'])
+            func(datasets[figure['data']], *[datasets[s] for s in figure.get('args', [])],
+                 **figure['kwargs'])
+        benchmarks.append(('plot.{} ({})'.format(figure['func'], figure['name']), run))
+
+    df_ratio = preprocess.crosstab_by_topN_cities(
+        df_cd, 'civilian_race', 'incident_county', N=5, ratio=True)*100
+    df_total = preprocess.crosstab_by_topN_cities(
+        df_cd, 'civilian_race', 'incident_county', N=5, ratio=False)['TOTAL']
+    df_census_ratio = preprocess.pct(df_census, axis=1).loc[df_ratio.index, :]
+    benchmarks.append(('plot.plot_stackedbar_compare_ratio',
+                       lambda: plot.plot_stackedbar_compare_ratio(
+                           df_ratio, df_census_ratio, df_total, legend=False, figsize=(10, 6))))
+
+    # plot_* functions that are not in the report figures of render.py
+    # (same inputs and colors as report.py)
+    df_cd_died, df_os_died = datasets['df_cd_died'], datasets['df_os_died']
+    causes = list(df_cd[preprocess.incident_causes_list].sum(axis=0)
+                  .sort_values(ascending=False).index)
+    top5_locs = df_cd['incident_county'].value_counts()[:5].index.values
+    df_cd_top5 = df_cd.loc[df_cd['incident_county'].isin(top5_locs), :]
+    df_agency = pd.concat([df_cd[report.agency_names_cd + ['year']],
+                           df_os[report.agency_names_os + ['year']]], axis=0)
+    cols_year = render.get_colors('magma', np.linspace(0.8, 0.3, len(years)))
+    plot_benchmarks = [
+        ('plot_line_cause_year_county', lambda: plot.plot_line_cause_year_county(df_cd)),
+        ('plot_line_age_race_year', lambda: plot.plot_line_age_race_year(df_cd_died)),
+        ('plot_donut_incident_causes', lambda: plot.plot_donut_incident_causes(
+            df_cd, causes, report.cols_incident_causes)),
+        ('plot_barh_county_cause', lambda: plot.plot_barh_county_cause(
+            df_cd, causes, report.cols_incident_causes, 'CIVILIANS SHOT BY INCIDENT CAUSES')),
+        ('plot_bar_year', lambda: plot.plot_bar_year(df_os, 'OFFICERS SHOT', report.cols_bar)),
+        ('plot_box_officer_age', lambda: plot.plot_box_officer_age(
+            df_os, df_os_died, report.cols_shot_deaths)),
+        ('plot_barh_agency_year_type', lambda: plot.plot_barh_agency_year_type(
+            df_agency, report.agency_names_cd, list(years), cols_year)),
+        ('plot_bar_severity_year', lambda: plot.plot_bar_severity_year(
+            df_cd, report.cols_deaths_injury)),
+        ('plot_bar_survival_rate', lambda: plot.plot_bar_survival_rate(
+            df_cd, df_os, report.cols_civilian_officer)),
+        ('plot_bar_race_severity_year', lambda: plot.plot_bar_race_severity_year(
+            df_cd, list(years), report.cols_deaths_injury, 'CIVILIANS SHOT', n_county=5)),
+        ('plot_barh_county_year', lambda: plot.plot_barh_county_year(
+            df_cd_died, list(years), cols_year, 'CIVILIAN DEATHS')),
+        ('plot_box_age_race_year', lambda: plot.plot_box_age_race_year(df_cd_died, list(years))),
+        ('plot_line_cause_year_severity', lambda: plot.plot_line_cause_year_severity(
+            df_cd, causes, list(years), report.cols_incident_causes)),
+        ('plot_barh_race_cause', lambda: plot.plot_barh_race_cause(
+            df_cd_top5, causes, 'RACE DEMOGRAPHICS BY INCIDENT')),
+        ('plot_barh_delay_year', lambda: plot.plot_barh_delay_year(
+            df_cd, list(years[1:]), report.cols_bar)),
+        ('plot_barh_delay_county', lambda: plot.plot_barh_delay_county(
+            df_cd, report.cols_oag_tji)),
+    ]
+    if df_oag is not None:
+        plot_benchmarks.append(('plot_bar_oag_tji_year', lambda: plot.plot_bar_oag_tji_year(
+            df_cd, df_oag, report.cols_oag_tji)))
+    benchmarks += [('plot.' + name, func) for name, func in plot_benchmarks]
+
+    return benchmarks
+
+
+def run_benchmarks(benchmarks, repeat=3, pattern=None, verbose=True):
+
+    """
+    Time the benchmarks (best and median wall time of repeated runs)
+    :param list benchmarks: list of (name, function) (see get_benchmarks)
+    :param int repeat: no. runs of each benchmark
+    :param str pattern: only run the benchmarks whose name contains the pattern
+    :param bool verbose: if True, print the time of each benchmark
+    :return: dataframe of min and median wall time (seconds) indexed by benchmark name
+    """
+
+    import matplotlib.pyplot as plt
+
+    results = dict()
+    for name, func in benchmarks:
+        if pattern is not None and pattern not in name:
+            continue
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+            plt.close('all')
+        results[name] = {'min': np.min(times), 'median': np.median(times)}
+        if verbose:
+            print('{:<80} {:8.4f}s'.format(name, results[name]['min']))
+
+    return pd.DataFrame(results, columns=list(results)).T
+
+
+def save_results(df_results, fname, scale, commit=None):
+
+    """
+    Append the benchmark results to a json lines file (one line per benchmark)
+    :param pd.DataFrame df_results: output of run_benchmarks
+    :param str fname: json lines file
+    :param int scale: data scale factor of the run
+    :param str commit: git commit of the run (if None, the current commit)
+    """
+
+    record = {
+        'commit': get_commit() if commit is None else commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'matplotlib': matplotlib.__version__,
+        'scale': scale,
+    }
+    os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+    with open(fname, 'a') as f:
+        for name, row in df_results.iterrows():
+            f.write(json.dumps(dict(record, name=name, min=row['min'], median=row['median'])) + '\n')
+
+
+def read_results(fname):
+
+    """
+    Read the stored benchmark results
+    :param str fname: json lines file
+    :return: dataframe with one row per benchmark and run
+    """
+
+    if not os.path.exists(fname):
+        return pd.DataFrame(columns=['commit', 'time', 'scale', 'name', 'min', 'median'])
+    with open(fname) as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def compare_results(df_results, df_stored, scale, commit, threshold=1.2):
+
+    """
+    Compare the benchmark results with the latest stored run of another commit
+    :param pd.DataFrame df_results: output of run_benchmarks
+    :param pd.DataFrame df_stored: output of read_results
+    :param int scale: data scale factor of the run
+    :param str commit: git commit of the run
+    :param float threshold: time ratio (new / old) above which a benchmark is a regression
+    :return: dataframe of old and new time, ratio and regression flag (None if there is
+    no stored run to compare with)
+    """
+
+    df_stored = df_stored[(df_stored['scale'] == scale) & (df_stored['commit'] != commit)]
+    if df_stored.shape[0] == 0:
+        return None
+    commit_ref = df_stored.sort_values('time')['commit'].iloc[-1]
+    df_ref = df_stored[df_stored['commit'] == commit_ref].groupby('name')['min'].last()
+
+    df_compare = pd.DataFrame({'old': df_ref, 'new': df_results['min']}).dropna()
+    df_compare['ratio'] = df_compare['new'] / df_compare['old']
+    df_compare['regression'] = df_compare['ratio'] > threshold
+    df_compare.attrs['commit_ref'] = commit_ref
+    return df_compare
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the preprocess.py and plot.py hot paths')
+    parser.add_argument('--df-cd-filename', default='Data/Raw/Website/tji_civilians-shot_Apr2021.csv')
+    parser.add_argument('--df-os-filename', default='Data/Raw/Website/tji_officers-shot_Apr2021.csv')
+    parser.add_argument('--census-filename', default='Data/Interim/census_county_race_2010.pkl')
+    parser.add_argument('--oag-report-filename', default='Data/Interim/OAG_report_summary.csv')
+    parser.add_argument('--years-from', type=int, default=2016)
+    parser.add_argument('--years-to', type=int, default=2020)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='data scale factors (the raw data repeated)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--pattern', default=None, help='only run the matching benchmarks')
+    parser.add_argument('--results-filename', default=results_filename_default)
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='time ratio above which a benchmark is reported as a regression')
+    parser.add_argument('--no-save', action='store_true', help='do not store the results')
+    args = parser.parse_args()
+
+    matplotlib.use('Agg')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from cache import fix_county_names
+    from render import report_rcparams
+
+    years = np.arange(args.years_from, args.years_to + 1)
+    df_cd_raw = fix_county_names(pd.read_csv(args.df_cd_filename), county_name_map)
+    df_os_raw = fix_county_names(pd.read_csv(args.df_os_filename), county_name_map)
+    df_census = pd.read_pickle(args.census_filename)
+    df_oag = pd.read_csv(args.oag_report_filename, index_col=0)
+    df_oag.columns = df_oag.columns.astype(int)
+    commit = get_commit()
+    df_stored = read_results(args.results_filename)
+
+    has_regression = False
+    with matplotlib.rc_context(report_rcparams):
+        for scale in args.scales:
+            print('Scale: {}x (commit {})'.format(scale, commit))
+            benchmarks = get_benchmarks(scale_raw_data(df_cd_raw, scale),
+                                        scale_raw_data(df_os_raw, scale), df_census, years,
+                                        df_oag)
+            df_results = run_benchmarks(benchmarks, repeat=args.repeat, pattern=args.pattern)
+
+            df_compare = compare_results(df_results, df_stored, scale, commit, args.threshold)
+            if df_compare is not None:
+                print('Compared with commit {}:'.format(df_compare.attrs['commit_ref']))
+                print(df_compare.round(4).to_string())
+                has_regression |= bool(df_compare['regression'].any())
+            if not args.no_save:
+                save_results(df_results, args.results_filename, scale, commit)
+
+    if has_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
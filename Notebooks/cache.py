@@ -0,0 +1,187 @@
+import os
+import ast
+import json
+import hashlib
+import pandas as pd
+from preprocess import Preprocess
+
+# columns stored as categorical (low cardinality strings repeated across rows)
+categorical_cols = ['incident_county', 'incident_city', 'civilian_race', 'civilian_gender',
+                    'officer_race', 'officer_gender']
+categorical_col_prefixes = ['agency_name_', 'officer_race_', 'officer_gender_']
+# Data/Preprocessed/Cache of the repository (the same wherever the scripts are run from)
+cache_dir_default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 'Data', 'Preprocessed', 'Cache')
+preprocess_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'preprocess.py')
+
+
+def hash_file(fname, block_size=2**20):
+
+    """
+    Compute the content hash of a file (read in blocks to keep the memory small)
+    :param str fname: path name of the file
+    :param int block_size: no. bytes to read at once
+    :return: hex digest (sha256)
+    """
+
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def get_local_modules(fname):
+
+    """
+    Source files of a module and of the local modules (files in the same directory) that it
+    imports at the module level, directly or through other local modules
+    :param str fname: source file of the module, e.g., preprocess.py
+    :return: sorted list of the source files
+    """
+
+    fnames = set()
+    queue = [os.path.abspath(fname)]
+    while queue:
+        fname = queue.pop()
+        if fname in fnames:
+            continue
+        fnames.add(fname)
+        with open(fname) as f:
+            tree = ast.parse(f.read(), fname)
+        for node in tree.body:  # module level imports (not the imports in functions)
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                fname_import = os.path.join(os.path.dirname(fname), name + '.py')
+                if os.path.exists(fname_import):
+                    queue.append(fname_import)
+    return sorted(fnames)
+
+
+def hash_sources(fname):
+
+    """
+    Hash of the source of a module and of the local modules it imports (see get_local_modules),
+    e.g., to invalidate the outputs of preprocess.py when the preprocessing code changes
+    :param str fname: source file of the module
+    :return: hex digest (sha256)
+    """
+
+    h = hashlib.sha256()
+    for fname_module in get_local_modules(fname):
+        h.update(os.path.basename(fname_module).encode())
+        h.update(hash_file(fname_module).encode())
+    return h.hexdigest()
+
+
+def get_cache_key(raw_filename, correct_county_names, years, data_type, county_name_map=None,
+                  canonicalizers=()):
+
+    """
+    Create the cache key from the content of the raw csv, the preprocessing parameters and
+    the source of preprocess.py and the local modules it imports
+    :param str raw_filename: raw csv file (e.g., tji_civilians-shot_Apr2021.csv)
+    :param list or pd.Index correct_county_names: county names used for the name check
+    :param list years: years to select
+    :param str data_type: 'civilian' or 'officer'
+    :param dict county_name_map: county name corrections applied to the raw data
+    :param list canonicalizers: canonicalize.Canonicalizer (or None) applied by Preprocess
+    :return: str key
+    """
+
+    h = hashlib.sha256(hash_file(raw_filename).encode())
+    params = {
+        'data_type': data_type,
+        'years': sorted(int(year) for year in years),
+        'counties': sorted(str(s) for s in correct_county_names),
+        'county_name_map': sorted((str(k), str(v)) for k, v in (county_name_map or {}).items()),
+        'source': hash_sources(preprocess_filename),
+        'canonicalizers': [None if c is None else c.fingerprint for c in canonicalizers],
+    }
+    h.update(json.dumps(params).encode())
+    return h.hexdigest()[:16]
+
+
+def to_categorical(df):
+
+    """
+    Convert the county, race, gender and agency name columns to categorical dtype
+    :param pd.DataFrame df: preprocessed dataset
+    :return: dataframe with categorical columns
+    """
+
+    for col in df.columns:
+        if col in categorical_cols or any(col.startswith(s) for s in categorical_col_prefixes):
+            if pd.api.types.is_string_dtype(df[col]):
+                df[col] = df[col].astype('category')
+    return df
+
+
+def fix_county_names(df, county_name_map):
+
+    """
+    Correct county names in the raw data. Rows whose county is mapped to None are removed
+    (e.g., {'COLIN': 'COLLIN', 'QUAY (NM)': None})
+    :param pd.DataFrame df: raw dataset
+    :param dict county_name_map: wrong county name -> correct county name (or None)
+    :return: dataframe with corrected county names
+    """
+
+    counties_to_drop = [k for k, v in county_name_map.items() if v is None]
+    df = df.loc[~df['incident_county'].isin(counties_to_drop), :].copy()
+    df.loc[:, 'incident_county'] = df['incident_county'].replace(
+        {k: v for k, v in county_name_map.items() if v is not None}).values
+    return df
+
+
+def load_preprocessed_data(raw_filename, correct_county_names, data_type='civilian',
+                           years=[2016, 2017, 2018, 2019, 2020], columns=None,
+                           county_name_map=None, cache_dir=cache_dir_default,
+                           county_canonicalizer=None, agency_canonicalizer=None):
+
+    """
+    Load the preprocessed civilian or officer dataset from the parquet cache.
+    If the cache for the given raw csv and parameters does not exist, run Preprocess
+    and store the result (categorical dtypes for county, race, gender and agency names).
+    :param str raw_filename: raw csv file (e.g., tji_civilians-shot_Apr2021.csv)
+    :param list or pd.Index correct_county_names: county names used for the name check
+    :param str data_type: 'civilian' or 'officer'
+    :param list years: years to select
+    :param list columns: columns to load (if None, load all columns)
+    :param dict county_name_map: county name corrections applied before preprocessing
+    :param str cache_dir: directory of the cache files
+    :param canonicalize.Canonicalizer county_canonicalizer: see Preprocess
+    :param canonicalize.Canonicalizer agency_canonicalizer: see Preprocess
+    :return: preprocessed dataframe
+    """
+
+    if data_type not in ['civilian', 'officer']:
+        raise ValueError('data_type should be "civilian" or "officer"')
+
+    key = get_cache_key(raw_filename, correct_county_names, years, data_type, county_name_map,
+                        [county_canonicalizer, agency_canonicalizer])
+    fname = os.path.join(cache_dir, '{}_{}.parquet'.format(data_type, key))
+
+    if not os.path.exists(fname):
+        df = pd.read_csv(raw_filename)
+        if county_name_map:
+            df = fix_county_names(df, county_name_map)
+        preprocessor = Preprocess(df, correct_county_names, years=years,
+                                  county_canonicalizer=county_canonicalizer,
+                                  agency_canonicalizer=agency_canonicalizer)
+        if data_type == 'civilian':
+            df = preprocessor.get_civilian_data()
+        else:
+            df = preprocessor.get_officer_data()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first so that an interrupted run leaves no broken cache
+        to_categorical(df).to_parquet(fname + '.tmp')
+        os.replace(fname + '.tmp', fname)
+
+    return pd.read_parquet(fname, columns=columns)
@@ -0,0 +1,358 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+# token abbreviations of the normalized keys (tokens mapped to '' are dropped)
+county_abbreviations = {'COUNTY': '', 'CO': '', 'CNTY': '', 'FT': 'FORT'}
+agency_abbreviations = {
+    'DEPARTMENT': 'DEPT', 'DEP': 'DEPT', 'DPT': 'DEPT', 'PD': 'POLICE DEPT',
+    'COUNTY': 'CO', 'CNTY': 'CO',
+    'SHERIFF': 'SHERIFFS', 'SO': 'SHERIFFS OFFICE',
+    'OFC': 'OFFICE', 'OFFC': 'OFFICE', 'OFFICEARTMENT': 'OFFICE',
+    'CONSTABLE': 'CONST', 'CONSTABLES': 'CONST', 'PRECINCT': 'PCT',
+    'UNIVERSITY': 'UNIV', 'STATE': 'ST', 'FT': 'FORT',
+}
+# normalized key -> canonical name (None: not a name to keep, e.g., a county outside Texas)
+county_aliases = {'QUAY NM': None}
+agency_aliases = {
+    'DART POLICE DEPT': 'DALLAS AREA RAPID TRANSIT POLICE DEPT',
+    'DALLAS AREA RAPID TRANSIT POLICE DEPT DART': 'DALLAS AREA RAPID TRANSIT POLICE DEPT',
+}
+# statewide agencies (in addition to the sheriff's offices of the counties)
+agency_vocabulary = ['TEXAS DEPT OF PUBLIC SAFETY', 'TEXAS PARKS AND WILDLIFE DEPT',
+                     'OFFICE OF THE ATTY GENERAL']
+# tokens that do not tell agencies apart (not counted in the allowed edit distance)
+agency_generic_tokens = ['POLICE', 'DEPT', 'CO', 'SHERIFFS', 'OFFICE', 'CONST', 'PCT']
+# memo files in the (untracked) cache directory of the preprocessed datasets
+# (Data/Preprocessed/Cache of the repository, the same wherever the scripts are run from)
+memo_dir_default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'Data', 'Preprocessed', 'Cache')
+county_memo_filename_default = os.path.join(memo_dir_default, 'canonical_counties.json')
+agency_memo_filename_default = os.path.join(memo_dir_default, 'canonical_agencies.json')
+
+non_alnum_pattern = re.compile(r'[^A-Z0-9]+')
+digits_pattern = re.compile(r'[0-9]+')
+
+
+def normalize_name(name, abbreviations=None):
+
+    """
+    Normalized key of a name: upper case alphanumeric tokens (apostrophes and periods removed)
+    with the abbreviations applied, e.g., "Ector County Sheriff's Ofc." -> 'ECTOR CO SHERIFFS
+    OFFICE' (agency_abbreviations)
+    :param str name:
+    :param dict abbreviations: token -> replacement
+    :return: str
+    """
+
+    text = str(name).upper().replace("'", '').replace('.', '')
+    tokens = non_alnum_pattern.sub(' ', text).split()
+    if abbreviations:
+        tokens = [abbreviations.get(token, token) for token in tokens]
+    return ' '.join(token for token in tokens if token)
+
+
+def levenshtein(a, b, max_distance=None):
+
+    """
+    Edit distance between two strings
+    :param str a:
+    :param str b:
+    :param int max_distance: if given, stop once the distance exceeds it
+    :return: int distance (max_distance + 1 if it was exceeded)
+    """
+
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+
+    """
+    Burkhard-Keller tree of strings for nearest neighbor search by edit distance: the children
+    of a node are keyed by their distance to it, so a search only visits the children within
+    max_distance of the distance of the query to the node (triangle inequality)
+    """
+
+    def __init__(self, words=()):
+        self.root = None
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        if self.root is None:
+            self.root = (word, dict())
+            return
+        node = self.root
+        while True:
+            distance = levenshtein(word, node[0])
+            if distance == 0:
+                return
+            if distance not in node[1]:
+                node[1][distance] = (word, dict())
+                return
+            node = node[1][distance]
+
+    def search(self, word, max_distance):
+
+        """
+        Words within an edit distance of a word
+        :param str word:
+        :param int max_distance:
+        :return: list of (distance, word) sorted by distance
+        """
+
+        results = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node_word, children = nodes.pop()
+            distance = levenshtein(word, node_word)
+            if distance <= max_distance:
+                results.append((distance, node_word))
+            for child_distance, child in children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    nodes.append(child)
+        return sorted(results)
+
+
+class Canonicalizer:
+
+    """
+    Canonical names of the spelling variants of names (e.g., county or agency names).
+    A name is resolved by its normalized key: the aliases first, then the precomputed
+    dictionary of the normalized keys of the vocabulary, then the nearest key of the
+    vocabulary by edit distance (BK-tree), if unique and within the allowed distance
+    (1 per 5 characters of the tokens that are not generic, at most max_distance) and with
+    the same numbers (e.g., constable precincts). Names that are not resolved are kept as they
+    are, or with an open vocabulary, their normalized key is added as a new canonical name
+    (only matched exactly, so that similar names, e.g., of neighbor towns, are not merged).
+    Each distinct name is resolved only once and the resolved names are memoized to a JSON
+    file, which is discarded if the vocabulary or the rules change.
+    """
+
+    def __init__(self, vocabulary=(), abbreviations=None, aliases=None, generic_tokens=(),
+                 max_distance=2, open_vocabulary=False, memo_filename=None):
+
+        """
+        :param list vocabulary: canonical names (the targets of the fuzzy matches)
+        :param dict abbreviations: token -> replacement (see normalize_name)
+        :param dict aliases: normalized key -> canonical name (or None to drop the name)
+        :param list generic_tokens: tokens not counted in the allowed edit distance
+        :param int max_distance: max edit distance of a fuzzy match
+        :param bool open_vocabulary: if True, the unresolved names become canonical names
+        :param str memo_filename: JSON file of the resolved names (None: no memo)
+        """
+
+        self.abbreviations = dict(abbreviations or dict())
+        self.aliases = dict(aliases or dict())
+        self.generic_tokens = set(generic_tokens)
+        self.max_distance = max_distance
+        self.open_vocabulary = open_vocabulary
+        self.memo_filename = memo_filename
+
+        # precomputed dictionary of the normalized keys (first name of a key wins)
+        self.keys = dict()
+        for name in vocabulary:
+            self.keys.setdefault(normalize_name(name, self.abbreviations), name)
+        self.tree = BKTree(self.keys)
+        self.fingerprint = hashlib.sha256(json.dumps([
+            sorted(self.keys.items()), sorted(self.abbreviations.items()),
+            sorted((k, str(v)) for k, v in self.aliases.items()), sorted(self.generic_tokens),
+            max_distance, open_vocabulary]).encode()).hexdigest()[:16]
+
+        self.memo = dict()
+        self.n_new = 0
+        if memo_filename is not None and os.path.exists(memo_filename):
+            with open(memo_filename) as f:
+                memo = json.load(f)
+            if memo.get('fingerprint') == self.fingerprint:
+                self.memo = memo['names']
+        if open_vocabulary:
+            # the canonical names of the memo are part of the vocabulary
+            for canonical in self.memo.values():
+                if canonical is not None:
+                    self.keys.setdefault(canonical, canonical)
+
+    def get_max_distance(self, key):
+        n_chars = sum(len(token) for token in key.split() if token not in self.generic_tokens)
+        return min(self.max_distance, n_chars // 5)
+
+    def match(self, key):
+
+        """
+        Canonical name of the nearest key of the vocabulary
+        :param str key: normalized key
+        :return: str or None if there is no unique nearest key within the allowed distance
+        """
+
+        max_distance = self.get_max_distance(key)
+        if max_distance == 0:
+            return None
+        digits = digits_pattern.findall(key)
+        candidates = [(distance, word) for distance, word in self.tree.search(key, max_distance)
+                      if digits_pattern.findall(word) == digits]
+        if len(candidates) == 0 or \
+                (len(candidates) > 1 and candidates[0][0] == candidates[1][0]):
+            return None
+        return self.keys[candidates[0][1]]
+
+    def resolve(self, name):
+
+        """
+        Canonical name of a name (memoized)
+        :param str name:
+        :return: str canonical name, or None if the name is aliased to None
+        """
+
+        if name in self.memo:
+            return self.memo[name]
+        key = normalize_name(name, self.abbreviations)
+        if key in self.aliases:
+            canonical = self.aliases[key]
+        elif key in self.keys:
+            canonical = self.keys[key]
+        else:
+            canonical = self.match(key)
+            if canonical is None and self.open_vocabulary:
+                canonical = key
+                self.keys[key] = key
+            elif canonical is None:
+                canonical = name
+        self.memo[name] = canonical
+        self.n_new += 1
+        return canonical
+
+    def remap(self, values):
+
+        """
+        Canonical names of an array of names as a categorical: the distinct names are resolved
+        once and the codes are remapped with a lookup table.
+        The memo file is updated if new names were resolved.
+        :param array-like values: names (missing values stay missing)
+        :return: pd.Categorical of the canonical names (missing for the names aliased to None)
+        """
+
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object).ravel())
+        canonical = np.array([self.resolve(name) for name in uniques], dtype=object)
+
+        # lookup table of the codes, the last entry is kept for missing values (code -1)
+        is_valid = pd.notnull(canonical)
+        categories, category_codes = np.unique(canonical[is_valid].astype(str),
+                                               return_inverse=True)
+        lookup = np.full(len(uniques) + 1, -1, dtype=np.int64)
+        lookup[np.flatnonzero(is_valid)] = category_codes
+        self.save_memo()
+        return pd.Categorical.from_codes(lookup[codes], categories=categories)
+
+    def remap_cols(self, df, cols):
+
+        """
+        Canonical names of several columns with shared categories (e.g., agency_name_1, ...)
+        :param pd.DataFrame df:
+        :param list cols:
+        :return: dataframe of categorical columns
+        """
+
+        remapped = self.remap(df[cols].values)
+        codes = remapped.codes.reshape(df.shape[0], len(cols))
+        return pd.DataFrame({col: pd.Categorical.from_codes(codes[:, i], remapped.categories)
+                             for i, col in enumerate(cols)}, index=df.index)
+
+    def save_memo(self):
+
+        """
+        Save the resolved names if new names were resolved (written to a temporary file of
+        this process first, so that concurrent processes do not write to the same file)
+        """
+
+        if self.memo_filename is None or self.n_new == 0:
+            return
+        memo_dir = os.path.dirname(self.memo_filename) or '.'
+        os.makedirs(memo_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=memo_dir, suffix='.tmp', delete=False) as f:
+            json.dump({'fingerprint': self.fingerprint, 'names': self.memo}, f, indent=1,
+                      sort_keys=True)
+        os.replace(f.name, self.memo_filename)
+        self.n_new = 0
+
+
+def get_county_canonicalizer(correct_county_names, memo_filename=county_memo_filename_default):
+
+    """
+    Canonicalizer of the county names (closed vocabulary of the census county names), e.g.,
+    'COLIN' -> 'COLLIN', 'Harris County' -> 'HARRIS' and 'QUAY (NM)' -> None
+    :param list or pd.Index correct_county_names: county names
+    :param str memo_filename: JSON file of the resolved names (None: no memo)
+    :return: Canonicalizer
+    """
+
+    return Canonicalizer(correct_county_names, county_abbreviations, county_aliases,
+                         max_distance=2, memo_filename=memo_filename)
+
+
+def get_agency_canonicalizer(correct_county_names, memo_filename=agency_memo_filename_default):
+
+    """
+    Canonicalizer of the agency names (open vocabulary of the normalized agency names, with
+    the sheriff's offices of the counties and agency_vocabulary as the fuzzy match targets),
+    e.g., 'GRAND PRAIRIE POLICE DEPARTMENT' -> 'GRAND PRAIRIE POLICE DEPT' and
+    'ECTOR CO SHERIFFS OFC' -> 'ECTOR CO SHERIFFS OFFICE'
+    :param list or pd.Index correct_county_names: county names
+    :param str memo_filename: JSON file of the resolved names (None: no memo)
+    :return: Canonicalizer
+    """
+
+    vocabulary = ['{} CO SHERIFFS OFFICE'.format(county) for county in correct_county_names]
+    return Canonicalizer(vocabulary + agency_vocabulary, agency_abbreviations, agency_aliases,
+                         agency_generic_tokens, max_distance=2, open_vocabulary=True,
+                         memo_filename=memo_filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Print the canonical county and agency names of raw OIS datasets')
+    parser.add_argument('--raw-filenames', nargs='+',
+                        default=['Data/Raw/Website/tji_civilians-shot_Apr2021.csv',
+                                 'Data/Raw/Website/tji_officers-shot_Apr2021.csv'])
+    parser.add_argument('--census-filename', default='Data/Interim/census_county_race_2010.pkl')
+    parser.add_argument('--county-memo-filename', default=county_memo_filename_default)
+    parser.add_argument('--agency-memo-filename', default=agency_memo_filename_default)
+    args = parser.parse_args()
+
+    dfs = [pd.read_csv(fname) for fname in args.raw_filenames]
+    canonicalizers = {
+        'incident_county': get_county_canonicalizer(pd.read_pickle(args.census_filename).index,
+                                                    args.county_memo_filename),
+        'agency_name': get_agency_canonicalizer(pd.read_pickle(args.census_filename).index,
+                                                args.agency_memo_filename),
+    }
+    for name, canonicalizer in canonicalizers.items():
+        cols = [col for col in dfs[0].columns if re.fullmatch(name + r'(_[0-9]+)?', col)]
+        values = np.concatenate([df[[col for col in cols if col in df.columns]].values.ravel()
+                                 for df in dfs])
+        remapped = canonicalizer.remap(values)
+        is_changed = pd.notnull(values) & (np.asarray(remapped, dtype=object) != values)
+        df_changed = pd.DataFrame({'name': values[is_changed],
+                                   'canonical': np.asarray(remapped, dtype=object)[is_changed]})
+        print('{}: {} distinct names, {} canonical names'.format(
+            name, pd.Series(values).nunique(), len(remapped.categories)))
+        print(df_changed.groupby(['name', 'canonical'], dropna=False).size().to_string())
+
+
+if __name__ == '__main__':
+    main()
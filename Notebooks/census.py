@@ -0,0 +1,202 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from preprocess import age_bins
+
+# census race columns (prefix of alldata.csv) of each race in the OIS data
+census_race_cols = {
+    'WHITE': ['NH_White'],
+    'BLACK': ['NH_Black'],
+    'HISPANIC': ['Hispanic'],
+    'OTHER': ['NH_Asian', 'NH_Other'],
+}
+census_gender_cols = {'MALE': 'Male', 'FEMALE': 'Female'}
+age_bin_levels = np.arange(len(age_bins) + 1)
+
+
+def parse_census_age(s):
+
+    """
+    Convert the age column of alldata.csv to integers ('< 1 Year' -> 0, '95 Years +' -> 95)
+    :param pd.Series s: age strings (without 'All Ages')
+    :return: pd.Series of int
+    """
+
+    return s.str.replace('< 1 Year', '0 Years', regex=False).str.replace('+', '', regex=False) \
+        .str.replace('Years', '', regex=False).str.strip().astype(int)
+
+
+class Census:
+
+    """
+    Dense census population array by county, race, age group and gender
+    (same age groups as civilian_age_binned of Preprocess.add_age_groups).
+    The array is stored as .npy (plus a .json file with the levels) so it can be memory-mapped.
+    """
+
+    dims = ['county', 'race', 'age_bin', 'gender']
+
+    def __init__(self, values, counties):
+
+        """
+        :param np.array values: population (county x race x age_bin x gender)
+        :param list or pd.Index counties: county names (upper case without ' COUNTY')
+        """
+
+        self.values = values
+        self.levels = {
+            'county': pd.Index(counties),
+            'race': pd.Index(list(census_race_cols)),
+            'age_bin': pd.Index(age_bin_levels),
+            'gender': pd.Index(list(census_gender_cols)),
+        }
+        if values.shape != tuple(len(self.levels[dim]) for dim in self.dims):
+            raise ValueError('The shape of values does not match the levels: {}'.format(
+                values.shape))
+
+    @classmethod
+    def from_csv(cls, fname):
+
+        """
+        Build the population array from alldata.csv of the Texas Demographic Center
+        :param str fname: e.g., Data/Raw/Census/alldata.csv
+        :return: Census
+        """
+
+        df = pd.read_csv(fname, dtype={'FIPS': str})
+        df = df.loc[(df['County'] != 'STATE OF TEXAS') & (df['Age'] != 'All Ages'), :]
+        counties, county_codes = np.unique(df['County'].str.replace(' COUNTY', '', regex=False),
+                                           return_inverse=True)
+        age_codes = np.digitize(parse_census_age(df['Age']), age_bins)
+
+        values = np.zeros((len(counties), len(census_race_cols), len(age_bin_levels),
+                           len(census_gender_cols)), dtype=np.int64)
+        for i, race_cols in enumerate(census_race_cols.values()):
+            for j, gender in enumerate(census_gender_cols.values()):
+                population = df[['{}_{}'.format(col, gender) for col in race_cols]].sum(axis=1)
+                np.add.at(values[:, i, :, j], (county_codes, age_codes), population.values)
+        return cls(values, counties)
+
+    def save(self, fname):
+
+        """
+        Save the population array (.npy) and the county names (.json with the same name)
+        :param str fname: e.g., Data/Interim/census_county_race_age_gender_2010.npy
+        """
+
+        os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+        np.save(fname, self.values)
+        with open(os.path.splitext(fname)[0] + '.json', 'w') as f:
+            json.dump({'counties': list(self.levels['county'])}, f)
+
+    @classmethod
+    def load(cls, fname, mmap_mode='r'):
+
+        """
+        Load the population array saved by save
+        :param str fname: .npy file
+        :param str mmap_mode: memory-map mode of np.load (None to read into memory)
+        :return: Census
+        """
+
+        with open(os.path.splitext(fname)[0] + '.json') as f:
+            counties = json.load(f)['counties']
+        return cls(np.load(fname, mmap_mode=mmap_mode), counties)
+
+    def _sum(self, values, by):
+
+        """
+        Sum an array with the census axes over the dims that are not in by
+        :param np.array values: array of shape (..., county, race, age_bin, gender)
+        :param list by: dims to keep
+        :return: np.array
+        """
+
+        n = values.ndim - len(self.dims)
+        return values.sum(axis=tuple(n + i for i, dim in enumerate(self.dims) if dim not in by))
+
+    def get_population(self, by=('county', 'race')):
+
+        """
+        Population summed over the dims that are not in by
+        :param list by: dims to keep (in the order of Census.dims)
+        :return: np.array
+        """
+
+        return self._sum(np.asarray(self.values), by)
+
+    def align_counts(self, counts):
+
+        """
+        Put incident counts into an array aligned to the census array (levels that are not in
+        the census, e.g., missing ages, are dropped)
+        :param pd.Series counts: counts with a MultiIndex of county, race, age_bin and gender,
+        e.g., df_cd.groupby(['incident_county', 'civilian_race', 'civilian_age_binned',
+        'civilian_gender']).size() or CountCube.count(['county', 'race', 'age_bin', 'gender'])
+        :return: np.array of the shape of the census array
+        """
+
+        codes = [self.levels[dim].get_indexer(counts.index.get_level_values(i))
+                 for i, dim in enumerate(self.dims)]
+        is_valid = np.all([c >= 0 for c in codes], axis=0)
+        values = np.zeros(self.values.shape)
+        np.add.at(values, tuple(c[is_valid] for c in codes), counts.values[is_valid])
+        return values
+
+    def per_capita_rates(self, counts, by=('county', 'race'), per=100000):
+
+        """
+        Incidents per capita for all counties at once
+        :param np.array counts: incident counts aligned to the census array (see align_counts);
+        extra leading axes (e.g., year) are kept
+        :param list by: dims to keep (in the order of Census.dims)
+        :param int per: rate per this no. people
+        :return: np.array of rates (nan where the population is 0)
+        """
+
+        population = self.get_population(by)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(population > 0, self._sum(counts, by) / population * per, np.nan)
+
+    def age_standardized_rates(self, counts, by=('county', 'race'), standard=None, per=100000):
+
+        """
+        Age-standardized incidents per capita for all counties at once (direct standardization:
+        the age-specific rates weighted by the age distribution of a standard population)
+        :param np.array counts: incident counts aligned to the census array (see align_counts);
+        extra leading axes (e.g., year) are kept
+        :param list by: dims to keep (in the order of Census.dims, without 'age_bin')
+        :param np.array standard: standard population by age bin (if None, Texas population)
+        :param int per: rate per this no. people
+        :return: np.array of rates
+        """
+
+        if 'age_bin' in by:
+            raise ValueError('by should not include age_bin')
+        if standard is None:
+            standard = self.get_population(['age_bin'])
+        weights = np.asarray(standard, dtype=float) / np.sum(standard)
+
+        by_age = [dim for dim in self.dims if dim in by or dim == 'age_bin']
+        rates = self.per_capita_rates(counts, by_age, per)
+        axis_age = rates.ndim - len(by_age) + by_age.index('age_bin')
+        shape = [1] * rates.ndim
+        shape[axis_age] = len(weights)
+        # age groups without population do not contribute
+        return np.nansum(rates * weights.reshape(shape), axis=axis_age)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the census population array')
+    parser.add_argument('--census-filename', default='Data/Raw/Census/alldata.csv')
+    parser.add_argument('--out-filename',
+                        default='Data/Interim/census_county_race_age_gender_2010.npy')
+    args = parser.parse_args()
+
+    Census.from_csv(args.census_filename).save(args.out_filename)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,81 @@
-import papermill as pm
-
-# data summary notebook
-pm.execute_notebook(
-   'Notebooks/1.0-hs-papermill-data_summary.ipynb',
-   'Notebooks/1.0-hs-papermill-data_summary_output.ipynb',
-   parameters=dict(
-       df_cd_filename = 'Data/Preprocessed/civilian_preprocessed_20162020.pkl',
-       df_os_filename = 'Data/Preprocessed/officer_preprocessed_20162020.pkl',
-       census_filename = 'Data/Interim/census_county_race_2010.pkl',
-       years_from = 2016,
-       years_to = 2020,
-       width_heatmap = 14,
-   )
-)
\ No newline at end of file
+import os
+import sys
+import argparse
+import numpy as np
+import matplotlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import report
+
+# papermill notebooks of the report sections (input, output)
+papermill_notebooks = {
+    'data_summary': ('Notebooks/1.0-hs-papermill-data_summary.ipynb',
+                     'Notebooks/1.0-hs-papermill-data_summary_output.ipynb'),
+    'data_insight': ('Notebooks/1.1-hs-papermill-data_insight.ipynb',
+                     'Notebooks/1.1-hs-papermill-data_insight_output.ipynb'),
+}
+
+
+def execute_notebooks(parameters, report_sections=report.sections):
+
+    """
+    Execute the papermill notebooks of the report sections (one kernel per notebook)
+    :param dict parameters: notebook parameters
+    :param list report_sections: 'data_summary' and/or 'data_insight'
+    """
+
+    import papermill as pm
+
+    for section in report_sections:
+        input_path, output_path = papermill_notebooks[section]
+        pm.execute_notebook(input_path, output_path, parameters=parameters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create the OIS report')
+    parser.add_argument('--df-cd-filename',
+                        default='Data/Preprocessed/civilian_preprocessed_20162020.pkl')
+    parser.add_argument('--df-os-filename',
+                        default='Data/Preprocessed/officer_preprocessed_20162020.pkl')
+    parser.add_argument('--census-filename', default='Data/Interim/census_county_race_2010.pkl')
+    parser.add_argument('--oag-report-filename', default='Data/Interim/OAG_report_summary.csv')
+    parser.add_argument('--death-age-male-filename',
+                        default='Data/Raw/Census/mortality_rate_by_age_male.csv')
+    parser.add_argument('--death-county-filename',
+                        default='Data/Raw/Census/mortality_rate_by_county.csv')
+    parser.add_argument('--years-from', type=int, default=2016)
+    parser.add_argument('--years-to', type=int, default=2020)
+    parser.add_argument('--width-heatmap', type=float, default=14)
+    parser.add_argument('--out-dir', default='Figures/Notebook')
+    parser.add_argument('--fmt', nargs='+', default=['eps'],
+                        help='file format(s), e.g., --fmt eps pdf svg png')
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--sections', nargs='+', default=report.sections, choices=report.sections)
+    parser.add_argument('--papermill', action='store_true',
+                        help='execute the papermill notebooks instead of the in-process runner')
+    args = parser.parse_args()
+
+    if args.papermill:
+        execute_notebooks(dict(
+            df_cd_filename=args.df_cd_filename,
+            df_os_filename=args.df_os_filename,
+            census_filename=args.census_filename,
+            oag_report_filename=args.oag_report_filename,
+            years_from=args.years_from,
+            years_to=args.years_to,
+            width_heatmap=args.width_heatmap,
+        ), args.sections)
+        return
+
+    matplotlib.use('Agg')
+    years = np.arange(args.years_from, args.years_to + 1)
+    datasets = report.load_report_data(args.df_cd_filename, args.df_os_filename,
+                                       args.census_filename, args.oag_report_filename,
+                                       args.death_age_male_filename, args.death_county_filename)
+    report.run_report(datasets, years, args.out_dir, width_heatmap=args.width_heatmap,
+                      fmt=args.fmt[0] if len(args.fmt) == 1 else args.fmt, n_jobs=args.n_jobs,
+                      report_sections=args.sections)
+
+
+if __name__ == '__main__':
+    main()
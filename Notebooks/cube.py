@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+from preprocess import incident_causes_list, age_bins
+
+# age bins of Preprocess.add_age_groups (np.digitize with the age_bins edges)
+age_bin_levels = np.arange(len(age_bins) + 1)
+
+
+class CountCube:
+
+    """
+    Dense count array of incidents by year, county, race, gender, age group, incident cause
+    and death, built once from a preprocessed dataset (civilian or officer).
+
+    Each axis has one slot per level plus a last slot for missing values, so that summing
+    over an axis gives the same counts as a groupby that does not use the column.
+    The cause axis holds the incident cause indicator sums (incident_causes_list) and a last
+    slot with the number of incidents, which is used when the cause is not asked for.
+    first_rows has the same axes and holds the position of the first row of each cell
+    (the no. rows if empty), to order tied counts as value_counts does.
+    """
+
+    dims = ['year', 'county', 'race', 'gender', 'age_bin', 'cause', 'died']
+
+    def __init__(self, df, df_type=None):
+
+        """
+        :param pd.DataFrame df: preprocessed civilian or officer dataset
+        :param str df_type: 'civilian' or 'officer' (if None, inferred from the columns)
+        """
+
+        if df_type is None:
+            df_type = 'civilian' if 'civilian_race' in df.columns else 'officer'
+        self.df_type = df_type
+
+        cols = {
+            'year': 'year',
+            'county': 'incident_county',
+            'race': df_type + '_race',
+            'gender': df_type + '_gender',
+            'age_bin': 'civilian_age_binned',
+            'died': 'died',
+        }
+        fixed_levels = {'age_bin': age_bin_levels, 'died': np.array([False, True])}
+
+        self.levels = dict()
+        codes = dict()
+        for dim, col in cols.items():
+            if col not in df.columns:
+                self.levels[dim] = pd.Index([])
+                codes[dim] = np.full(df.shape[0], -1)
+            elif dim in fixed_levels:
+                self.levels[dim] = pd.Index(fixed_levels[dim])
+                codes[dim] = self.levels[dim].get_indexer(df[col])
+            else:
+                # counties are kept in the order of appearance (tie order of value_counts)
+                codes[dim], uniques = pd.factorize(df[col], sort=(dim != 'county'))
+                self.levels[dim] = pd.Index(uniques)
+        self.levels['cause'] = pd.Index(incident_causes_list)
+        self._positions = {dim: {level: i for i, level in enumerate(levels)}
+                           for dim, levels in self.levels.items()}
+
+        # missing values (code -1) go to the last slot of each axis
+        shape = tuple(len(self.levels[dim]) + 1 for dim in self.dims)
+        shape_no_cause = tuple(n for dim, n in zip(self.dims, shape) if dim != 'cause')
+        flat_inds = np.ravel_multi_index(
+            [np.where(codes[dim] < 0, n - 1, codes[dim])
+             for dim, n in zip(self.dims, shape) if dim != 'cause'], shape_no_cause)
+        n_cells = int(np.prod(shape_no_cause))
+
+        values = np.zeros(shape_no_cause + (shape[self.dims.index('cause')],), dtype=np.int32)
+        values[..., -1] = np.bincount(flat_inds, minlength=n_cells).reshape(shape_no_cause)
+        for i, cause in enumerate(incident_causes_list):
+            if cause in df.columns:
+                values[..., i] = np.bincount(flat_inds, weights=df[cause].values,
+                                             minlength=n_cells).reshape(shape_no_cause)
+        self.values = np.moveaxis(values, -1, self.dims.index('cause'))
+
+        n_rows = df.shape[0]
+        first_rows = np.full(values.shape, n_rows, dtype=np.int32).reshape(n_cells, -1)
+        cells, first = np.unique(flat_inds, return_index=True)
+        first_rows[cells, -1] = first
+        for i, cause in enumerate(incident_causes_list):
+            if cause in df.columns:
+                rows = np.flatnonzero(df[cause].values > 0)
+                cells, first = np.unique(flat_inds[rows], return_index=True)
+                first_rows[cells, i] = rows[first]
+        self.first_rows = np.moveaxis(first_rows.reshape(values.shape), -1,
+                                      self.dims.index('cause'))
+        self._marginals = dict()
+
+    def _marginal(self, keep, use_causes):
+
+        """
+        Sum the cube over the axes that are not in keep (cached)
+        :param tuple keep: dims to keep (in the order of self.dims)
+        :param bool use_causes: if False, use the incident count slot of the cause axis
+        :return: np.array with the axes of keep
+        """
+
+        key = (keep, use_causes)
+        if key not in self._marginals:
+            values = self.values
+            if not use_causes:
+                values = values.take(-1, axis=self.dims.index('cause'))
+            dims = [dim for dim in self.dims if use_causes or dim != 'cause']
+            axes = tuple(i for i, dim in enumerate(dims) if dim not in keep)
+            self._marginals[key] = values.sum(axis=axes)
+        return self._marginals[key]
+
+    def _get_positions(self, dim, selected):
+
+        """
+        Positions of the selected levels on the axis of a dim (unknown levels are ignored)
+        :param str dim: dim name
+        :param selected: a level or list of levels
+        :return: np.array of int
+        """
+
+        if np.ndim(selected) == 0:
+            selected = [selected]
+        positions = self._positions[dim]
+        return np.array([positions[s] for s in selected if s in positions], dtype=int)
+
+    def count(self, by=(), labels=True, **filters):
+
+        """
+        Count incidents grouped by the dims in by, after filtering the levels of any dim.
+        Like groupby, rows with missing values in the grouped dims are not counted.
+        If 'cause' is grouped or filtered, the incident cause indicators are summed
+        (an incident with multiple causes is counted once per cause).
+        e.g., cube.count(['year', 'race'], county=['HARRIS', 'DALLAS'], died=True)
+        :param str or list by: dims to group by
+        :param bool labels: if False, return the counts as np.array (one axis per dim in by)
+        without building the pandas index
+        :param filters: dim name and a level or list of levels to select
+        :return: pd.Series of counts (MultiIndex of all level combinations of by,
+        including zero counts), or int if by is empty
+        """
+
+        by = [by] if isinstance(by, str) else list(by)
+        for dim in by + list(filters):
+            if dim not in self.dims:
+                raise ValueError('Unknown dim: {} (use one of {})'.format(dim, self.dims))
+
+        use_causes = 'cause' in by or 'cause' in filters
+        keep = tuple(dim for dim in self.dims if dim in by or dim in filters)
+        values = self._marginal(keep, use_causes)
+
+        for axis, dim in enumerate(keep):
+            if dim in filters:
+                values = values.take(self._get_positions(dim, filters[dim]), axis=axis)
+            else:
+                values = values.take(np.arange(len(self.levels[dim])), axis=axis)
+
+        # sum over the filtered dims that are not grouped and order the axes as in by
+        values = values.sum(axis=tuple(i for i, dim in enumerate(keep) if dim not in by))
+        values = np.transpose(values, [[dim for dim in keep if dim in by].index(dim)
+                                       for dim in by])
+        if len(by) == 0:
+            return int(values)
+        if not labels:
+            return values
+
+        # levels keep the order of the cube (or of the selection), also after unstack
+        levels = [self.get_levels(dim, filters.get(dim)) for dim in by]
+        if len(by) == 1:
+            index = levels[0].rename(by[0])
+        else:
+            codes = [inds.ravel() for inds in np.indices(values.shape)]
+            index = pd.MultiIndex(levels=levels, codes=codes, names=by)
+        return pd.Series(values.ravel(), index=index)
+
+    def get_levels(self, dim, selected=None):
+
+        """
+        Levels of a dim (restricted to the selected levels if given)
+        :param str dim: dim name
+        :param selected: a level or list of levels
+        :return: pd.Index
+        """
+
+        if selected is None:
+            return self.levels[dim]
+        return self.levels[dim][self._get_positions(dim, selected)]
+
+    def top_counties(self, N=None, **filters):
+
+        """
+        Select the counties with the most incidents (same order as value_counts of the
+        filtered rows: ties are ordered by the first row of the county)
+        :param int N: no. counties (if None, all counties with incidents)
+        :param filters: dim name and a level or list of levels to select
+        :return: pd.Index of county names
+        """
+
+        counts = self.count('county', labels=False, **filters)
+
+        # first filtered row of each county (over all the levels of the other dims)
+        first_rows = self.first_rows
+        if 'cause' not in filters:
+            first_rows = first_rows.take([-1], axis=self.dims.index('cause'))
+        for axis, dim in enumerate(self.dims):
+            if dim in filters:
+                first_rows = first_rows.take(self._get_positions(dim, filters[dim]), axis=axis)
+        county_axis = self.dims.index('county')
+        first_rows = np.moveaxis(first_rows, county_axis, 0)[:len(self.levels['county'])]
+        first_rows = first_rows.reshape(first_rows.shape[0], -1).min(axis=1)
+
+        order = np.lexsort((first_rows, -counts))
+        order = order[counts[order] > 0]
+        return self.levels['county'][order[:N]]
+
+
+def get_count_cube(df, df_type=None):
+
+    """
+    Return the count cube of a dataset (or the cube itself if a CountCube is given)
+    :param pd.DataFrame or CountCube df: preprocessed dataset or its count cube
+    :param str df_type: 'civilian' or 'officer' (if None, inferred from the columns)
+    :return: CountCube
+    """
+
+    if isinstance(df, CountCube):
+        return df
+    return CountCube(df, df_type)
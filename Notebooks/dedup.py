@@ -0,0 +1,183 @@
+import re
+import difflib
+import numpy as np
+import pandas as pd
+
+
+def hash_rows(df, cols):
+
+    """
+    Hash the combination of multiple columns of each row (rows with missing values are dropped)
+    :param pd.DataFrame df:
+    :param list cols: key columns
+    :return: pd.Series of uint64 hashes with the index of df
+    """
+
+    df_keys = df[cols].dropna()
+    return pd.Series(pd.util.hash_pandas_object(df_keys, index=False).values,
+                     index=df_keys.index)
+
+
+def find_exact_duplicates(df, cols, keep='first'):
+
+    """
+    Find the rows that have the same values in all key columns as another row.
+    Rows with missing values in the key columns are never duplicates.
+    :param pd.DataFrame df:
+    :param list cols: key columns
+    :param str keep: 'first', 'last' or False (same as pd.DataFrame.duplicated)
+    :return: index of the duplicated rows
+    """
+
+    keys = hash_rows(df, cols)
+    return keys.index[keys.duplicated(keep=keep).values]
+
+
+class KeyIndex:
+
+    """
+    Hash index of key column combinations (e.g., civilian_name_full and date_incident)
+    that accumulates the keys of the rows added so far, e.g., over chunks or data releases.
+    """
+
+    def __init__(self, cols):
+        self.cols = cols
+        self.keys = set()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def add(self, df):
+
+        """
+        Add the keys of the rows and find the rows whose key was already added
+        (earlier in df or in a previous call)
+        :param pd.DataFrame df:
+        :return: index of the duplicated rows
+        """
+
+        keys = hash_rows(df, self.cols)
+        is_duplicate = keys.duplicated(keep='first').values | \
+            np.array([key in self.keys for key in keys.values], dtype=bool)
+        self.keys.update(keys.values)
+        return keys.index[is_duplicate]
+
+
+def normalize_name(s):
+
+    """
+    Normalize a name for comparison: upper case, no punctuation and sorted tokens
+    (e.g., 'Doe, John A.' -> 'A DOE JOHN')
+    :param str s: name
+    :return: normalized name
+    """
+
+    tokens = re.sub(r'[^A-Z0-9 ]', ' ', str(s).upper()).split()
+    return ' '.join(sorted(tokens))
+
+
+def name_similarity(s1, s2):
+
+    """
+    Similarity between two normalized names (1: identical, 0: nothing in common)
+    :param str s1:
+    :param str s2:
+    :return: float
+    """
+
+    if s1 == s2:
+        return 1.
+    return difflib.SequenceMatcher(None, s1, s2).ratio()
+
+
+def find_near_duplicate_pairs(df, name_col='civilian_name_full',
+                              block_cols=['date_incident', 'incident_county'], threshold=0.85):
+
+    """
+    Find pairs of rows with similar names (e.g., spelling variants) within blocks of rows that
+    share the same block column values. Names are only compared within a block, so the number
+    of comparisons grows with the block sizes instead of the square of the no. rows.
+    Rows with missing names or block values are not compared.
+    :param pd.DataFrame df:
+    :param str name_col: column with names to compare
+    :param list block_cols: columns that must be identical for two rows to be compared
+    :param float threshold: minimum name similarity of a pair
+    :return: dataframe of index_1, index_2 (row indices) and score (name similarity)
+    """
+
+    block_keys = hash_rows(df, block_cols)
+    names = df.loc[block_keys.index, name_col]
+    block_keys = block_keys[names.notna().values]
+    names = names[names.notna()].map(normalize_name)
+
+    # group row positions by block and only keep the blocks with more than one row
+    order = np.argsort(block_keys.values, kind='stable')
+    sorted_keys = block_keys.values[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    ends = np.r_[starts[1:], len(sorted_keys)]
+
+    pairs = []
+    for start, end in zip(starts, ends):
+        if end - start < 2:
+            continue
+        positions = order[start:end]
+        for i in range(len(positions)):
+            for j in range(i + 1, len(positions)):
+                score = name_similarity(names.iat[positions[i]], names.iat[positions[j]])
+                if score >= threshold:
+                    pairs.append((names.index[positions[i]], names.index[positions[j]], score))
+
+    return pd.DataFrame(pairs, columns=['index_1', 'index_2', 'score'])
+
+
+def cluster_pairs(df_pairs):
+
+    """
+    Group the matched pairs into clusters (connected components, union-find)
+    :param pd.DataFrame df_pairs: dataframe of index_1, index_2 and score
+    :return: dataframe of cluster id and score (highest similarity to another row of the
+    cluster) indexed by row index
+    """
+
+    parent = dict()
+
+    def find(x):
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while parent.get(x, x) != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for index_1, index_2 in zip(df_pairs['index_1'], df_pairs['index_2']):
+        root_1, root_2 = find(index_1), find(index_2)
+        if root_1 != root_2:
+            parent[root_2] = root_1
+
+    scores = pd.concat([df_pairs[['index_1', 'score']].rename(columns={'index_1': 'index'}),
+                        df_pairs[['index_2', 'score']].rename(columns={'index_2': 'index'})])
+    df_clusters = scores.groupby('index')['score'].max().to_frame()
+    roots = pd.Series([find(ind) for ind in df_clusters.index], index=df_clusters.index)
+    df_clusters.insert(0, 'cluster', pd.factorize(roots)[0])
+    return df_clusters.sort_values(['cluster', 'score'], ascending=[True, False])
+
+
+def find_near_duplicates(df, name_col='civilian_name_full',
+                         block_cols=['date_incident', 'incident_county'], threshold=0.85):
+
+    """
+    Find clusters of rows that are likely the same individual: identical block column values
+    (e.g., same date and county) and identical or similar names (e.g., spelling variants)
+    :param pd.DataFrame df:
+    :param str name_col: column with names to compare
+    :param list block_cols: columns that must be identical for two rows to be matched
+    :param float threshold: minimum name similarity (between 0 and 1)
+    :return: dataframe of cluster id, score, name and block columns indexed by row index
+    """
+
+    df_pairs = find_near_duplicate_pairs(df, name_col, block_cols, threshold)
+    df_clusters = cluster_pairs(df_pairs)
+    return df_clusters.join(df[[name_col] + list(block_cols)])
@@ -0,0 +1,278 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# races of the census population (columns of census_county_race_2010.pkl)
+races = ['WHITE', 'BLACK', 'HISPANIC', 'OTHER']
+# metrics with bootstrap confidence intervals
+ci_metrics = ['disparity_ratio', 'rate_ratio', 'survival_diff']
+
+
+def get_cell_counts(df, df_census, by_year=True, race_col='civilian_race'):
+
+    """
+    Counts of the deaths and injuries by race of every county (x year) cell,
+    including the census counties without incidents
+    :param pd.DataFrame df: preprocessed civilian dataset
+    :param pd.DataFrame df_census: census population by county (index) and race (columns)
+    :param bool by_year: if True, one cell per county and year (else per county)
+    :param str race_col: race column of df
+    :return: counts (np.array cells x races x [died, injured]), population (cells x races)
+    and the pd.MultiIndex (county, year) or pd.Index (county) of the cells
+    """
+
+    df = df[df[race_col].isin(races) & df['incident_county'].isin(df_census.index)]
+    counties = df_census.index.rename('incident_county')
+    if by_year:
+        years = np.sort(df['year'].unique())
+        cells = pd.MultiIndex.from_product([counties, years], names=['incident_county', 'year'])
+        cell_cols = ['incident_county', 'year']
+    else:
+        cells = counties
+        cell_cols = ['incident_county']
+
+    counts = df.groupby(cell_cols + [race_col, 'died']).size() \
+        .unstack([race_col, 'died']) \
+        .reindex(index=cells, columns=pd.MultiIndex.from_product([races, [True, False]]),
+                 fill_value=0).fillna(0)
+    counts = counts.values.astype(np.int64).reshape(len(cells), len(races), 2)
+    population = df_census.loc[cells.get_level_values('incident_county'), races] \
+        .values.astype(np.float64)
+    return counts, population, cells
+
+
+def compute_metrics(counts, population, ref=0):
+
+    """
+    Disparity metrics of every cell and race (vectorized over any leading resample axes)
+    :param np.array counts: (..., cells, races, [died, injured]) counts
+    :param np.array population: (cells, races) census population
+    :param int ref: position of the reference race of the rate ratio and survival difference
+    :return: dict of metric name and np.array (..., cells, races):
+    share (% of the incidents of the cell), population_share (%), disparity_ratio
+    (share / population_share), rate_per_100k, rate_ratio (rate / rate of the reference race),
+    survival_rate (%) and survival_diff (survival rate - survival rate of the reference race)
+    """
+
+    n = counts.sum(axis=-1)
+    n_cell = n.sum(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = 100 * n / n_cell
+        population_share = 100 * population / population.sum(axis=-1, keepdims=True)
+        rate = 1e5 * n / population
+        survival_rate = 100 * counts[..., 1] / n
+        return {
+            'share': share,
+            'population_share': np.broadcast_to(population_share, share.shape),
+            'disparity_ratio': share / population_share,
+            'rate_per_100k': rate,
+            'rate_ratio': rate / rate[..., ref:ref + 1],
+            'survival_rate': survival_rate,
+            'survival_diff': survival_rate - survival_rate[..., ref:ref + 1],
+        }
+
+
+def nan_quantiles(values, qs):
+
+    """
+    Quantiles along the first axis ignoring nan (linear interpolation as np.nanquantile,
+    with one sort instead of a reduction per column)
+    :param np.array values: (resamples, ...) values
+    :param list qs: quantiles in [0, 1]
+    :return: list of np.array (...), nan where all the values are nan
+    """
+
+    values = np.sort(values, axis=0)  # nan last
+    n_valid = (~np.isnan(values)).sum(axis=0)
+    quantiles = []
+    for q in qs:
+        position = q * np.maximum(n_valid - 1, 0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, np.maximum(n_valid - 1, 0))
+        value_lower = np.take_along_axis(values, lower[None], axis=0)[0]
+        value_upper = np.take_along_axis(values, upper[None], axis=0)[0]
+        value = value_lower + (position - lower) * (value_upper - value_lower)
+        quantiles.append(np.where(n_valid > 0, value, np.nan))
+    return quantiles
+
+
+def bootstrap_cells(counts, population, ref, n_resamples, rng, alpha=0.05):
+
+    """
+    Percentile bootstrap confidence intervals: the incidents of each cell are resampled
+    as one multinomial draw over the race x death categories (all resamples in one array)
+    :param np.array counts: (cells, races, 2) counts
+    :param np.array population: (cells, races) census population
+    :param int ref: position of the reference race
+    :param int n_resamples: no. bootstrap resamples
+    :param np.random.Generator rng:
+    :param float alpha: 1 - confidence level
+    :return: dict of metric name and (lower, upper) np.arrays (cells, races)
+    """
+
+    n_cells = counts.shape[0]
+    flat = counts.reshape(n_cells, -1)
+    n = flat.sum(axis=1)
+    # cells without incidents get uniform probabilities (their resamples are empty anyway)
+    pvals = np.where(n[:, None] > 0, flat / np.maximum(n, 1)[:, None], 1 / flat.shape[1])
+    resamples = rng.multinomial(n, pvals, size=(n_resamples, n_cells)).reshape(
+        (n_resamples,) + counts.shape)
+    values = compute_metrics(resamples, population, ref)
+
+    # resamples with an undefined metric (e.g., no incidents of the reference race) are ignored
+    return {metric: tuple(nan_quantiles(np.where(np.isinf(values[metric]), np.nan,
+                                                 values[metric]), [alpha / 2, 1 - alpha / 2]))
+            for metric in ci_metrics}
+
+
+def permutation_cells(counts, population, ref, n_resamples, rng):
+
+    """
+    Two-sided permutation test p-values of every cell and race:
+    disparity_ratio, under the null hypothesis that the race of the incidents follows the
+    population shares (binomial draws); survival_diff, under the null hypothesis that the
+    deaths do not depend on the race (the death labels of the race and the reference race
+    are permuted, i.e., hypergeometric draws of the injuries of the race)
+    :param np.array counts: (cells, races, 2) counts
+    :param np.array population: (cells, races) census population
+    :param int ref: position of the reference race
+    :param int n_resamples: no. permutations
+    :param np.random.Generator rng:
+    :return: dict of metric name and np.array of p-values (cells, races)
+    """
+
+    n = counts.sum(axis=-1)
+    n_cell = n.sum(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = np.nan_to_num(population / population.sum(axis=-1, keepdims=True))
+
+    expected = n_cell * p
+    null = rng.binomial(np.broadcast_to(n_cell, n.shape), p, size=(n_resamples,) + n.shape)
+    p_values = {'disparity_ratio': (1 + (np.abs(null - expected) >=
+                                         np.abs(n - expected) - 1e-9).sum(axis=0))
+                / (n_resamples + 1)}
+
+    injured, died = counts[..., 1], counts[..., 0]
+    injured_pair = injured + injured[..., ref:ref + 1]
+    died_pair = died + died[..., ref:ref + 1]
+    n_ref = n[..., ref:ref + 1]
+    null_injured = rng.hypergeometric(injured_pair, died_pair, n,
+                                      size=(n_resamples,) + n.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        observed = injured / n - injured[..., ref:ref + 1] / n_ref
+        null_diff = null_injured / n - (injured_pair - null_injured) / n_ref
+        is_extreme = np.abs(null_diff) >= np.abs(observed) - 1e-9
+    p_diff = (1 + is_extreme.sum(axis=0)) / (n_resamples + 1)
+    p_diff[np.isnan(observed)] = np.nan
+    p_diff[..., ref] = np.nan
+    p_values['survival_diff'] = p_diff
+    return p_values
+
+
+def run_chunk(counts, population, ref, n_resamples, seed, alpha):
+
+    """
+    Bootstrap intervals and permutation p-values of a chunk of cells (in a worker process)
+    :param np.array counts: (cells, races, 2) counts of the chunk
+    :param np.array population: (cells, races) census population of the chunk
+    :param int ref: position of the reference race
+    :param int n_resamples: no. resamples
+    :param np.random.SeedSequence seed: seed of the chunk
+    :param float alpha: 1 - confidence level
+    :return: dict of column name and np.array (cells, races)
+    """
+
+    rng_bootstrap, rng_permutation = [np.random.default_rng(s) for s in seed.spawn(2)]
+    columns = dict()
+    for metric, (lower, upper) in bootstrap_cells(counts, population, ref, n_resamples,
+                                                  rng_bootstrap, alpha).items():
+        columns[metric + '_lower'] = lower
+        columns[metric + '_upper'] = upper
+    for metric, p_values in permutation_cells(counts, population, ref, n_resamples,
+                                              rng_permutation).items():
+        columns[metric + '_p_value'] = p_values
+    return columns
+
+
+def compute_disparities(df, df_census, by_year=True, ref_race='WHITE', n_resamples=10000,
+                        alpha=0.05, n_jobs=None, chunk_size=16, seed=0):
+
+    """
+    Disparity ratios, rate ratios and survival differences of every county (x year) x race
+    cell with bootstrap confidence intervals and permutation test p-values. The cells are
+    split into chunks that draw all their resamples as batched arrays in a process pool;
+    each chunk has its own seed, so the results do not depend on n_jobs.
+    :param pd.DataFrame df: preprocessed civilian dataset
+    :param pd.DataFrame df_census: census population by county (index) and race (columns)
+    :param bool by_year: if True, one cell per county, year and race (else per county and race)
+    :param str ref_race: reference race of the rate ratio and the survival difference
+    :param int n_resamples: no. bootstrap resamples and permutations (0: no intervals)
+    :param float alpha: 1 - confidence level of the intervals
+    :param int n_jobs: no. worker processes (None: no. cores, 1: in this process)
+    :param int chunk_size: no. cells per chunk
+    :param int seed: random seed
+    :return: dataframe by county (year) and race of the no. incidents, population,
+    metrics, intervals (<metric>_lower/_upper) and p-values (<metric>_p_value)
+    """
+
+    counts, population, cells = get_cell_counts(df, df_census, by_year)
+    ref = races.index(ref_race)
+    columns = {'incidents': counts.sum(axis=-1), 'deaths': counts[..., 0],
+               'population': population}
+    columns.update(compute_metrics(counts, population, ref))
+
+    # only the cells with incidents are resampled (the others get nan)
+    inds = np.flatnonzero(counts.sum(axis=(1, 2)) > 0)
+    if n_resamples > 0 and len(inds) > 0:
+        chunks = [inds[i:i + chunk_size] for i in range(0, len(inds), chunk_size)]
+        seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+        args = [(counts[chunk], population[chunk], ref, n_resamples, s, alpha)
+                for chunk, s in zip(chunks, seeds)]
+        if n_jobs == 1:
+            results = [run_chunk(*arg) for arg in args]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                results = list(executor.map(run_chunk, *zip(*args)))
+        for col in results[0]:
+            columns[col] = np.full(counts.shape[:2], np.nan)
+            columns[col][inds] = np.concatenate([result[col] for result in results], axis=0)
+
+    index = pd.MultiIndex.from_arrays(
+        [np.repeat(cells.get_level_values(name), len(races)) for name in cells.names] +
+        [np.tile(races, len(cells))], names=list(cells.names) + ['race'])
+    return pd.DataFrame({col: np.asarray(values).ravel() for col, values in columns.items()},
+                        index=index)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Disparity ratios, rate ratios and survival differences with bootstrap '
+                    'confidence intervals and permutation tests')
+    parser.add_argument('--df-cd-filename',
+                        default='Data/Preprocessed/civilian_preprocessed_20162020.pkl')
+    parser.add_argument('--census-filename', default='Data/Interim/census_county_race_2010.pkl')
+    parser.add_argument('--all-years', action='store_true',
+                        help='one cell per county and race (instead of per year)')
+    parser.add_argument('--ref-race', default='WHITE', choices=races)
+    parser.add_argument('--n-resamples', type=int, default=10000)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out-filename', default='Data/Interim/disparities.csv')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df_disparities = compute_disparities(
+        pd.read_pickle(args.df_cd_filename), pd.read_pickle(args.census_filename),
+        by_year=not args.all_years, ref_race=args.ref_race, n_resamples=args.n_resamples,
+        alpha=args.alpha, n_jobs=args.n_jobs, seed=args.seed)
+    os.makedirs(os.path.dirname(args.out_filename) or '.', exist_ok=True)
+    df_disparities.to_csv(args.out_filename)
+    print('{} cells in {:.2f} sec'.format(df_disparities.shape[0], time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.image import imsave
+
+export_formats = ['eps', 'pdf', 'svg', 'png']
+
+
+def get_export_filenames(fname, formats=export_formats):
+
+    """
+    File names of a figure in multiple formats
+    :param str fname: path name without extension (or with an extension to replace)
+    :param list formats: file formats (extensions)
+    :return: list of str
+    """
+
+    root = os.path.splitext(fname)[0] if os.path.splitext(fname)[1][1:] in formats else fname
+    return ['{}.{}'.format(root, fmt) for fmt in formats]
+
+
+def get_format(fname):
+    return os.path.splitext(fname)[1][1:].lower()
+
+
+def draw_figure(fig, dpi, bbox_inches='tight', pad_inches=None):
+
+    """
+    Draw a figure once on an Agg canvas and compute its tight bounding box
+    :param matplotlib.figure.Figure fig:
+    :param float dpi: resolution of the canvas
+    :param str or Bbox bbox_inches: 'tight', a Bbox (inches) or None (whole figure)
+    :param float pad_inches: padding of the tight bounding box (if None, savefig.pad_inches)
+    :return: (Agg canvas, Bbox in inches or None)
+    """
+
+    canvas_orig = fig.canvas
+    dpi_orig = fig.dpi
+    canvas = FigureCanvasAgg(fig)
+    try:
+        fig.dpi = dpi
+        canvas.draw()
+        if bbox_inches == 'tight':
+            if pad_inches is None:
+                pad_inches = matplotlib.rcParams['savefig.pad_inches']
+            bbox_inches = fig.get_tightbbox(canvas.get_renderer()).padded(pad_inches)
+    finally:
+        fig.dpi = dpi_orig
+        fig.set_canvas(canvas_orig)
+    return canvas, bbox_inches
+
+
+def save_canvas_png(fig, canvas, fname, dpi, bbox_inches=None):
+
+    """
+    Save the pixels of a drawn Agg canvas as png (cropped to a bounding box) without
+    drawing the figure again. Only possible if the bounding box is within the figure.
+    :param matplotlib.figure.Figure fig:
+    :param FigureCanvasAgg canvas: canvas drawn at dpi (see draw_figure)
+    :param str fname: png file name
+    :param float dpi: resolution of the canvas
+    :param Bbox bbox_inches: bounding box (inches) to crop (None: whole figure)
+    :return: True if saved
+    """
+
+    width, height = fig.get_size_inches()
+    if bbox_inches is not None:
+        x0, y0, x1, y1 = bbox_inches.extents
+        if x0 < 0 or y0 < 0 or x1 > width or y1 > height:
+            return False
+    else:
+        x0, y0, x1, y1 = 0, 0, width, height
+
+    pixels = np.asarray(canvas.buffer_rgba())
+    n_rows = pixels.shape[0]
+    rows = slice(int(round(n_rows - y1 * dpi)), int(round(n_rows - y1 * dpi)) + int((y1 - y0) * dpi))
+    cols = slice(int(round(x0 * dpi)), int(round(x0 * dpi)) + int((x1 - x0) * dpi))
+    imsave(fname, np.ascontiguousarray(pixels[rows, cols]), dpi=dpi)
+    return True
+
+
+def save_pickled_figure(fig_pickled, fname, **kwargs):
+
+    """
+    Save a pickled figure (in a worker process)
+    :param bytes fig_pickled: pickled matplotlib figure
+    :param str fname: file name
+    :param kwargs: arguments of savefig
+    :return: file name
+    """
+
+    matplotlib.use('Agg', force=True)
+    pickle.loads(fig_pickled).savefig(fname, **kwargs)
+    return fname
+
+
+def export_figure(fig, fname, bbox_inches='tight', dpi=None, pad_inches=None, n_jobs=1):
+
+    """
+    Save a built figure to one or more files, e.g., eps, pdf, svg and png in one pass.
+    With multiple files, the figure is drawn once (Agg) to compute the tight bounding box,
+    which the other formats reuse instead of their own extra draw; the png is cropped from
+    the drawn canvas when the bounding box is within the figure; and the vector formats can
+    be written in parallel processes (only faster for large figures, e.g., the heatmaps).
+    :param matplotlib.figure.Figure fig:
+    :param str or list fname: file name or list of file names (format from the extension)
+    :param str or Bbox bbox_inches: 'tight', a Bbox (inches) or None (same as savefig)
+    :param float dpi: resolution of the raster outputs (if None, savefig.dpi)
+    :param float pad_inches: padding of the tight bounding box (if None, savefig.pad_inches)
+    :param int n_jobs: no. processes for the vector formats (None: one per format, 1: no
+    parallel processes)
+    :return: list of the saved file names
+    """
+
+    if isinstance(fname, str):
+        fig.savefig(fname, bbox_inches=bbox_inches, dpi=dpi, pad_inches=pad_inches)
+        return [fname]
+
+    if dpi is None:
+        dpi = matplotlib.rcParams['savefig.dpi']
+    if dpi == 'figure':
+        dpi = fig.dpi
+    canvas, bbox_inches = draw_figure(fig, dpi, bbox_inches, pad_inches)
+
+    fnames = list(fname)
+    fnames_rest = [s for s in fnames if not (get_format(s) == 'png' and
+                                             save_canvas_png(fig, canvas, s, dpi, bbox_inches))]
+    kwargs = dict(bbox_inches=bbox_inches, dpi=dpi)
+
+    if n_jobs is None:
+        n_jobs = len(fnames_rest)
+    if n_jobs > 1 and len(fnames_rest) > 1:
+        try:
+            fig_pickled = pickle.dumps(fig)
+        except Exception:
+            fig_pickled = None
+        if fig_pickled is not None:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(save_pickled_figure, fig_pickled, s, **kwargs)
+                           for s in fnames_rest]
+                [future.result() for future in futures]
+            return fnames
+
+    for s in fnames_rest:
+        fig.savefig(s, **kwargs)
+    return fnames
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from dedup import hash_rows
+from preprocess import Preprocess, duplicate_key_cols
+from cache import hash_sources, preprocess_filename
+
+# columns that identify an incident row across data releases (the n-th row with the same
+# values is the n-th occurrence of the key, see get_incident_keys)
+incident_key_cols = {
+    'civilian': ['date_incident', 'incident_county', 'civilian_name_full'],
+    'officer': ['date_incident', 'incident_county', 'officer_name_first', 'officer_name_last'],
+}
+store_dir_default = 'Data/Preprocessed/Store'
+
+
+def hash_values(df):
+
+    """
+    Hash each row of a raw dataset by the string values of its columns
+    (so that the hash does not depend on the dtypes that read_csv infers for a release)
+    :param pd.DataFrame df:
+    :return: pd.Series of uint64 hashes with the index of df
+    """
+
+    return pd.Series(pd.util.hash_pandas_object(df.astype(str), index=False).values,
+                     index=df.index)
+
+
+def get_incident_keys(df, key_cols):
+
+    """
+    Stable incident key of each row: hash of the key columns and the occurrence no. of
+    the key (rows with the same key columns are matched in the order of the release)
+    :param pd.DataFrame df: raw civilian or officer dataset
+    :param list key_cols: key columns (see incident_key_cols)
+    :return: pd.Series of uint64 keys with the index of df
+    """
+
+    keys = hash_values(df[key_cols])
+    occurrences = keys.groupby(keys.values).cumcount()
+    return hash_values(pd.DataFrame({'key': keys, 'occurrence': occurrences}))
+
+
+def diff_releases(df_old, df_new, key_cols):
+
+    """
+    Row-level diff between two releases of a raw dataset
+    :param pd.DataFrame df_old: previous raw release
+    :param pd.DataFrame df_new: new raw release
+    :param list key_cols: key columns (see incident_key_cols)
+    :return: dict of 'added' (index of df_new), 'removed' (index of df_old), 'modified'
+    (pd.Series of the df_new index by the df_old index) and 'unchanged' (same as 'modified')
+    """
+
+    cols = [col for col in df_old.columns if col in df_new.columns]
+    keys_old = get_incident_keys(df_old, key_cols)
+    keys_new = get_incident_keys(df_new, key_cols)
+
+    # rows of both releases matched by key
+    df_matched = pd.DataFrame({'old': keys_old.index, 'key': keys_old.values}).merge(
+        pd.DataFrame({'new': keys_new.index, 'key': keys_new.values}), on='key')
+    matched = pd.Series(df_matched['new'].values, index=df_matched['old'].values)
+
+    # a different column set changes all rows
+    if len(cols) == df_old.shape[1] == df_new.shape[1]:
+        is_same = hash_values(df_old.loc[matched.index, cols]).values == \
+            hash_values(df_new.loc[matched.values, cols]).values
+    else:
+        is_same = np.zeros(matched.shape[0], dtype=bool)
+
+    return {
+        'added': keys_new.index[~keys_new.isin(keys_old.values).values],
+        'removed': keys_old.index[~keys_old.isin(keys_new.values).values],
+        'modified': matched[~is_same],
+        'unchanged': matched[is_same],
+    }
+
+
+def count_by(df, aggregates):
+
+    """
+    Count the rows by the columns of each aggregate
+    :param pd.DataFrame df: preprocessed dataset
+    :param dict aggregates: aggregate name and list of columns
+    :return: dict of aggregate name and pd.Series of counts
+    """
+
+    return {name: df.groupby(cols).size() for name, cols in aggregates.items()}
+
+
+class ReleaseStore:
+
+    """
+    Preprocessed dataset that is updated from the diff between data releases.
+    The store keeps the last raw release, the preprocessed dataset and count aggregates
+    (pickles in store_dir). A new release only runs Preprocess on the added and modified rows
+    and on the rows that share a duplicate key (civilian_name_full and date_incident) with
+    a changed row, so that the result is the same as preprocessing the whole release.
+    The store is rebuilt from scratch if the source of preprocess.py (or of the local modules
+    it imports) changed since it was saved.
+    """
+
+    def __init__(self, store_dir, correct_county_names, data_type='civilian',
+                 years=[2016, 2017, 2018, 2019, 2020], aggregates=None):
+
+        """
+        :param str store_dir: directory of the store files
+        :param list or pd.Index correct_county_names: county names used for the name check
+        :param str data_type: 'civilian' or 'officer'
+        :param list years: years to select
+        :param dict aggregates: aggregate name and list of columns to count by,
+        e.g., {'county_race': ['incident_county', 'civilian_race']}
+        """
+
+        if data_type not in incident_key_cols:
+            raise ValueError('data_type should be "civilian" or "officer"')
+
+        self.store_dir = store_dir
+        self.correct_county_names = correct_county_names
+        self.data_type = data_type
+        self.years = years
+        self.aggregates = aggregates or dict()
+        self.df_raw = None
+        self.df = None
+        self.counts = dict()
+        self.source_hash = hash_sources(preprocess_filename)
+
+    def get_filename(self, name):
+        return os.path.join(self.store_dir, '{}_{}'.format(self.data_type, name))
+
+    def load(self):
+
+        """
+        Load the store files (if they exist and were preprocessed by the current source)
+        :return: True if the store exists
+        """
+
+        if not os.path.exists(self.get_filename('state.json')):
+            return False
+        with open(self.get_filename('state.json')) as f:
+            if json.load(f).get('source') != self.source_hash:
+                return False
+        self.df_raw = pd.read_pickle(self.get_filename('raw.pkl'))
+        self.df = pd.read_pickle(self.get_filename('preprocessed.pkl'))
+        self.counts = pd.read_pickle(self.get_filename('aggregates.pkl'))
+        return True
+
+    def save(self, state):
+
+        """
+        Save the store files (each written to a temporary file first, the state file last)
+        :param dict state: summary of the last ingestion
+        """
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        for name, obj in [('raw.pkl', self.df_raw), ('preprocessed.pkl', self.df),
+                          ('aggregates.pkl', self.counts)]:
+            pd.to_pickle(obj, self.get_filename(name) + '.tmp')
+            os.replace(self.get_filename(name) + '.tmp', self.get_filename(name))
+        with open(self.get_filename('state.json'), 'w') as f:
+            json.dump(state, f, indent=2)
+
+    def preprocess(self, df_raw):
+
+        """
+        Run Preprocess on raw rows
+        :param pd.DataFrame df_raw: raw rows
+        :return: preprocessed dataframe
+        """
+
+        preprocessor = Preprocess(df_raw.copy(), self.correct_county_names, years=self.years)
+        if self.data_type == 'civilian':
+            return preprocessor.get_civilian_data()
+        return preprocessor.get_officer_data()
+
+    def get_rows_to_preprocess(self, df_raw, diff):
+
+        """
+        Rows of the new release to preprocess: added and modified rows and the rows
+        that share a duplicate key with a changed row of either release
+        (the rows that Preprocess.remove_duplicates keeps may change)
+        :param pd.DataFrame df_raw: new raw release
+        :param dict diff: output of diff_releases
+        :return: index of df_raw
+        """
+
+        inds_changed = diff['added'].union(pd.Index(diff['modified'].values))
+        if self.data_type != 'civilian':
+            return inds_changed
+
+        keys_changed = set(hash_rows(self.df_raw.loc[diff['removed'].union(
+            diff['modified'].index)], duplicate_key_cols).values)
+        keys_changed.update(hash_rows(df_raw.loc[inds_changed], duplicate_key_cols).values)
+        keys = hash_rows(df_raw, duplicate_key_cols)
+        return inds_changed.union(keys.index[keys.isin(keys_changed).values])
+
+    def ingest(self, df_raw):
+
+        """
+        Update the store with a new raw release (the whole release is preprocessed
+        if the store is empty)
+        :param pd.DataFrame df_raw: new raw release (after the county name corrections)
+        :return: dict summary of the ingestion
+        """
+
+        start = time.perf_counter()
+        if self.df_raw is None and not self.load():
+            self.df = self.preprocess(df_raw)
+            self.counts = count_by(self.df, self.aggregates)
+            n_changes = {'added': df_raw.shape[0], 'removed': 0, 'modified': 0,
+                         'preprocessed': df_raw.shape[0]}
+        else:
+            diff = diff_releases(self.df_raw, df_raw, incident_key_cols[self.data_type])
+            inds = self.get_rows_to_preprocess(df_raw, diff)
+
+            # keep the preprocessed rows that are unchanged (relabeled by the new release)
+            unchanged = diff['unchanged'][~diff['unchanged'].isin(inds).values]
+            is_kept = self.df.index.isin(unchanged.index)
+            df_kept = self.df.loc[is_kept]
+            df_kept.index = unchanged.loc[df_kept.index].values
+            df_delta = self.preprocess(df_raw.loc[inds])
+
+            # update the aggregates with the dropped and the new rows only
+            counts_dropped = count_by(self.df.loc[~is_kept], self.aggregates)
+            counts_delta = count_by(df_delta, self.aggregates)
+            for name in self.aggregates:
+                counts = self.counts[name].sub(counts_dropped[name], fill_value=0) \
+                    .add(counts_delta[name], fill_value=0)
+                self.counts[name] = counts[counts > 0].astype(np.int64).sort_index()
+
+            self.df = pd.concat([df_kept, df_delta], axis=0).sort_index()
+            n_changes = {'added': len(diff['added']), 'removed': len(diff['removed']),
+                         'modified': len(diff['modified']), 'preprocessed': len(inds)}
+
+        self.df_raw = df_raw
+        state = dict(n_changes, n_rows_raw=df_raw.shape[0], n_rows=self.df.shape[0],
+                     source=self.source_hash,
+                     time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     wall_time=time.perf_counter() - start)
+        self.save(state)
+        return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest a raw OIS data release incrementally')
+    parser.add_argument('--raw-filename', default='Data/Raw/Website/tji_civilians-shot_Apr2021.csv')
+    parser.add_argument('--data-type', default='civilian', help='"civilian" or "officer"')
+    parser.add_argument('--census-filename', default='Data/Interim/census_county_race_2010.pkl')
+    parser.add_argument('--years-from', type=int, default=2016)
+    parser.add_argument('--years-to', type=int, default=2020)
+    parser.add_argument('--store-dir', default=store_dir_default)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from benchmark import county_name_map
+    from cache import fix_county_names
+
+    race_col = args.data_type + '_race'
+    aggregates = {
+        'year_county': ['year', 'incident_county'],
+        'year_race': ['year', race_col],
+        'county_race': ['incident_county', race_col],
+    }
+    store = ReleaseStore(args.store_dir, pd.read_pickle(args.census_filename).index,
+                         args.data_type, list(range(args.years_from, args.years_to + 1)),
+                         aggregates)
+    df_raw = fix_county_names(pd.read_csv(args.raw_filename), county_name_map)
+    print(json.dumps(store.ingest(df_raw), indent=2))
+
+
+if __name__ == '__main__':
+    main()
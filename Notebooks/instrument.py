@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import time
+import argparse
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# recorder of the current process (None: instrumentation disabled)
+_recorder = None
+
+
+def get_peak_rss():
+
+    """
+    Peak resident set size of the current process so far
+    :return: int bytes (None if the resource module is not available)
+    """
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Recorder:
+
+    """
+    Records the wall time, CPU time, memory and row counts of the instrumented steps
+    as Chrome trace events (complete events, 'ph': 'X') with the measurements in 'args'.
+    Nested steps are recorded as nested events.
+    """
+
+    def __init__(self, trace_memory=False):
+
+        """
+        :param bool trace_memory: if True, also record the tracemalloc peak and delta of each
+        step (this slows down the allocations while enabled)
+        """
+
+        self.trace_memory = trace_memory
+        self.events = []
+        self._stack = []
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def record(self, name, category, rows_in=None):
+
+        """
+        Record a step. The step can set the no. output rows in the yielded dict ('rows_out').
+        :param str name: step name, e.g., 'Preprocess.remove_duplicates'
+        :param str category: step category, e.g., 'preprocess' or 'figure'
+        :param int rows_in: no. input rows
+        :return: dict of the event arguments
+        """
+
+        args = {'rows_in': rows_in, 'rows_out': None}
+        frame = {'peak': 0}
+        if self.trace_memory:
+            frame['memory'] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._stack.append(frame)
+        start, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield args
+        finally:
+            wall, cpu = time.perf_counter() - start, time.process_time() - start_cpu
+            self._stack.pop()
+            if self.trace_memory:
+                memory, peak = tracemalloc.get_traced_memory()
+                # the nested steps reset the peak, so keep the maximum of their peaks
+                peak = max(peak, frame['peak'])
+                if len(self._stack) > 0:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+                args['tracemalloc_delta'] = memory - frame['memory']
+                args['tracemalloc_peak'] = peak - frame['memory']
+            args.update(wall_time=wall, cpu_time=cpu, peak_rss=get_peak_rss())
+            self.events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': start * 1e6,
+                'dur': wall * 1e6,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': args,
+            })
+
+
+def enable(trace_memory=False):
+
+    """
+    Enable the instrumentation in the current process
+    :param bool trace_memory: if True, also record tracemalloc measurements
+    :return: Recorder
+    """
+
+    global _recorder
+    _recorder = Recorder(trace_memory)
+    return _recorder
+
+
+def disable():
+
+    """
+    Disable the instrumentation in the current process
+    :return: list of the recorded events
+    """
+
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is None:
+        return []
+    if recorder.trace_memory:
+        tracemalloc.stop()
+    return recorder.events
+
+
+def get_recorder():
+
+    """
+    :return: Recorder of the current process (None if the instrumentation is disabled)
+    """
+
+    return _recorder
+
+
+def count_rows(data):
+
+    """
+    No. rows of a step input
+    :param data: dataframe, series or other input (e.g., CountCube)
+    :return: int (None if the input has no rows)
+    """
+
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        return data.shape[0]
+    return None
+
+
+def pop_events():
+
+    """
+    Take the events recorded so far (e.g., to send them from a worker process to the parent)
+    :return: list of events
+    """
+
+    if _recorder is None:
+        return []
+    events, _recorder.events = _recorder.events, []
+    return events
+
+
+def add_events(events):
+
+    """
+    Add events recorded in another process
+    :param list events: output of pop_events
+    """
+
+    if _recorder is not None:
+        _recorder.events.extend(events)
+
+
+def step(name, category='step', rows_in=None):
+
+    """
+    Context manager that records a step if the instrumentation is enabled
+    (e.g., with instrument.step('plot_heatmap', 'figure', rows_in=df.shape[0]) as event: ...)
+    :param str name: step name
+    :param str category: step category
+    :param int rows_in: no. input rows
+    :return: context manager yielding the dict of the event arguments (None if disabled)
+    """
+
+    if _recorder is None:
+        return nullcontext()
+    return _recorder.record(name, category, rows_in)
+
+
+def step_method(func):
+
+    """
+    Decorator of the Preprocess steps: records the step with the no. rows of self.df
+    before and after it. When the instrumentation is disabled, only a global is checked.
+    :param function func: method of a class with a df attribute
+    :return: function
+    """
+
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if _recorder is None:
+            return func(self, *args, **kwargs)
+        with _recorder.record(name, 'preprocess', rows_in=self.df.shape[0]) as event:
+            result = func(self, *args, **kwargs)
+            event['rows_out'] = self.df.shape[0]
+        return result
+
+    return wrapper
+
+
+def save_trace(events, fname):
+
+    """
+    Save events as a Chrome trace file (chrome://tracing or https://ui.perfetto.dev)
+    :param list events: recorded events
+    :param str fname: json file
+    """
+
+    os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+    start = min((event['ts'] for event in events), default=0)
+    events = [dict(event, ts=event['ts'] - start) for event in events]
+    with open(fname, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def summarize(events):
+
+    """
+    Summary table of the recorded steps (one row per category and step name)
+    :param list events: recorded events
+    :return: dataframe of the no. calls, total wall and CPU time (sec), maximum memory (MB)
+    and total input/output rows, sorted by the total wall time
+    """
+
+    df = pd.DataFrame([dict(event['args'], category=event['cat'], name=event['name'])
+                       for event in events])
+    if df.shape[0] == 0:
+        return df
+    aggs = {'calls': ('wall_time', 'size'), 'wall_time': ('wall_time', 'sum'),
+            'cpu_time': ('cpu_time', 'sum'),
+            'rows_in': ('rows_in', lambda s: s.sum(min_count=1)),
+            'rows_out': ('rows_out', lambda s: s.sum(min_count=1))}
+    for col in ['peak_rss', 'tracemalloc_peak', 'tracemalloc_delta']:
+        if col in df.columns:
+            df[col] = df[col] / 2**20
+            aggs[col + '_mb'] = (col, 'max')
+    df_summary = df.groupby(['category', 'name'], sort=False).agg(**aggs)
+    return df_summary.sort_values('wall_time', ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Profile the preprocessing of the raw data and the report figures')
+    parser.add_argument('--df-cd-filename', default='Data/Raw/Website/tji_civilians-shot_Apr2021.csv')
+    parser.add_argument('--df-os-filename', default='Data/Raw/Website/tji_officers-shot_Apr2021.csv')
+    parser.add_argument('--census-filename', default='Data/Interim/census_county_race_2010.pkl')
+    parser.add_argument('--years-from', type=int, default=2016)
+    parser.add_argument('--years-to', type=int, default=2020)
+    parser.add_argument('--out-dir', default='Figures/Profile')
+    parser.add_argument('--fmt', default='png')
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--trace-filename', default='Figures/Profile/trace.json')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also record tracemalloc measurements')
+    args = parser.parse_args()
+
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # the modules use the imported instrument module (not __main__)
+    import instrument
+    from benchmark import county_name_map
+    from cache import fix_county_names
+    from preprocess import Preprocess
+    import render
+
+    years = np.arange(args.years_from, args.years_to + 1)
+    df_census = pd.read_pickle(args.census_filename)
+    df_cd_raw = fix_county_names(pd.read_csv(args.df_cd_filename), county_name_map)
+    df_os_raw = fix_county_names(pd.read_csv(args.df_os_filename), county_name_map)
+
+    instrument.enable(args.trace_memory)
+    df_cd = Preprocess(df_cd_raw, df_census.index, years=years).get_civilian_data()
+    df_os = Preprocess(df_os_raw, df_census.index, years=years).get_officer_data()
+    datasets = render.get_report_datasets(df_cd, df_os, df_census)
+    render.render_figures(render.get_report_figures(years), datasets, args.out_dir,
+                          n_jobs=args.n_jobs, fmt=args.fmt, verbose=False)
+    events = instrument.disable()
+
+    save_trace(events, args.trace_filename)
+    print(summarize(events).round(4).to_string())
+
+
+if __name__ == '__main__':
+    main()
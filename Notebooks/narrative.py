@@ -0,0 +1,298 @@
+import os
+import re
+import time
+import pickle
+import bisect
+import argparse
+import numpy as np
+import pandas as pd
+from ingest import hash_values
+
+# free-text fields of the civilian dataset
+narrative_cols = ['cdr_narrative', 'lea_narrative_published', 'lea_narrative_shorter',
+                  'incident_call_other', 'weapon_reported_by_media']
+index_filename_default = 'Data/Preprocessed/narrative_index.pkl'
+operators = ['AND', 'OR', 'NOT']
+
+token_pattern = re.compile(r'[A-Z0-9]+')
+query_token_pattern = re.compile(r'"[^"]*"|\(|\)|[^\s()"]+')
+
+
+def tokenize(text):
+
+    """
+    Tokens of a text (upper case alphanumeric words, apostrophes removed), e.g.,
+    "OFFICER'S K-9 unit" -> ['OFFICERS', 'K', '9', 'UNIT']
+    :param str text:
+    :return: list of str
+    """
+
+    return token_pattern.findall(str(text).upper().replace("'", ''))
+
+
+class NarrativeIndex:
+
+    """
+    Inverted index of the narrative fields with positional postings:
+    token -> {(row label, field): np.array of the token positions in the field}.
+    Rows are identified by the index labels of the dataset, so that the matches join back
+    to the incident rows. update tokenizes only the new and changed rows (by a hash of their
+    narrative fields) and drops the removed rows.
+    """
+
+    def __init__(self, fields=narrative_cols):
+
+        """
+        :param list fields: free-text columns to index
+        """
+
+        self.fields = list(fields)
+        self.postings = dict()
+        self.doc_tokens = dict()
+        self.row_hashes = pd.Series([], dtype=np.uint64)
+        self._vocabulary = None
+
+    def add_document(self, label, field, text):
+        tokens = tokenize(text)
+        positions = dict()
+        for i, token in enumerate(tokens):
+            positions.setdefault(token, []).append(i)
+        doc = (label, field)
+        for token, inds in positions.items():
+            self.postings.setdefault(token, dict())[doc] = np.array(inds, dtype=np.int32)
+        self.doc_tokens[doc] = tuple(positions)
+
+    def remove_document(self, doc):
+        for token in self.doc_tokens.pop(doc, ()):
+            docs = self.postings[token]
+            del docs[doc]
+            if len(docs) == 0:
+                del self.postings[token]
+
+    def update(self, df):
+
+        """
+        Update the index with the rows of a dataset: new and changed rows are (re)indexed
+        and the rows that are not in df any more are removed
+        :param pd.DataFrame df: dataset with the narrative fields (unique index labels)
+        :return: dict of the no. added, changed and removed rows
+        """
+
+        if not df.index.is_unique:
+            raise ValueError('The index labels of the dataset should be unique')
+        cols = [col for col in self.fields if col in df.columns]
+        hashes = hash_values(df[cols])
+        is_new = ~hashes.index.isin(self.row_hashes.index)
+        is_changed = np.zeros(hashes.shape[0], dtype=bool)
+        is_changed[~is_new] = self.row_hashes.loc[hashes.index[~is_new]].values != \
+            hashes.values[~is_new]
+        removed = self.row_hashes.index.difference(hashes.index)
+
+        for label in removed.append(hashes.index[is_changed]):
+            for field in self.fields:
+                self.remove_document((label, field))
+        df_texts = df.loc[is_new | is_changed, cols]
+        for field in cols:
+            texts = df_texts[field].dropna()
+            for label, text in zip(texts.index, texts.values):
+                self.add_document(label, field, text)
+
+        self.row_hashes = hashes
+        self._vocabulary = None
+        return {'added': int(is_new.sum()), 'changed': int(is_changed.sum()),
+                'removed': len(removed)}
+
+    def get_docs(self, token, fields):
+        docs = self.postings.get(token, dict())
+        if fields is None:
+            return docs
+        return {doc: positions for doc, positions in docs.items() if doc[1] in fields}
+
+    def match_term(self, term, fields=None):
+
+        """
+        Rows with a term (a trailing * matches the tokens with the prefix)
+        :param str term: single token
+        :param list fields: fields to search (None: all fields)
+        :return: set of row labels
+        """
+
+        if not term.endswith('*'):
+            return set(label for label, _ in self.get_docs(term, fields))
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        prefix = term[:-1]
+        labels = set()
+        for token in self._vocabulary[bisect.bisect_left(self._vocabulary, prefix):]:
+            if not token.startswith(prefix):
+                break
+            labels.update(label for label, _ in self.get_docs(token, fields))
+        return labels
+
+    def match_phrase(self, tokens, fields=None):
+
+        """
+        Rows with the tokens in a sequence within a field
+        :param list tokens:
+        :param list fields: fields to search (None: all fields)
+        :return: set of row labels
+        """
+
+        if len(tokens) == 1:
+            return self.match_term(tokens[0], fields)
+        postings = [self.get_docs(token, fields) for token in tokens]
+        docs = set(postings[0]).intersection(*postings[1:]) if len(postings) > 0 else set()
+        labels = set()
+        for doc in docs:
+            # start positions of the phrase: positions of the i-th token minus i
+            starts = postings[0][doc]
+            for i, docs_token in enumerate(postings[1:], 1):
+                starts = np.intersect1d(starts, docs_token[doc] - i, assume_unique=True)
+                if len(starts) == 0:
+                    break
+            if len(starts) > 0:
+                labels.add(doc[0])
+        return labels
+
+    def search(self, query, fields=None):
+
+        """
+        Rows that match a query of terms, "phrases", prefix* terms, AND, OR, NOT and
+        parentheses (terms without an operator are joined by AND; operators are upper case),
+        e.g., '"BRANDISHED A FIREARM" OR (KNIFE NOT VEHICLE) OR TASER*'
+        :param str query:
+        :param list fields: fields to search (None: all indexed fields)
+        :return: pd.Index of the row labels (sorted)
+        """
+
+        parser = QueryParser(self, query_token_pattern.findall(query), fields)
+        labels = parser.parse()
+        return pd.Index(sorted(labels))
+
+    def save(self, fname):
+
+        """
+        Save the index (pickle, written to a temporary file first)
+        :param str fname:
+        """
+
+        os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+        self._vocabulary = None
+        with open(fname + '.tmp', 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(fname + '.tmp', fname)
+
+    @classmethod
+    def load(cls, fname):
+        with open(fname, 'rb') as f:
+            return pickle.load(f)
+
+
+class QueryParser:
+
+    """
+    Recursive descent parser of the search queries that evaluates the query on the index:
+    expr := and_expr (OR and_expr)*, and_expr := not_expr ([AND] not_expr)*,
+    not_expr := NOT not_expr | '(' expr ')' | "phrase" | term
+    """
+
+    def __init__(self, index, tokens, fields=None):
+        self.index = index
+        self.tokens = tokens
+        self.fields = fields
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def parse(self):
+        if len(self.tokens) == 0:
+            raise ValueError('Empty query')
+        labels = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError('Unexpected "{}" in the query'.format(self.peek()))
+        return labels
+
+    def parse_or(self):
+        labels = self.parse_and()
+        while self.peek() == 'OR':
+            self.next()
+            labels = labels | self.parse_and()
+        return labels
+
+    def parse_and(self):
+        labels = self.parse_not()
+        while self.peek() is not None and self.peek() not in ('OR', ')'):
+            if self.peek() == 'AND':
+                self.next()
+            labels = labels & self.parse_not()
+        return labels
+
+    def parse_not(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError('Incomplete query')
+        self.next()
+        if token == 'NOT':
+            return set(self.index.row_hashes.index) - self.parse_not()
+        if token == '(':
+            labels = self.parse_or()
+            if self.peek() != ')':
+                raise ValueError('Missing ")" in the query')
+            self.next()
+            return labels
+        if token == ')' or token in operators:
+            raise ValueError('Unexpected "{}" in the query'.format(token))
+        if token.startswith('"'):
+            return self.index.match_phrase(tokenize(token.strip('"')), self.fields)
+        if token.endswith('*'):
+            return self.index.match_term(token.upper(), self.fields)
+        # a term of multiple tokens (e.g., L.E.) is a phrase
+        return self.index.match_phrase(tokenize(token), self.fields)
+
+
+def get_or_update_index(df, fname=index_filename_default):
+
+    """
+    Load the saved index, update it with the rows of a dataset and save it if it changed
+    :param pd.DataFrame df: dataset with the narrative fields
+    :param str fname: index file
+    :return: NarrativeIndex and dict of the no. added, changed and removed rows
+    """
+
+    index = NarrativeIndex.load(fname) if os.path.exists(fname) else NarrativeIndex()
+    changes = index.update(df)
+    if sum(changes.values()) > 0:
+        index.save(fname)
+    return index, changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search the incident narratives')
+    parser.add_argument('query', help='e.g., \'"BRANDISHED A FIREARM" OR KNIFE\'')
+    parser.add_argument('--df-filename',
+                        default='Data/Preprocessed/civilian_preprocessed_20162020.pkl')
+    parser.add_argument('--index-filename', default=index_filename_default)
+    parser.add_argument('--fields', nargs='+', default=None, choices=narrative_cols)
+    parser.add_argument('--cols', nargs='+',
+                        default=['date_incident', 'incident_county', 'civilian_name_full'],
+                        help='columns of the matched rows to print')
+    args = parser.parse_args()
+
+    df = pd.read_pickle(args.df_filename)
+    start = time.perf_counter()
+    index, changes = get_or_update_index(df, args.index_filename)
+    print('Index updated in {:.3f} sec: {}'.format(time.perf_counter() - start, changes))
+
+    start = time.perf_counter()
+    labels = index.search(args.query, args.fields)
+    print('{} rows in {:.2f} ms'.format(len(labels), (time.perf_counter() - start) * 1000))
+    print(df.loc[labels, [col for col in args.cols if col in df.columns]].to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,19 @@
 import pandas as pd
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
 import seaborn as sns
 from matplotlib.ticker import MaxNLocator
+from matplotlib.collections import PathCollection
+from matplotlib.container import BarContainer
+from matplotlib.font_manager import FontProperties
+from matplotlib.path import Path
+from matplotlib.textpath import TextPath
+from matplotlib.transforms import Affine2D
+from seaborn.utils import relative_luminance
+from cube import get_count_cube
+from export import export_figure
+from preprocess import pct, count_agencies_by_year_type, report_delay_days_binnames
 
 plt.style.use('ggplot')
 cols_race = ['#CE2827', '#3167AE', '#4C5151', '#B8BAB9']
@@ -18,6 +29,8 @@ incident_causes_list = ['Emergency/Request for Assistance', 'Other', 'Traffic St
 incident_causes_list_print = ['Emergency/Request\nfor Assistance', 'Other', 'Traffic Stop',
                               'Execution of\na Warrant',
                               'Hostage/Barricade/\nOther Emergency']
+# glyph outlines of the annotation labels by (label, font size, font)
+_text_paths = dict()
 
 
 def plot_stackedbar_year_county(df, title, total_count=False, n_county=10,
@@ -26,7 +39,7 @@ def plot_stackedbar_year_county(df, title, total_count=False, n_county=10,
 
     """
     Create a horizontal stacked bar plot of the no. of incidents by county and by year (stacked)
-    :param pd.DataFrame df: dataset
+    :param pd.DataFrame or CountCube df: dataset or its count cube
     :param str title: figure title
     :param bool total_count: whether to show the total count with yticklabels
     :param int n_county: no. counties show on the y axis
@@ -37,19 +50,19 @@ def plot_stackedbar_year_county(df, title, total_count=False, n_county=10,
     :param tuple bbox_to_anchor: location of figure legend
     :return: matplotlib figure
     """
-    years = np.sort(df['year'].unique())
+    cube = get_count_cube(df)
+    years = cube.levels['year']
     if colors is None:
         raise ValueError("Please assing color names.")
 
     fig, ax = plt.subplots(1, 1, figsize=figsize)
 
     # select the counties to show on the y axis (descending order based on its total counts)
-    inds_in_order = df['incident_county'].value_counts()[:n_county][::-1].index
+    inds_in_order = cube.top_counties(n_county)[::-1]
 
     # compute the counts and slice the data based on the counties to show
-    df_year_county = df.groupby(['incident_county', 'year'])['date_incident']\
-        .count().unstack().fillna(0)
-    df_year_county_plot = df_year_county[::-1].loc[inds_in_order, :]
+    df_year_county_plot = cube.count(['county', 'year'], county=inds_in_order).unstack() \
+        .rename_axis('incident_county')
 
     # plotting
     df_year_county_plot.plot(kind='barh', stacked=True, width=0.75, ax=ax,
@@ -69,7 +82,7 @@ def plot_stackedbar_year_county(df, title, total_count=False, n_county=10,
     fig.legend(years, ncol=1, bbox_to_anchor=bbox_to_anchor, fontsize=fontsize)
     
     if fname is not None:
-        fig.savefig(fname, bbox_inches='tight')    
+        export_figure(fig, fname)
         
         
 def plot_pie(df, col, figsize=(4, 4), fontsize=10, colors=None,
@@ -77,7 +90,7 @@ def plot_pie(df, col, figsize=(4, 4), fontsize=10, colors=None,
 
     """
     Create a donut plot of the no. of incidents either by gender or race
-    :param pd.DataFrame df: dataset
+    :param pd.DataFrame or CountCube df: dataset or its count cube
     :param str col: column to visualize (gender or race)
     :param tuple figsize:
     :param str fontsize:
@@ -93,8 +106,9 @@ def plot_pie(df, col, figsize=(4, 4), fontsize=10, colors=None,
         raise ValueError("Please assing color names.")
     wedge_size = 0.5    # if it's 0 it becomes a pie plot (not a donut)
 
-    # compute the counts
-    counts = df[col].value_counts()
+    # compute the counts (col is e.g., 'civilian_race' or 'officer_gender')
+    counts = get_count_cube(df).count(col.split('_')[-1])
+    counts = counts[counts > 0].sort_values(ascending=False, kind='stable')
     total = sum(counts)
     if 'race' in col:
         counts = counts.loc[race_list]  # rearrange the rows for consistency
@@ -124,7 +138,7 @@ def plot_pie(df, col, figsize=(4, 4), fontsize=10, colors=None,
     ax.set_title(title, fontsize=fontsize)
     fig.tight_layout()
     if fname is not None:
-        fig.savefig(fname, bbox_inches='tight')                
+        export_figure(fig, fname)
 
 
 def plot_heatmap_county_race_year(df, df_type='civilian', n_county=10, total_count_yticks=True,
@@ -134,11 +148,13 @@ def plot_heatmap_county_race_year(df, df_type='civilian', n_county=10, total_cou
                                   annot_fontsize=10, 
                                   title=None,
                                   fontsize=10,
+                                  rasterized=False,
+                                  text_as_paths=False,
                                   fname=None):
 
     """
     Create a heatmap of no. incidents by year (subplot), race (xticks), and county (yticks)
-    :param pd.DataFrame df: dataset
+    :param pd.DataFrame or CountCube df: dataset or its count cube
     :param str df_type: 'civilian' or 'officer' type
     :param int n_county: no. counties on the y axis
     :param bool total_count_yticks: if True, show the total counts across all subplots with yticks
@@ -147,35 +163,32 @@ def plot_heatmap_county_race_year(df, df_type='civilian', n_county=10, total_cou
     :param tuple figsize:
     :param str cmap: matplotlib colormap name
     :param int annot_fontsize: fontsize of the annotated text in the heatmap
+    :param bool rasterized: if True, rasterize the heatmap cells in vector output
+    :param bool text_as_paths: if True, draw the annotations as glyph outlines (not text)
     :param title:
     :param fontsize:
     :param fname:
     :return: matplotlib figure
     """
-    years = np.sort(df['year'].unique())
     assert df_type == 'civilian' or 'officer'
+    cube = get_count_cube(df, df_type)
+    years = cube.levels['year']
 
     # select the counties to visualize based on the total number of incidents
-    topN = df['incident_county'].value_counts()[:n_county].index
-    gb = df.groupby(['year', df_type + '_race', 'incident_county'])
-    vmax = gb['date_incident'].count().max()
+    topN = cube.top_counties(n_county)
+    vmax = cube.count(['year', 'race', 'county'], labels=False).max()
     
     fig, axes = plt.subplots(1, len(years), figsize=figsize, sharey=True)
     for i, (ax, year) in enumerate(zip(axes, years)):
 
         # compute the count for each year, by county and by race
-        temp = gb['date_incident'].count().unstack().loc[year].loc[:, topN].T
+        temp = cube.count(['county', 'race'], year=year, county=topN).unstack()
 
-        # if there are no incidents from certain race groups in a county, that rows are missing.
-        # this should be resolved for visualization. Thus, we add nan in this case.
+        # if there are no incidents from certain race groups in a county, we add nan.
         # nans are visualized as a gray cell in the heatmap.
-        missing_races = set(race_list) - set(temp.columns)
-        if len(missing_races) > 0:
-            for missing_race in missing_races:
-                temp[missing_race] = np.nan
-        temp = temp[race_list]
-        sns.heatmap(temp, annot=True, annot_kws={"size": annot_fontsize}, cbar=False, fmt='.3g',
-                    cmap=cmap, vmin=0, vmax=vmax, ax=ax)
+        temp = temp.replace(0, np.nan).reindex(columns=race_list)
+        draw_heatmap(ax, temp, cmap=cmap, vmin=0, vmax=vmax, annot_fontsize=annot_fontsize,
+                     rasterized=rasterized, text_as_paths=text_as_paths)
         ax.set(ylabel='', xlabel='')
         
         if total_count_cols:
@@ -188,14 +201,14 @@ def plot_heatmap_county_race_year(df, df_type='civilian', n_county=10, total_cou
         else:
             ax.set_xticklabels(race_list, rotation=0)
     if total_count_yticks:
-        temp = gb['date_incident'].count().unstack().loc[:, topN].T
+        temp = cube.count(['county', 'race'], county=topN).unstack()
         axes[0].set_yticklabels([s + ' ({})'.format(int(n))
                                  for s, n in zip(temp.index, temp.sum(axis=1))])
 
     fig.suptitle(title, x=0.5, y=1.01)
     fig.tight_layout()
     if fname is not None:
-        fig.savefig(fname, bbox_inches='tight')                
+        export_figure(fig, fname)
 
         
 def plot_heatmap_age_race_year(df, total_count_yticks=True, total_count_cols=True,
@@ -205,11 +218,13 @@ def plot_heatmap_age_race_year(df, total_count_yticks=True, total_count_cols=Tru
                                fontsize=10,
                                annot_fontsize=10, 
                                title=None,
+                               rasterized=False,
+                               text_as_paths=False,
                                fname=None):
 
     """
     Create a heatmap of no. of incidents by year (column), race (xticks) and age groups (yticks)
-    :param pd.DataFrame df: dataset
+    :param pd.DataFrame or CountCube df: dataset or its count cube
     :param bool total_count_yticks: if True, show the total counts across all subplots with yticks
     :param bool total_count_cols: if True, show the total counts in a year with title
     :param bool total_count_xticks: if True, show the total counts across all rows with xticks
@@ -217,38 +232,26 @@ def plot_heatmap_age_race_year(df, total_count_yticks=True, total_count_cols=Tru
     :param str cmap:
     :param int fontsize:
     :param int annot_fontsize:
+    :param bool rasterized: if True, rasterize the heatmap cells in vector output
+    :param bool text_as_paths: if True, draw the annotations as glyph outlines (not text)
     :param str title:
     :param str fname:
     :return: matplotlib figure
     """
-    years = np.sort(df['year'].unique())
-    gb = df.groupby(['year', 'civilian_race', 'civilian_age_binned'])
-    vmax = gb['date_incident'].count().max()
+    cube = get_count_cube(df, 'civilian')
+    years = cube.levels['year']
+    vmax = cube.count(['year', 'race', 'age_bin'], labels=False).max()
     
     fig, axes = plt.subplots(1, len(years), figsize=figsize, sharey=True)
     for i, (ax, year) in enumerate(zip(axes, years)):
 
-        temp = gb['date_incident'].count().unstack().loc[year]
-
-        # Filling in the missing age groups for visualization consistency
-        missing_ages = set(range(len(age_names))) - set(temp.columns)
-        if len(missing_ages) > 0:
-            for missing_age in missing_ages:
-                temp[missing_age] = np.nan
-            temp = temp[range(len(age_names))]
-        temp = temp.T.loc[range(len(age_names)), :]
-
-        # if there are no incidents from certain race groups in a county, that rows are missing.
-        # this should be resolved for visualization. Thus, we add nan in this case.
+        # if there are no incidents from certain race or age groups, we add nan.
         # nans are visualized as a gray cell in the heatmap.
-        missing_races = set(race_list) - set(temp.columns)
-        if len(missing_races) > 0:
-            for missing_race in missing_races:
-                temp[missing_race] = np.nan
-        temp = temp[race_list]
-
-        sns.heatmap(temp, annot=True, annot_kws={"size": annot_fontsize}, cbar=False, fmt='.3g', 
-                    cmap=cmap, vmin=0, vmax=vmax, ax=ax)
+        temp = cube.count(['age_bin', 'race'], year=year, age_bin=range(len(age_names)))
+        temp = temp.unstack().replace(0, np.nan).reindex(columns=race_list)
+
+        draw_heatmap(ax, temp, cmap=cmap, vmin=0, vmax=vmax, annot_fontsize=annot_fontsize,
+                     rasterized=rasterized, text_as_paths=text_as_paths)
         ax.set(ylabel='', xlabel='')
 
         if total_count_cols:
@@ -261,22 +264,16 @@ def plot_heatmap_age_race_year(df, total_count_yticks=True, total_count_cols=Tru
         else:
             ax.set_xticklabels(race_list, rotation=0)
     if total_count_yticks:
-        temp = df['civilian_age_binned'].value_counts().sort_index().to_frame().T
-        missing_ages = set(range(len(age_names))) - set(temp.columns)
-        if len(missing_ages) > 0:
-            for missing_age in missing_ages:
-                temp[missing_age] = np.nan
-            temp = temp[range(len(age_names))]
-        temp = temp.T.loc[range(len(age_names)), :].fillna(0)
+        temp = cube.count('age_bin', age_bin=range(len(age_names)))
         axes[0].set_yticklabels([s + ' ({})'.format(int(n))
-                                 for s, n in zip(age_names, temp['civilian_age_binned'])],
+                                 for s, n in zip(age_names, temp)],
                                 rotation=0)
 
     axes[0].set_ylabel('Age Groups')
     fig.suptitle(title, x=0.5, y=1.05)
     fig.tight_layout()
     if fname is not None:
-        fig.savefig(fname, bbox_inches='tight')
+        export_figure(fig, fname)
         
 
 def plot_heatmap_age_race_cause(df, total_count_yticks=True,
@@ -288,18 +285,22 @@ def plot_heatmap_age_race_cause(df, total_count_yticks=True,
                                                        '35-44', '45-54', '55-64']),
                                 fontsize=10,
                                 title=None,
+                                rasterized=False,
+                                text_as_paths=False,
                                 fname=None):
 
     """
     Create a heatmap of no. of incidents by incident cause (column),
     race (x axis), and age groups (y axis)
-    :param pd.DataFrame df: dataset
+    :param pd.DataFrame or CountCube df: dataset or its count cube
     :param bool total_count_yticks: if True, show the total counts across all subplots with yticks
     :param bool total_count_cols: if True, show the total counts in a year with title
     :param bool total_count_xticks: if True, show the total counts across all rows with xticks
     :param tuple figsize:
     :param str cmap:
     :param int annot_fontsize:
+    :param bool rasterized: if True, rasterize the heatmap cells in vector output
+    :param bool text_as_paths: if True, draw the annotations as glyph outlines (not text)
     :param list or np.array age_interest: subset of age groups that we want to visualize
     :param int fontsize:
     :param str title:
@@ -309,33 +310,25 @@ def plot_heatmap_age_race_cause(df, total_count_yticks=True,
 
     # find the index of the age groups that we are interested in
     age_interest_inds = np.array([np.argwhere(age == age_names) for age in age_interest]).ravel()
-    # compute the counts
-    gb = df.groupby(['civilian_age_binned', 'civilian_race'])[incident_causes_list].sum()
+    cube = get_count_cube(df, 'civilian')
+
+    # the oldest age group with incidents is excluded when computing vmax
+    ages = cube.levels['age_bin'][cube.count(['age_bin', 'race'], labels=False).sum(axis=1) > 0]
+    ages = ages[:-1]
 
     fig, axes = plt.subplots(1, len(incident_causes_list), figsize=figsize, sharey=True)
     for i, (ax, incident_cause) in enumerate(zip(axes, incident_causes_list)):
-        
-        temp = (gb[incident_cause].unstack())[:-1]
-        vmax = temp.max().max()
+
+        temp = cube.count(['age_bin', 'race'], cause=incident_cause, age_bin=ages).unstack()
+        vmax = temp.values.max()
 
         # filling in the missing race and age groups
-        missing_races = set(race_list) - set(temp.columns)
-        if len(missing_races) > 0:
-            for missing_race in missing_races:
-                temp[missing_race] = np.nan
-        temp = temp[race_list]
-        missing_ages = set(age_interest_inds) - set(temp.index)
-        if len(missing_ages) > 0:
-            for missing_age in missing_ages:
-                temp = temp.T
-                temp[missing_age] = np.nan
-                temp = temp.T.sort_index()
-        temp = temp.loc[age_interest_inds, race_list]
+        temp = temp.reindex(index=age_interest_inds, columns=race_list)
         temp.index = age_interest
         temp = temp.replace(0, np.nan)  # nan (non existing data = 0) is shown as gray
 
-        sns.heatmap(temp, annot=True, annot_kws={"size": annot_fontsize}, cbar=False, fmt='.3g', 
-                    cmap=cmap, vmin=0, vmax=vmax, ax=ax)
+        draw_heatmap(ax, temp, cmap=cmap, vmin=0, vmax=vmax, annot_fontsize=annot_fontsize,
+                     rasterized=rasterized, text_as_paths=text_as_paths)
         ax.set(ylabel='', xlabel='')
 
         if total_count_cols:
@@ -349,7 +342,7 @@ def plot_heatmap_age_race_cause(df, total_count_yticks=True,
         else:
             ax.set_xticklabels(race_list, rotation=0)
     if total_count_yticks:
-        temp = df['civilian_age_binned'].value_counts().sort_index()[:-1].loc[age_interest_inds]
+        temp = cube.count('age_bin', age_bin=age_interest_inds)
         axes[0].set_yticklabels([s + ' ({})'.format(int(n))
                                  for s, n in zip(age_interest, temp)], rotation=0,
                                 fontsize=fontsize)
@@ -357,7 +350,7 @@ def plot_heatmap_age_race_cause(df, total_count_yticks=True,
     fig.suptitle(title, x=0.5, y=1.05)
     fig.tight_layout()
     if fname is not None:
-        fig.savefig(fname, bbox_inches='tight')        
+        export_figure(fig, fname)
         
         
 def plot_stackedbar_compare_ratio(df_ratio, df_ref_ratio, df_total,
@@ -398,22 +391,34 @@ def plot_stackedbar_compare_ratio(df_ratio, df_ref_ratio, df_total,
                           fontsize='medium')
 
         # text annotation
-        for p in ax.patches:
-            width, height = p.get_width(), p.get_height()
-            x, y = p.get_xy() 
-            if height > 0:
-                ax.text(x+width/2, y+height/2, '{:.1f}%'.format(height), color='white', fontsize=10,
-                        horizontalalignment='center', verticalalignment='center')        
+        annotate(ax, 'v', unit='percent', fontsize=10)
     fig.tight_layout()
     
     if fname is not None:
-        fig.savefig(fname)
+        export_figure(fig, fname, bbox_inches=None)
 
 
-def annotate(ax, direction='v', unit='num', color='white', fontsize=10, threshold=0):
+def get_bar_geometry(ax):
 
     """
-    Add text to matplotlib bar graphs
+    Get the position and size of all bars of an ax at once
+    (from the bar containers, or from the patches if there are none)
+    :param matplotlib.axes._subplots.AxesSubplot ax: matplotlib ax
+    :return: np.array of x, y, width and height (no. bars x 4)
+    """
+
+    patches = [p for c in ax.containers if isinstance(c, BarContainer) for p in c]
+    if len(patches) == 0:
+        patches = ax.patches
+    return np.array([p.get_bbox().bounds for p in patches], dtype=float).reshape(-1, 4)
+
+
+def annotate(ax, direction='v', unit='num', color='white', fontsize=10, threshold=0,
+             text_as_paths=False):
+
+    """
+    Add text to matplotlib bar graphs. The bars are filtered at once and
+    the labels are drawn by add_text_collection.
     :param matplotlib.axes._subplots.AxesSubplot ax: matplotlib ax
     :param str direction: 'v' for vertical 'h' for horizontal bar plot
     :param str unit: 'num' for absolute counts, 'percent' for percentage
@@ -421,6 +426,8 @@ def annotate(ax, direction='v', unit='num', color='white', fontsize=10, threshol
     :param int fontsize:
     :param int threshold: annotation happens when the number is larger than the threshold
     (if it's 0, it shows all positive numbers)
+    :param bool text_as_paths: if True, draw the labels as glyph outlines (see
+    add_text_collection)
     :return: same matplotlib ax but with annotation
     """
     
@@ -430,22 +437,136 @@ def annotate(ax, direction='v', unit='num', color='white', fontsize=10, threshol
         s = '{:.1f}%'
     else:
         raise ValueError('unit should be "num" or "percent"')
-    
-    for p in ax.patches:
-        width, height = p.get_width(), p.get_height()
-        x, y = p.get_xy()
-        
-        if direction == 'v':
-            target = height
-        elif direction == 'h':
-            target = width
-        else:
-            raise ValueError('direction should be "v" or "h"')
-            
-        if target > threshold:
-            ax.text(x+width/2, y+height/2, s.format(target), color=color, fontsize=fontsize,
-                    horizontalalignment='center', verticalalignment='center')
-        
+
+    x, y, width, height = get_bar_geometry(ax).T
+    if direction == 'v':
+        target = height
+    elif direction == 'h':
+        target = width
+    else:
+        raise ValueError('direction should be "v" or "h"')
+
+    # nan bars (e.g., missing values in stacked bars) are not annotated
+    is_shown = np.greater(target, threshold, where=~np.isnan(target),
+                          out=np.zeros(target.shape, dtype=bool))
+    add_text_collection(ax, (x + width/2)[is_shown], (y + height/2)[is_shown],
+                        [s.format(n) for n in target[is_shown]], color, fontsize=fontsize,
+                        text_as_paths=text_as_paths)
+    return ax
+
+
+def get_text_path(label, fontsize, prop):
+
+    """
+    Glyph outline of a label (in points) centered at (0, 0) like a text with
+    horizontalalignment='center' and verticalalignment='center'. The outlines are cached.
+    :param str label:
+    :param float fontsize:
+    :param FontProperties prop: font (family and weight)
+    :return: matplotlib Path
+    """
+
+    key = (label, fontsize, hash(prop))
+    if key not in _text_paths:
+        path = TextPath((0, 0), label, size=fontsize, prop=prop)
+        # vertical center of the line box (same as the layout of matplotlib Text)
+        box = TextPath((0, 0), 'lp', size=fontsize, prop=prop).get_extents()
+        width = path.get_extents().x1 if len(path.vertices) > 0 else 0
+        _text_paths[key] = Path(path.vertices - [width / 2, (box.y0 + box.y1) / 2], path.codes)
+    return _text_paths[key]
+
+
+def add_text_collection(ax, x, y, labels, colors, fontsize=10, rasterized=False,
+                        text_as_paths=False):
+
+    """
+    Draw many centered labels (e.g., bar or cell annotations) as Text artists, or
+    (if text_as_paths) as glyph outlines in one PathCollection per distinct label, which
+    is faster to draw and stores the outline of a distinct label only once in vector
+    output. The outlines are paths, not text, in eps, pdf and svg outputs: they cannot
+    be selected, searched or edited as text there.
+    :param matplotlib.axes._subplots.AxesSubplot ax: matplotlib ax
+    :param np.array x: x positions (data coordinates)
+    :param np.array y: y positions (data coordinates)
+    :param list labels: label strings
+    :param str or np.array colors: color of all labels or of each label
+    :param float fontsize:
+    :param bool rasterized: if True, rasterize the labels in vector output
+    :param bool text_as_paths: if True, draw the labels as glyph outlines
+    :return: list of Text (or of PathCollection if text_as_paths)
+    """
+
+    colors = np.broadcast_to(matplotlib.colors.to_rgba_array(colors), (len(labels), 4))
+    if not text_as_paths:
+        texts = [ax.text(x_, y_, label, color=color, fontsize=fontsize,
+                         horizontalalignment='center', verticalalignment='center')
+                 for x_, y_, label, color in zip(x, y, labels, colors)]
+        for text in texts:
+            text.set_rasterized(rasterized)
+        return texts
+
+    prop = FontProperties(size=fontsize)
+    offsets = np.column_stack([x, y])
+    # glyph outlines in points, placed at the data positions
+    transform = Affine2D().scale(1 / 72) + ax.figure.dpi_scale_trans
+    codes, uniques = pd.factorize(np.asarray(labels, dtype=object))
+
+    collections = []
+    for i, label in enumerate(uniques):
+        is_label = codes == i
+        collection = PathCollection([get_text_path(label, fontsize, prop)],
+                                    facecolors=colors[is_label], edgecolors='none',
+                                    offsets=offsets[is_label], offset_transform=ax.transData,
+                                    transform=transform, zorder=3)
+        collection.set_rasterized(rasterized)
+        ax.add_collection(collection, autolim=False)
+        collections.append(collection)
+    return collections
+
+
+def draw_heatmap(ax, df, cmap='viridis', vmin=None, vmax=None, annot_fontsize=10, fmt='.3g',
+                 rasterized=False, text_as_paths=False):
+
+    """
+    Draw an annotated heatmap with a single mesh (same look as
+    sns.heatmap(df, annot=True, cbar=False), which also draws the whole figure to check
+    the tick label overlaps). The annotations are drawn by add_text_collection.
+    :param matplotlib.axes._subplots.AxesSubplot ax: matplotlib ax
+    :param pd.DataFrame df: cell values (nan cells are not colored nor annotated)
+    :param str cmap: matplotlib colormap name
+    :param float vmin:
+    :param float vmax:
+    :param int annot_fontsize: fontsize of the annotated text in the heatmap
+    :param str fmt: format of the annotations
+    :param bool rasterized: if True, rasterize the cell layer in vector output (eps, pdf, svg)
+    :param bool text_as_paths: if True, draw the annotations as glyph outlines
+    :return: QuadMesh
+    """
+
+    values = np.ma.masked_invalid(df.values.astype(float))
+    n_rows, n_cols = values.shape
+
+    sns.despine(ax=ax, left=True, bottom=True)
+    mesh = ax.pcolormesh(values, cmap=cmap, vmin=vmin, vmax=vmax, linewidths=0,
+                         edgecolor='white', rasterized=rasterized)
+    ax.set(xlim=(0, n_cols), ylim=(0, n_rows))
+    ax.invert_yaxis()
+    ax.set(xticks=np.arange(n_cols) + 0.5, yticks=np.arange(n_rows) + 0.5)
+    ax.set_xticklabels(df.columns)
+    ax.set_yticklabels(df.index, rotation=0, va='center')
+
+    # dark text on light cells and white text on dark cells (same as seaborn)
+    mesh.update_scalarmappable()
+    is_valid = ~np.ma.getmaskarray(values).ravel()
+    is_light = relative_luminance(mesh.get_facecolors()[is_valid]) > .408
+    text_colors = np.where(np.reshape(is_light, (-1, 1)), [[.15, .15, .15, 1]], [[1, 1, 1, 1]])
+    x, y = np.meshgrid(np.arange(n_cols) + 0.5, np.arange(n_rows) + 0.5)
+    labels = [('{:' + fmt + '}').format(val) for val in values.data.ravel()[is_valid]]
+    add_text_collection(ax, x.ravel()[is_valid], y.ravel()[is_valid], labels, text_colors,
+                        fontsize=annot_fontsize, text_as_paths=text_as_paths)
+    return mesh
+
+
 def plot_line_race_year(
     df,
     df_type='civilian', 
@@ -458,16 +579,12 @@ def plot_line_race_year(
     fname=None
     ):
 
-    years = np.sort(df['year'].unique())
     assert df_type == 'civilian' or 'officer'
+    cube = get_count_cube(df, df_type)
+    years = cube.levels['year']
 
-    temp = df.groupby(['year', df_type + '_race'])['date_incident'].count().unstack()
-    
-    missing_races = set(race_list) - set(temp.columns)
-    if len(missing_races) > 0:
-        for missing_race in missing_races:
-            temp[missing_race] = np.nan
-    temp = temp[race_list]
+    # years without incidents of a race group are not shown (nan)
+    temp = cube.count(['year', 'race']).unstack().replace(0, np.nan).reindex(columns=race_list)
     
     fig, ax = plt.subplots(figsize=figsize)
     temp.plot(marker='o', color=cols_race, ax=ax)
@@ -483,7 +600,7 @@ def plot_line_race_year(
     ax.set_title(title, fontsize=fontsize)
     fig.tight_layout()
     if fname is not None:
-        fig.savefig(fname, bbox_inches='tight')
+        export_figure(fig, fname)
 
 
 def plot_scatter_compare_race_incident_vs_population(
@@ -503,7 +620,7 @@ def plot_scatter_compare_race_incident_vs_population(
 
     """
     Create a lineplot of no. incidents by county (subplot), year (xticks), and race (yticks)
-    :param pd.DataFrame df: dataset
+    :param pd.DataFrame or CountCube df: dataset or its count cube
     :param str df_type: 'civilian' or 'officer' type
     :param int n_county: no. counties on the y axis
     :param bool total_count_cols: if True, show the total counts in a year with title
@@ -516,28 +633,21 @@ def plot_scatter_compare_race_incident_vs_population(
     :param fname:
     :return: matplotlib figure
     """
-    years = np.sort(df['year'].unique())
     assert df_type == 'civilian' or 'officer'
+    cube = get_count_cube(df, df_type)
 
     # select the counties to visualize based on the total number of incidents
-    topN = df['incident_county'].value_counts()[:n_county].index
-    gb = df.groupby(['incident_county', 'year', df_type + '_race'])
+    topN = cube.top_counties(n_county)
     
     fig, axes = plt.subplots(1, n_county, figsize=figsize, sharey=True)
     for i, (ax, county_name) in enumerate(zip(axes, topN)):
 
-        # compute the count for each year, by county and by race and normalize
-        temp = gb['date_incident'].count().unstack().loc[county_name, :].fillna(0).sum()
+        # compute the count by race and normalize
+        temp = cube.count('race', county=county_name)
         temp_normalized = temp/temp.sum()
         
-        # if there are no incidents from certain race groups in a county, that rows are missing.
-        # this should be resolved for visualization. Thus, we add nan in this case.
-        # nans are visualized as a gray cell in the heatmap.
-        missing_races = set(race_list) - set(temp_normalized.index)
-        if len(missing_races) > 0:
-            for missing_race in missing_races:
-                temp_normalized[missing_race] = np.nan
-        temp_normalized = temp_normalized[race_list]
+        # race groups that do not exist in the dataset are added as nan
+        temp_normalized = temp_normalized.reindex(race_list)
         
         # population data
         df_population_normalized = df_population_county_race.loc[county_name]
@@ -568,7 +678,7 @@ def plot_scatter_compare_race_incident_vs_population(
     fig.suptitle(title, x=0.5, y=0.95, fontsize=fontsize)
     fig.tight_layout()
     if fname is not None:
-        fig.savefig(fname, bbox_inches='tight')      
+        export_figure(fig, fname)
     
     
 def plot_line_race_year_county(
@@ -584,32 +694,20 @@ def plot_line_race_year_county(
     fname=None
     ):
 
-    years = np.sort(df['year'].unique())
     assert df_type == 'civilian' or 'officer'
+    cube = get_count_cube(df, df_type)
+    years = cube.levels['year']
 
     # select the counties to visualize based on the total number of incidents
-    topN = df['incident_county'].value_counts()[:n_county].index
-    gb = df.groupby(['incident_county', 'year', df_type + '_race'])
+    topN = cube.top_counties(n_county)
     
     fig, axes = plt.subplots(1, n_county, figsize=figsize, sharey=True)
     for i, (ax, county_name) in enumerate(zip(axes, topN)):
 
-        # compute the count for each year, by county and by race
-        temp = gb['date_incident'].count().unstack().loc[county_name, :].fillna(0)
-        
-        missing_years = set(years) - set(temp.index)
-        if len(missing_years) > 0:
-            df_missing_year = pd.DataFrame(
-                np.zeros((len(missing_years), temp.shape[1])),
-                columns=temp.columns,
-                index=list(missing_years))
-            temp = temp.append(df_missing_year).loc[years]
-    
-        missing_races = set(race_list) - set(temp.columns)
-        if len(missing_races) > 0:
-            for missing_race in missing_races:
-                temp[missing_race] = np.nan
-        temp = temp[race_list]
+        # compute the count for each year and by race
+        # (race groups that do not exist in the dataset are added as nan)
+        temp = cube.count(['year', 'race'], county=county_name).unstack()
+        temp = temp.reindex(columns=race_list)
     
         temp.plot(marker='.', linestyle='--', markersize=10, color=cols_race, legend=False, ax=ax)
         ax.set(ylabel='', xlabel='', xticks=years)
@@ -630,7 +728,7 @@ def plot_line_race_year_county(
     fig.suptitle(title, x=0.5, y=0.95, fontsize=fontsize)
     fig.tight_layout()
     if fname is not None:
-        fig.savefig(fname, bbox_inches='tight')
+        export_figure(fig, fname)
 
 def plot_line_cause_year_county(
     df,
@@ -644,26 +742,18 @@ def plot_line_cause_year_county(
     fname=None
     ):
 
-    years = np.sort(df['year'].unique())
-    assert 'civilian_race' in df.columns
+    cube = get_count_cube(df, 'civilian')
+    years = cube.levels['year']
     
     # select the counties to visualize based on the total number of incidents
-    topN = df['incident_county'].value_counts()[:n_county].index
-    gb = df.groupby(['incident_county', 'year'])
+    topN = cube.top_counties(n_county)
     
     fig, axes = plt.subplots(1, n_county, figsize=figsize, sharey=True)
     for i, (ax, county_name) in enumerate(zip(axes, topN)):
 
-        # compute the count for each year, by county and by race
-        temp = gb[incident_causes_list_sorted].sum().loc[county_name].fillna(0)
-        
-        missing_years = set(years) - set(temp.index)
-        if len(missing_years) > 0:
-            df_missing_year = pd.DataFrame(
-                np.zeros((len(missing_years), temp.shape[1])),
-                columns=temp.columns,
-                index=list(missing_years))
-            temp = temp.append(df_missing_year).loc[years]
+        # compute the count for each year and by incident cause
+        temp = cube.count(['year', 'cause'], county=county_name).unstack()
+        temp = temp[incident_causes_list_sorted]
     
         temp.plot(marker='.', linestyle='--', markersize=10, legend=False, color=colors_incident_cause, ax=ax)
         ax.set(ylabel='', xlabel='', xticks=years)
@@ -684,7 +774,7 @@ def plot_line_cause_year_county(
     fig.suptitle(title, x=0.5, y=0.95, fontsize=fontsize)
     fig.tight_layout()
     if fname is not None:
-        fig.savefig(fname, bbox_inches='tight')
+        export_figure(fig, fname)
 
 
 def plot_line_age_race_year(
@@ -700,37 +790,23 @@ def plot_line_age_race_year(
     fname=None
     ):
 
-    years = np.sort(df['year'].unique())
-    assert 'civilian_race' in df.columns
+    cube = get_count_cube(df, 'civilian')
+    years = cube.levels['year']
     
     # slice the data based on the condition
     # to select all county, set n_county to None
-    if not n_county:
-        n_county = df['incident_county'].nunique()
-        
-    topN = df['incident_county'].value_counts()[:n_county].index
-    df_ = df.loc[(df['incident_county'].isin(topN)) &  (df['civilian_age_binned'].isin(age_bins_focus)), :]
-    gb = df_.groupby(['civilian_age_binned', 'year', 'civilian_race'])
+    topN = cube.top_counties(n_county)
+    counts = cube.count(['age_bin', 'year', 'race'], county=topN, age_bin=age_bins_focus)
+
+    # race groups without incidents in the selected counties and age groups are shown as nan
+    races = counts.groupby(level='race').sum()
+    races = races[races > 0].index
         
     fig, axes = plt.subplots(1, len(age_bins_focus), figsize=figsize, sharey=True)
     for i, (ax, age_bin) in enumerate(zip(axes, age_bins_focus)):
 
-        # compute the count for each year, by county and by race
-        temp = gb['date_incident'].count().unstack().loc[age_bin].fillna(0)
-        
-        missing_years = set(years) - set(temp.index)
-        if len(missing_years) > 0:
-            df_missing_year = pd.DataFrame(
-                np.zeros((len(missing_years), temp.shape[1])),
-                columns=temp.columns,
-                index=list(missing_years))
-            temp = temp.append(df_missing_year).loc[years]
-
-        missing_races = set(race_list) - set(temp.columns)
-        if len(missing_races) > 0:
-            for missing_race in missing_races:
-                temp[missing_race] = np.nan
-        temp = temp[race_list]
+        # compute the count for each year and by race
+        temp = counts.loc[age_bin].unstack()[races].reindex(columns=race_list)
     
         temp.plot(marker='.', linestyle='--', markersize=10, legend=False, color=cols_race, ax=ax)
         ax.set(ylabel='', xlabel='', xticks=years)
@@ -751,4 +827,528 @@ def plot_line_age_race_year(
     fig.suptitle(title, x=0.5, y=0.95, fontsize=fontsize)
     fig.tight_layout()
     if fname is not None:
-        fig.savefig(fname, bbox_inches='tight')
+        export_figure(fig, fname)
+
+
+def plot_donut_incident_causes(df, causes, colors, title='INCIDENT CAUSES', figsize=(4, 4),
+                               fontsize=10, bbox_to_anchor=(1.15, 0, 0.5, 0.9), fname=None):
+
+    """
+    Create a donut chart of the incident causes
+    :param pd.DataFrame df: civilian dataset
+    :param list causes: incident cause columns (in the order to show)
+    :param list colors: colors of the incident causes
+    :param str title: figure title
+    :param tuple figsize:
+    :param int fontsize:
+    :param tuple bbox_to_anchor: location of figure legend
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    counts = df[causes].sum(axis=0)
+
+    fig, ax = plt.subplots(1, 1, figsize=figsize)
+    ax.pie(counts, startangle=90, labels=None, colors=colors,
+           wedgeprops=dict(width=0.5, edgecolor='w'))
+    ax.set_title(title, fontsize=fontsize)
+
+    pct_counts = counts/counts.sum()*100
+    legend_txt = ['{:.1f}% {}'.format(n, s.capitalize()) for s, n in zip(counts.index, pct_counts)]
+
+    fig.legend(legend_txt, ncol=1, bbox_to_anchor=bbox_to_anchor, fontsize=fontsize)
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname)
+
+
+def plot_barh_county_cause(df, causes, colors, title, n_county=10, figsize=(10, 3),
+                           fontsize=10, bbox_to_anchor=(1.27, 1), fname=None):
+
+    """
+    Create a horizontal stacked bar plot of the incident causes by county (top N counties)
+    :param pd.DataFrame df: civilian dataset
+    :param list causes: incident cause columns (in the order to show)
+    :param list colors: colors of the incident causes
+    :param str title: figure title
+    :param int n_county: no. counties on the y axis
+    :param tuple figsize:
+    :param int fontsize:
+    :param tuple bbox_to_anchor: location of figure legend
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    inds_in_order = df['incident_county'].value_counts()[:n_county][::-1].index
+
+    fig, ax = plt.subplots(1, 1, figsize=figsize)
+    temp = df.groupby('incident_county')[causes].sum().loc[inds_in_order, :]
+    temp.plot.barh(stacked=True, color=colors, ax=ax, width=0.75, legend=False)
+    ax.set_yticklabels([s + ' ({})'.format(int(n)) for s, n in zip(inds_in_order, temp.sum(axis=1))],
+                       rotation=0)
+    annotate(ax, 'h', fontsize=fontsize)
+    ax.set_title(title, fontsize=fontsize)
+
+    fig.legend(causes, ncol=1, bbox_to_anchor=bbox_to_anchor, fontsize=fontsize)
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname)
+
+
+def plot_bar_year(df, title, color, figsize=(3.5, 3.5), fontsize=10, fname=None):
+
+    """
+    Create a bar plot of the no. incidents by year
+    :param pd.DataFrame df: civilian or officer dataset
+    :param str title: figure title
+    :param str or list color: bar color
+    :param tuple figsize:
+    :param int fontsize:
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    fig, ax = plt.subplots(1, 1, figsize=figsize)
+    df['year'].value_counts().sort_index().plot.bar(rot=0, color=color, ax=ax, width=0.75)
+    annotate(ax, 'v', fontsize=fontsize)
+    ax.set_title(title, fontsize=fontsize)
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname, bbox_inches=None)
+
+
+def plot_box_officer_age(df, df_died, colors, figsize=(4, 3), ylim=(20, 70), fname=None):
+
+    """
+    Create box plots of the age of the officers shot and the officers who died
+    :param pd.DataFrame df: officer dataset
+    :param pd.DataFrame df_died: officer dataset (deaths only)
+    :param list colors: colors of the two boxes
+    :param tuple figsize:
+    :param tuple ylim: y axis range
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    fig, axes = plt.subplots(1, 2, sharey=True, figsize=figsize)
+    df['officer_age'].plot.box(color=colors[0], ax=axes[0])
+    df_died['officer_age'].plot.box(color=colors[1], ax=axes[1])
+    axes[0].set(ylim=ylim, title='Officers Shot'.upper(), xticklabels='', ylabel='AGE', xlabel=None)
+    axes[1].set(title='Officers died'.upper(), xticklabels='', xlabel=None)
+
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname)
+
+
+def plot_barh_agency_year_type(df, agency_names, years, colors, N=5, threshold=0,
+                               titles=('Police Department', "Sheriff's Office", 'Other Agencies'),
+                               figsize=(14, 5), fontsize=10, bbox_to_anchor=(1, 1), fname=None):
+
+    """
+    Create horizontal stacked bar plots of the no. incident reports of the top N agencies
+    by agency type (police, sheriff, and others) and year
+    :param pd.DataFrame df: officer or civilian dataset (or both concatenated)
+    :param list agency_names: list of columns that have agency names, e.g., 'agency_name_1'
+    :param list or np.array years: years to show
+    :param list colors: colors of the years
+    :param int N: no. agencies of each type
+    :param int threshold: annotation happens when the number is larger than the threshold
+    :param tuple titles: subplot titles of the agency types
+    :param tuple figsize:
+    :param int fontsize:
+    :param tuple bbox_to_anchor: location of figure legend
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    _, df_agency_count_plot = count_agencies_by_year_type(df, agency_names, N)
+
+    fig, axes = plt.subplots(3, 1, figsize=figsize, sharex=True)
+    for i, (df_, title) in enumerate(zip(list(df_agency_count_plot.values()), titles)):
+        ax = axes[i]
+        df_ = df_.T[::-1].loc[:, years]
+        inds_order = df_.sum(axis=1).sort_values().index
+        df_ = df_.loc[inds_order, :]
+        df_.plot(kind='barh', ax=ax, title=title.upper(), color=colors,
+                 width=0.75, legend=False, stacked=True)
+        if i == 2:
+            ax.set_xlabel('No. Incident Reports')
+        annotate(ax, 'h', threshold=threshold, fontsize=fontsize)
+
+        ax.set_yticklabels([s + ' ({})'.format(int(n)) for s, n in zip(df_.index, df_.sum(axis=1))],
+                           rotation=0, fontsize=fontsize)
+
+    fig.legend(years, ncol=len(years), bbox_to_anchor=bbox_to_anchor, fontsize=fontsize)
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname)
+
+
+def plot_bar_oag_tji_year(df, df_oag, colors, title='CIVILIANS SHOT BY YEAR', figsize=(6, 4),
+                          fontsize=10, bbox_to_anchor=(1, 1.05), fname=None):
+
+    """
+    Create a bar plot that compares the no. civilians shot by year in the OAG reports and in the
+    TJI data (TJI bars show the difference from OAG)
+    :param pd.DataFrame df: civilian dataset
+    :param pd.DataFrame df_oag: summary of the OAG reports (year columns)
+    :param list colors: colors of OAG and TJI
+    :param str title: figure title
+    :param tuple figsize:
+    :param int fontsize:
+    :param tuple bbox_to_anchor: location of figure legend
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    df_oag_sum = df_oag.loc[['C-DEATH', 'C-INJURY'], :].sum(axis=0)
+    df_cd_sum = df.groupby('year')['date_incident'].count()
+    df_oag_cd_sum = pd.concat([df_oag_sum, df_cd_sum], axis=1)
+    df_oag_cd_sum.columns = ['OAG', 'TJI']
+    years = df_oag_cd_sum.index
+    diffs = ['+{}'.format(diff) if diff > 0 else str(diff) for diff in (df_cd_sum - df_oag_sum)]
+
+    fig, ax = plt.subplots(1, 1, figsize=figsize)
+    df_oag_cd_sum.plot.bar(width=0.75, color=colors, ax=ax, rot=0, legend=False)
+    ax.set_xticklabels(years, fontsize=fontsize)
+    ax.set(title=title)
+
+    # annotating
+    for i, p in enumerate(ax.patches):
+        width, height = p.get_width(), p.get_height()
+        x, y = p.get_xy()
+        if i < len(years):
+            ax.text(x+width/2, y+height/2, '{:.0f}'.format(height), color='white', fontsize=fontsize,
+                    horizontalalignment='center', verticalalignment='center')
+        else:
+            ax.text(x+width/2, y+height/2, '{:.0f}\n({})'.format(height, diffs[i-len(years)]),
+                    color='white', fontsize=fontsize,
+                    horizontalalignment='center', verticalalignment='center')
+
+    fig.legend(['OAG', 'TJI'], ncol=2, bbox_to_anchor=bbox_to_anchor, fontsize=fontsize)
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname)
+
+
+def plot_bar_severity_year(df, colors, figsize=(8, 4), fontsize=10, fname=None):
+
+    """
+    Create bar plots of the no. civilians shot by severity and year (A)
+    and the survival rate by year (B)
+    :param pd.DataFrame df: civilian dataset
+    :param list colors: colors of death and injury
+    :param tuple figsize:
+    :param int fontsize:
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    df_cd_year_died = df.groupby(['year', 'civilian_died'])['date_incident'].count().unstack()
+    df_cd_year_died_pct = pct(df_cd_year_died, 1)
+
+    fig, axes = plt.subplots(1, 2, figsize=figsize)
+    df_cd_year_died.plot.bar(color=colors, legend=False, rot=0, ylim=(0, 120), width=0.75,
+                             ax=axes[0])
+    annotate(axes[0], 'v', fontsize=fontsize)
+    axes[0].set(title='A. No. Civilians Shot by Severity'.upper(), xlabel='')
+    axes[0].legend(loc='upper left')
+
+    df_cd_year_died_pct['INJURY'].plot.bar(color=colors[1], legend=False, rot=0, ylim=(0, 70),
+                                           ax=axes[1], width=0.75)
+    annotate(axes[1], 'v', unit='percent', fontsize=fontsize)
+    axes[1].set(title='B. Civilian Survival Rate (%)'.upper(), xlabel='')
+    axes[1].set_xticklabels(df_cd_year_died.index, fontsize=fontsize)
+
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname)
+
+
+def plot_bar_survival_rate(df_cd, df_os, colors, n_county=5, figsize=(8, 4), fontsize=10,
+                           bbox_to_anchor=(1.1, 1), fname=None):
+
+    """
+    Create bar plots of the survival rate (%) of civilians and officers by year (A)
+    and by county (B, top N counties)
+    :param pd.DataFrame df_cd: civilian dataset
+    :param pd.DataFrame df_os: officer dataset
+    :param list colors: colors of civilians and officers
+    :param int n_county: no. counties
+    :param tuple figsize:
+    :param int fontsize:
+    :param tuple bbox_to_anchor: location of figure legend
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    civilian_survival_rate_by_year = pct(df_cd.groupby(['civilian_died', 'year'])['date_incident']
+                                         .count().unstack(), 0).loc['INJURY']
+    officer_survival_rate_by_year = pct(df_os.groupby(['officer_harm', 'year'])['date_incident']
+                                        .count().unstack(), 0).loc['INJURY']
+    survival_rate_by_year = pd.concat([civilian_survival_rate_by_year,
+                                       officer_survival_rate_by_year], axis=1)
+    survival_rate_by_year.columns = ['Civilian', 'Officer']
+
+    fig, axes = plt.subplots(1, 2, figsize=figsize, sharey=True)
+
+    survival_rate_by_year.plot.bar(ax=axes[0], rot=0, legend=False, color=colors, width=0.75)
+    annotate(axes[0], 'v')
+    axes[0].set(ylim=(0, 100), xlabel=None, ylabel=None)
+    axes[0].set_xticklabels(survival_rate_by_year.index, fontsize=fontsize)
+
+    topN = df_cd['incident_county'].value_counts()[:n_county].index
+    temp_cd = df_cd.groupby(['civilian_died', 'incident_county'])['date_incident'].count() \
+        .unstack().loc[:, topN].T
+    temp_os = df_os.groupby(['officer_harm', 'incident_county'])['date_incident'].count() \
+        .unstack().loc[:, topN].T
+    survival_rate_top5 = pd.concat([temp_cd['INJURY']/temp_cd.sum(axis=1)*100,
+                                    temp_os['INJURY']/temp_os.sum(axis=1)*100], axis=1)
+    survival_rate_top5.columns = ['Civilian', 'Officer']
+    survival_rate_top5.plot.bar(rot=0, width=0.75, ax=axes[1], color=colors, legend=False)
+    annotate(axes[1], 'v')
+
+    axes[0].set_title('A. Survival Rate (%) by Year'.upper())
+    axes[1].set_title('B. Survival Rate (%) by Counties'.upper())
+
+    fig.legend(['Civilian', 'Officer'], ncol=1, bbox_to_anchor=bbox_to_anchor, fontsize=fontsize)
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname)
+
+
+def plot_bar_race_severity_year(df, years, colors, title, n_county=None, figsize=(14, 5),
+                                fontsize=10, bbox_to_anchor=(1.1, 1), fname=None):
+
+    """
+    Create stacked bar plots of the no. civilians shot by race and severity for each year
+    :param pd.DataFrame df: civilian dataset
+    :param list or np.array years: years (subplots)
+    :param list colors: colors of death and injury
+    :param str title: figure title
+    :param int n_county: no. counties with most incidents to select (None: all counties)
+    :param tuple figsize:
+    :param int fontsize:
+    :param tuple bbox_to_anchor: location of figure legend
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    if n_county is not None:
+        topN = df['incident_county'].value_counts()[:n_county].index.values
+        df = df.loc[df['incident_county'].isin(topN), :]
+    df_race_survival_year = df.groupby(['civilian_race', 'civilian_died', 'year'])['date_incident'] \
+        .count().unstack().fillna(0)
+
+    fig, axes = plt.subplots(1, len(years), figsize=figsize, sharey=True)
+    for i, (year, ax) in enumerate(zip(years, axes)):
+        df_race_survival_year[year].unstack().loc[race_list, :].plot.bar(
+            stacked=True, color=colors, legend=False, width=0.75, rot=0, ax=ax)
+        annotate(ax, 'v', fontsize=fontsize)
+        if n_county is None:
+            n = (df['year'] == year).sum()
+        else:
+            n = df_race_survival_year[year].sum().astype(int)
+        ax.set(xlabel='', title='{} ({})'.format(year, n))
+
+    fig.suptitle(title, x=0.5, y=1.05)
+    fig.legend(['DEATH', 'INJURY'], ncol=1, bbox_to_anchor=bbox_to_anchor, fontsize=fontsize)
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname)
+
+
+def plot_barh_county_year(df, years, colors, title, figsize=(6, 4), fontsize=10,
+                          bbox_to_anchor=(1.2, 0.5), fname=None):
+
+    """
+    Create a horizontal stacked bar plot of the no. incidents by county and year
+    (all counties in the data, e.g., a subgroup of civilians)
+    :param pd.DataFrame df: civilian dataset
+    :param list or np.array years: years of the legend
+    :param list colors: colors of the years
+    :param str title: figure title
+    :param tuple figsize:
+    :param int fontsize:
+    :param tuple bbox_to_anchor: location of figure legend
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    inds_in_order = df['incident_county'].value_counts().index
+    df_count = df.groupby(['incident_county', 'year'])['date_incident'].count().unstack().fillna(0)
+
+    fig, ax = plt.subplots(1, 1, figsize=figsize)
+    df_count.loc[inds_in_order[::-1], :].plot.barh(stacked=True, color=colors, width=0.75, ax=ax,
+                                                   legend=False)
+    annotate(ax, 'h', threshold=0)
+    ax.set_title(title, fontsize=fontsize)
+
+    fig.tight_layout()
+    fig.legend(years, ncol=1, bbox_to_anchor=bbox_to_anchor, fontsize=fontsize)
+    if fname is not None:
+        export_figure(fig, fname)
+
+
+def plot_box_age_race_year(df, years, figsize=(14, 4), ylim=(0, 80), fontsize=10, fname=None):
+
+    """
+    Create box plots of the age of civilians by race for each year
+    :param pd.DataFrame df: civilian dataset
+    :param list or np.array years: years (subplots)
+    :param tuple figsize:
+    :param tuple ylim: y axis range
+    :param int fontsize:
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    fig, axes = plt.subplots(1, len(years), figsize=figsize, sharey=True)
+    for i, (year, ax) in enumerate(zip(years, axes)):
+
+        df_temp = df[df['year'] == year]
+        ax = sns.boxplot(x='civilian_race', y='civilian_age', data=df_temp, order=race_list, ax=ax)
+        ax.set(ylim=ylim)
+        if i == 0:
+            ax.set_ylabel('Age at Death', fontsize=fontsize)
+        else:
+            ax.set_ylabel(None)
+        ax.set_xlabel(None)
+        ax.set_xticklabels(race_list, fontsize=fontsize)
+        ax.set_title(year, fontsize=fontsize)
+
+        # boxes are artists in older seaborn/matplotlib versions and patches in newer ones
+        boxes = ax.artists if len(ax.artists) > 0 else ax.patches
+        for box, col in zip(boxes, cols_race):
+            box.set_facecolor(col)
+
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname, bbox_inches=None)
+
+
+def plot_line_cause_year_severity(df, causes, years, colors, figsize=(8, 4.5), fontsize=10,
+                                  bbox_to_anchor=(0.9, 0, 0.5, 0.9), fname=None):
+
+    """
+    Create line plots of the incident causes by year for civilians killed (A) and injured (B)
+    :param pd.DataFrame df: civilian dataset
+    :param list causes: incident cause columns (in the order to show)
+    :param list or np.array years: years on the x axis
+    :param list colors: colors of the incident causes
+    :param tuple figsize:
+    :param int fontsize:
+    :param tuple bbox_to_anchor: location of figure legend
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    fig, axes = plt.subplots(1, 2, figsize=figsize, sharey=True)
+    for ax, died, title in zip(axes, [True, False], ['A. Civilians killed', 'B. Civilians injured']):
+        df[df['died'] == died].groupby('year')[causes].sum().plot(
+            kind='line', color=colors, ax=ax, marker='o', lw=2, legend=False)
+        ax.set(xlabel='', xticks=years, xticklabels=years)
+        ax.set_title(title.upper(), fontsize=fontsize)
+
+    fig.suptitle('Incident Causes by Severity'.upper(), fontsize=fontsize, x=0.5, y=1.03)
+    fig.legend(causes, ncol=1, bbox_to_anchor=bbox_to_anchor, fontsize=fontsize)
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname)
+
+
+def plot_barh_race_cause(df, causes, title, figsize=(11, 3), fontsize=10,
+                         bbox_to_anchor=(0.81, 0.09), fname=None):
+
+    """
+    Create a horizontal stacked bar plot of the race composition (%) by incident cause
+    :param pd.DataFrame df: civilian dataset
+    :param list causes: incident cause columns (in the order to show)
+    :param str title: figure title
+    :param tuple figsize:
+    :param int fontsize:
+    :param tuple bbox_to_anchor: location of figure legend
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    df_incident_race = df.groupby('civilian_race')[causes].sum().loc[race_list, causes]
+    df_incident_race_pct = pct(df_incident_race, 0)
+
+    fig, ax = plt.subplots(1, 1, figsize=figsize)
+    df_incident_race_pct.T[::-1].plot(kind='barh', stacked=True, ax=ax, legend=False, width=0.75,
+                                      color=cols_race)
+    annotate(ax, 'h', 'percent', fontsize=fontsize)
+    ax.set_yticklabels([s + ' ({})'.format(n) for s, n in zip(df_incident_race.columns,
+                                                              df_incident_race.sum(axis=0).values)][::-1],
+                       fontsize=fontsize)
+    fig.legend(race_list, ncol=4, bbox_to_anchor=bbox_to_anchor, fontsize=fontsize)
+
+    fig.suptitle(title, fontsize=fontsize, x=0.6, y=1.03)
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname)
+
+
+def plot_barh_delay_year(df, years, color, figsize=(15, 3.5), xlim=(0, 70), fontsize=10,
+                         fname=None):
+
+    """
+    Create horizontal bar plots of the no. incidents by report delay for each year
+    :param pd.DataFrame df: civilian dataset
+    :param list or np.array years: years (subplots)
+    :param str or list color: bar color
+    :param tuple figsize:
+    :param tuple xlim: x axis range
+    :param int fontsize:
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    df_delay_year = df[(df['delay_bin_label'] != -1) & (df['year'].isin(years))] \
+        .groupby(['delay_bin_label', 'year'])['date_incident'].count().unstack().fillna(0)
+
+    fig, axes = plt.subplots(1, len(years), figsize=figsize, sharey=True)
+    for i, (year, ax) in enumerate(zip(years, axes)):
+
+        df_delay_year[year].plot(kind='barh', color=color, ax=ax, legend=False, width=0.75)
+        ax.set(xlim=xlim, ylabel='')
+        ax.set_title(year, fontsize=fontsize)
+        if i == 1:
+            ax.set(xlabel='No. Incidents')
+        else:
+            ax.set_xlabel(None)
+        ax.set_yticklabels(report_delay_days_binnames, fontsize=fontsize)
+        annotate(ax, 'h', fontsize=fontsize)
+
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname, bbox_inches=None)
+
+
+def plot_barh_delay_county(df, colors, n_county=5, delay_days=30, figsize=(7, 3), fontsize=10,
+                           bbox_to_anchor=(0.75, 0, 0.5, 0.9), fname=None):
+
+    """
+    Create a horizontal stacked bar plot of the incidents with and without report delay
+    for the counties with most delayed reports
+    :param pd.DataFrame df: civilian dataset
+    :param list colors: colors of the delayed and the other reports
+    :param int n_county: no. counties
+    :param int delay_days: reports later than this no. days are delayed
+    :param tuple figsize:
+    :param int fontsize:
+    :param tuple bbox_to_anchor: location of figure legend
+    :param str fname: path name for saving (if not None, it saves)
+    """
+
+    df = df.assign(delayed_reports=df['delay_days'] > delay_days)
+    top_locs_delays = df[df['delayed_reports']].groupby(['incident_county'])['date_incident'] \
+        .count().sort_values(ascending=False)[:n_county].index
+
+    fig, ax = plt.subplots(1, 1, figsize=figsize)
+    df_top_delays = df[df['incident_county'].isin(top_locs_delays)] \
+        .groupby(['incident_county', 'delayed_reports'])['date_incident'].count().unstack()
+    df_top_delays.loc[top_locs_delays, [True, False]][::-1].plot.barh(stacked=True, legend=False, rot=0,
+                                                              color=colors, ax=ax, width=0.75)
+
+    medians = df.groupby('incident_county')['delay_days'].median().loc[top_locs_delays]
+    yticklabels = ['{} ({:.0f} Days)'.format(city, median) for city, median in medians.items()]
+
+    ax.set(xlabel='No. Incidents', ylabel='', yticklabels=yticklabels[::-1])
+    ax.set_title('incidents with report delay (top {} counties)'.format(n_county).upper(),
+                 fontsize=fontsize)
+    annotate(ax, 'h', fontsize=fontsize)
+
+    fig.legend(['More than {} days'.format(delay_days), 'Less than {} days'.format(delay_days)],
+               bbox_to_anchor=bbox_to_anchor, fontsize=fontsize)
+    fig.tight_layout()
+    if fname is not None:
+        export_figure(fig, fname)
@@ -1,12 +1,28 @@
 import pandas as pd
 import numpy as np
+from dedup import find_exact_duplicates, KeyIndex
+import instrument
+from taxonomy import Taxonomy, encode_taxonomies, cause_taxonomy, weapon_taxonomy, call_taxonomy
 
 incident_causes_list = ['Traffic Stop', 'Emergency/Request for Assistance', 
                         'Execution of a Warrant', 'Hostage/Barricade/Other Emergency', 'Other']
-age_names = ['1-4' '5-14' '15-24' '25-34' '35-44' '45-54' '55-64' '65-74' '75+']
+# names of the civilian_age_binned codes (the last code, len(age_bins), is a missing age)
+age_names = ['1-4', '5-14', '15-24', '25-34', '35-44', '45-54', '55-64', '65-74', '75+']
+# bin edges of civilian_age_binned (np.digitize)
+age_bins = [5, 15, 25, 35, 45, 55, 65, 75, 100]
 # report delay
 report_delay_days_bins = [0, 7, 14, 30, 60, 90, 180, 360, 720]
 report_delay_days_binnames = ['Same Day'] + ['{} to {} Days'.format(report_delay_days_bins[i]+1, report_delay_days_bins[i+1]) for i in range(len(report_delay_days_bins)-1)] + ['More than 720 Days']
+# columns that Preprocess needs (the minimum usecols for reading the raw csv)
+civilian_cols_required = ['date_incident', 'date_ag_received', 'incident_county',
+                          'incident_result_of', 'civilian_name_full', 'civilian_age',
+                          'civilian_died']
+officer_cols_required = ['date_incident', 'date_ag_received', 'incident_county', 'officer_harm']
+# columns that identify an individual (see Preprocess.remove_duplicates)
+duplicate_key_cols = ['civilian_name_full', 'date_incident']
+# prefixes of the numbered columns (e.g., officer_age_1, ..., officer_age_11) that are moved
+# to the long child table (one row per officer/agency, see to_long_format)
+wide_col_prefixes = {'civilian': ['officer_', 'agency_'], 'officer': ['agency_']}
 
 def convert_date_cols(df, col_date='date'):
 
@@ -35,9 +51,8 @@ def get_duplicates_from_cols(df, cols_to_use, what_to_keep='first'):
     :return:
     """
 
-    # drop na to avoid confusion
-    df_non_na = df[cols_to_use].dropna().copy()
-    inds_duplicates_to_drop = df_non_na[df_non_na[cols_to_use].duplicated(keep=what_to_keep)].index
+    # rows with na are never duplicates to avoid confusion (see dedup.find_exact_duplicates)
+    inds_duplicates_to_drop = find_exact_duplicates(df, cols_to_use, keep=what_to_keep)
     df_duplicates = df.loc[inds_duplicates_to_drop, cols_to_use]
     df_unique = df.drop(index=inds_duplicates_to_drop)
 
@@ -105,6 +120,43 @@ def pct(df, axis):
         return df.apply(lambda x: x/df.sum(axis=axis), axis=1)*100
 
 
+def get_agency_index(df, agency_names):
+
+    """
+    Melt the agency name columns into a long table (one row per non-empty agency name)
+    with the agency names as categorical (categories in the order of first appearance)
+    :param pd.DataFrame df: officer or civilian dataset
+    :param list or np.array agency_names: list of columns that have agency names,
+    e.g., 'agency_name_1'
+    :return: dataframe of year, agency_name and position (order in the flattened agency columns)
+    """
+
+    names = df[agency_names].values.ravel()
+    years = np.repeat(df['year'].values, len(agency_names))
+    is_valid = ~pd.isnull(names)
+    codes, uniques = pd.factorize(names[is_valid])
+    df_agency = pd.DataFrame({
+        'year': years[is_valid],
+        'agency_name': pd.Categorical.from_codes(codes, categories=uniques),
+        'position': np.arange(codes.shape[0]),
+    })
+    return df_agency
+
+
+def classify_agency_names(agency_names):
+
+    """
+    Categorize agency names based on substring (police, sheriff, and others)
+    A name can be both police and sheriff
+    :param pd.Index agency_names: distinct agency names
+    :return: dict of agency type and boolean array
+    """
+
+    is_police = agency_names.str.contains('POLICE', regex=False)
+    is_sheriff = agency_names.str.contains('SHER', regex=False)
+    return {'police': is_police, 'sheriff': is_sheriff, 'other': ~is_police & ~is_sheriff}
+
+
 def count_agencies_by_year_type(df, agency_names, N=5):
 
     """
@@ -117,39 +169,39 @@ def count_agencies_by_year_type(df, agency_names, N=5):
     :return:
     """
 
-    # select the agency names and remove empty values
-    df_agency_names = df[agency_names].values.ravel()
-    df_agency_names = df_agency_names[~pd.isnull(df_agency_names)]
+    # melt the agency names once and categorize each distinct name once
+    df_agency = get_agency_index(df, agency_names)
+    categories = df_agency['agency_name'].cat.categories
+    dict_agency_types = classify_agency_names(categories)
+
+    # count each agency name by year (and overall) in a single aggregation;
+    # the first position keeps the order of appearance that value_counts uses for ties
+    df_counts = df_agency.groupby(['year', 'agency_name'], observed=True)['position'].agg(
+        ['size', 'min']).reset_index().sort_values('min')
+    counts_all = np.bincount(df_agency['agency_name'].cat.codes.values,
+                             minlength=len(categories))
 
-    # categorize agency names based on substring
-    dict_agency_names_all = dict()
-    dict_agency_names_all['police'] = [s for s in df_agency_names if 'POLICE' in s]
-    dict_agency_names_all['sheriff'] = [s for s in df_agency_names if 'SHER' in s]
-    dict_agency_names_all['other'] = [s for s in df_agency_names
-                                      if 'POLICE' not in s and 'SHER' not in s]
     # select the top N agencies
     dict_agency_topN = dict()
-    for key, val in dict_agency_names_all.items():
-        dict_agency_topN[key] = pd.Series(val).value_counts()[:N].index
+    for key, is_type in dict_agency_types.items():
+        dict_agency_topN[key] = pd.Series(counts_all[is_type], index=categories[is_type]) \
+            .sort_values(ascending=False, kind='stable')[:N].index
 
     # count the agency names by year and focus on the top N agencies
     years = sorted(df['year'].unique())
     df_agency_count = dict()
     for year in years:
-        df_year = df[df['year']==year]
-        df_agency_names = df_year[agency_names].values.ravel()
-        df_agency_names = df_agency_names[pd.isnull(df_agency_names) == False]
-
-        dict_agency_names = dict()
-        dict_agency_names['police'] = [s for s in df_agency_names if 'POLICE' in s]
-        dict_agency_names['sheriff'] = [s for s in df_agency_names if 'SHER' in s]
-        dict_agency_names['other'] = [s for s in df_agency_names if 'POLICE' not in s and 'SHER' not in s]
+        df_counts_year = df_counts[df_counts['year'] == year]
+        codes_year = df_counts_year['agency_name'].cat.codes.values
 
         dict_results = dict()
-        for key, val in dict_agency_names.items():
-            temp = pd.Series(val).value_counts()
+        for key, is_type in dict_agency_types.items():
+            df_counts_type = df_counts_year[is_type[codes_year]]
+            temp = pd.Series(df_counts_type['size'].values.astype(np.int64),
+                             index=pd.Index(df_counts_type['agency_name'].astype(object).values)) \
+                .sort_values(ascending=False, kind='stable')
             temp_topN = temp[temp.index.isin(dict_agency_topN[key])]
-            dict_results['n_' + key] = len(np.unique(dict_agency_names[key]))
+            dict_results['n_' + key] = df_counts_type.shape[0]
             dict_results[key + '_top'] = temp_topN
 
         df_agency_count[year] = dict_results
@@ -157,12 +209,12 @@ def count_agencies_by_year_type(df, agency_names, N=5):
 
     # Using this information, create a dataframe for plotting
     df_agency_count_plot = dict()
-    for key in dict_agency_names.keys(): # agency types
+    for key in dict_agency_types.keys(): # agency types
         temp = pd.concat(df_agency_count[key + '_top'].values, axis=1).fillna(0).T
         temp.index = years
-        if key is 'police':
+        if key == 'police':
             temp.columns = [s.split('POLICE')[0].strip() for s in temp.columns]
-        elif key is 'sheriff':
+        elif key == 'sheriff':
             temp.columns = [s.split('SHER')[0].strip() for s in temp.columns]
         df_agency_count_plot[key] = temp
 
@@ -182,19 +234,209 @@ def clean_incident_causes(s):
     else:
         raise ValueError('Double check the string from incident causes.')
 
+
+def encode_incident_causes(incident_result_of):
+
+    """
+    Encode the incident causes (';' separated strings) as indicator columns
+    with the cause taxonomy (same priorities as clean_incident_causes).
+    Each distinct string is split and classified only once into a small lookup table
+    (distinct strings x incident_causes_list), which is then broadcast to the rows
+    through the factorized codes. Missing values get all-zero rows.
+    :param pd.Series incident_result_of: raw incident cause strings
+    :return: dataframe with incident_causes_list as columns (uint8 counts per row)
+    """
+
+    df_causes = Taxonomy.from_dict(cause_taxonomy).encode(
+        incident_result_of.to_frame(cause_taxonomy['columns'][0]))
+    return df_causes[incident_causes_list]
+
+
+def read_csv_in_chunks(fname, years, usecols=None, chunksize=10000):
+
+    """
+    Read a raw csv in chunks and keep only the rows of the given years,
+    so that the rows of other years are never held in memory
+    :param str fname: raw csv file
+    :param list years: years to select (year of date_incident)
+    :param list usecols: columns to read (if None, all columns)
+    :param int chunksize: no. rows to read at once
+    :return: generator of dataframes
+    """
+
+    for chunk in pd.read_csv(fname, usecols=usecols, chunksize=chunksize):
+        year = pd.to_datetime(chunk['date_incident']).dt.year
+        chunk = chunk.loc[year.isin(years).values]
+        if chunk.shape[0] > 0:
+            yield chunk
+
+
+def get_wide_cols(df, prefixes):
+
+    """
+    Find the numbered columns with the given prefixes (e.g., officer_age_1, agency_name_11)
+    :param pd.DataFrame df:
+    :param list prefixes: column prefixes, e.g., ['officer_', 'agency_']
+    :return: dict of column stem (e.g., 'officer_age') and dict of slot number and column name
+    """
+
+    wide_cols = dict()
+    for col in df.columns:
+        stem, _, slot = col.rpartition('_')
+        if slot.isdigit() and any(col.startswith(s) for s in prefixes):
+            wide_cols.setdefault(stem, dict())[int(slot)] = col
+    return wide_cols
+
+
+def to_long_format(df, prefixes, id_col='incident_id'):
+
+    """
+    Split a dataset with numbered columns (officer_age_1, ..., agency_name_11) into a slim
+    incident table and a long child table with one row per non-empty slot
+    (i.e., officer and agency) keyed by the incident id (index of the incident table).
+    The rows of the child table are in the order of the incidents and then the slots,
+    and the string columns are categorical.
+    :param pd.DataFrame df: civilian or officer dataset
+    :param list prefixes: column prefixes, e.g., ['officer_', 'agency_']
+    :param str id_col: name of the incident id column of the child table
+    :return: (incident dataframe, long dataframe of id_col, slot and the column stems)
+    """
+
+    wide_cols = get_wide_cols(df, prefixes)
+    slots = np.array(sorted(set(slot for cols in wide_cols.values() for slot in cols)),
+                     dtype=np.int8)
+    n_slots = slots.shape[0]
+
+    # (incident x slot) array of each stem, flattened in the order of the incidents
+    values = dict()
+    for stem, cols in wide_cols.items():
+        dtype = df[next(iter(cols.values()))].dtype
+        df_stem = pd.DataFrame({slot: df[cols[slot]] if slot in cols else
+                                pd.Series(index=df.index, dtype=dtype) for slot in slots})
+        values[stem] = pd.Series(df_stem.values.ravel()).infer_objects()
+    is_valid = np.zeros(df.shape[0]*n_slots, dtype=bool)
+    for s in values.values():
+        is_valid |= s.notna().values
+
+    df_long = pd.DataFrame({
+        id_col: np.repeat(df.index.values, n_slots)[is_valid],
+        'slot': np.tile(slots, df.shape[0])[is_valid],
+    })
+    for stem, s in values.items():
+        s = s[is_valid].reset_index(drop=True)
+        # object or string dtype (pandas >= 3 infers str columns)
+        is_string = pd.api.types.is_string_dtype(s) or s.dtype == object
+        df_long[stem] = s.astype('category') if is_string else s
+
+    cols_wide = [col for cols in wide_cols.values() for col in cols.values()]
+    return df.drop(columns=cols_wide), df_long
+
+
+def from_long_format(df_incident, df_long, id_col='incident_id'):
+
+    """
+    Put the long child table back to the numbered columns (inverse of to_long_format)
+    for the code that uses the wide columns, e.g., agency_name_1, ..., agency_name_11
+    :param pd.DataFrame df_incident: incident table
+    :param pd.DataFrame df_long: long child table
+    :param str id_col: name of the incident id column of the child table
+    :return: dataframe with the numbered columns appended
+    """
+
+    stems = [col for col in df_long.columns if col not in [id_col, 'slot']]
+    df_wide = dict()
+    for stem in stems:
+        s = df_long[stem]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            s = s.astype(object)
+        df_stem = pd.Series(s.values, index=[df_long[id_col], df_long['slot']]).unstack('slot')
+        for slot in df_stem.columns:
+            df_wide['{}_{}'.format(stem, slot)] = df_stem[slot].reindex(df_incident.index)
+    return pd.concat([df_incident, pd.DataFrame(df_wide, index=df_incident.index)], axis=1)
+
+
 class Preprocess:
 
     def __init__(
         self, 
         df,
         correct_county_names,
-        years = [2016, 2017, 2018, 2019, 2020]
+        years = [2016, 2017, 2018, 2019, 2020],
+        seen_keys = None,
+        county_canonicalizer = None,
+        agency_canonicalizer = None
         ):
 
+        """
+        :param pd.DataFrame df: raw civilian or officer dataset
+        :param list or pd.Index correct_county_names: county names used for the name check
+        :param list years: years to select
+        :param dedup.KeyIndex seen_keys: index of the duplicate keys (civilian_name_full,
+        date_incident) of the rows already processed, e.g., in previous chunks
+        (see get_data_in_chunks). It is updated by remove_duplicates.
+        :param canonicalize.Canonicalizer county_canonicalizer: if given, the county names are
+        replaced by their canonical names first (see canonicalize.get_county_canonicalizer)
+        :param canonicalize.Canonicalizer agency_canonicalizer: if given, the agency names are
+        replaced by their canonical names (see canonicalize.get_agency_canonicalizer)
+        """
+
         self.df = df
         self.correct_county_names = correct_county_names
         self.years = years
-
+        self.seen_keys = seen_keys
+        self.county_canonicalizer = county_canonicalizer
+        self.agency_canonicalizer = agency_canonicalizer
+
+    @classmethod
+    def get_data_in_chunks(cls, fname, correct_county_names, data_type='civilian',
+                           years=[2016, 2017, 2018, 2019, 2020], usecols=None, chunksize=10000,
+                           county_canonicalizer=None, agency_canonicalizer=None):
+
+        """
+        Preprocess a raw csv chunk by chunk (streaming mode). Only the needed columns are read,
+        rows are filtered by year while reading, and duplicates are removed across chunks.
+        The result is the same as get_civilian_data/get_officer_data on the whole csv
+        (restricted to usecols).
+        :param str fname: raw csv file
+        :param list or pd.Index correct_county_names: county names used for the name check
+        :param str data_type: 'civilian' or 'officer'
+        :param list years: years to select
+        :param list usecols: columns to keep in addition to the ones Preprocess needs
+        (if None, all columns)
+        :param int chunksize: no. rows to read at once
+        :param canonicalize.Canonicalizer county_canonicalizer: see __init__
+        :param canonicalize.Canonicalizer agency_canonicalizer: see __init__
+        :return: preprocessed dataframe (empty with the preprocessed columns if no row is
+        in years)
+        """
+
+        if data_type == 'civilian':
+            cols_required = civilian_cols_required
+        elif data_type == 'officer':
+            cols_required = officer_cols_required
+        else:
+            raise ValueError('data_type should be "civilian" or "officer"')
+        if usecols is not None:
+            usecols = list(dict.fromkeys(cols_required + list(usecols)))
+
+        def preprocess(chunk):
+            preprocessor = cls(chunk, correct_county_names, years=years, seen_keys=seen_keys,
+                               county_canonicalizer=county_canonicalizer,
+                               agency_canonicalizer=agency_canonicalizer)
+            if data_type == 'civilian':
+                return preprocessor.get_civilian_data()
+            return preprocessor.get_officer_data()
+
+        seen_keys = KeyIndex(duplicate_key_cols)
+        dfs = [preprocess(chunk) for chunk in read_csv_in_chunks(fname, years, usecols=usecols,
+                                                                 chunksize=chunksize)]
+        if len(dfs) == 0:
+            # no row in years: preprocess the empty first chunk to get the columns
+            return preprocess(pd.read_csv(fname, usecols=usecols, nrows=chunksize).iloc[:0])
+
+        return pd.concat(dfs, axis=0)
+
+    @instrument.step_method
     def add_date_cols(self):
         self.df = convert_date_cols(self.df, 'date')
         self.df.loc[:, 'year'] = self.df['date_incident'].dt.year.values
@@ -202,41 +444,68 @@ class Preprocess:
 
         return self.df
 
+    @instrument.step_method
     def select_rows_by_year(self):
         self.df = self.df.loc[self.df['year'].isin(self.years)]
 
+    @instrument.step_method
+    def canonicalize_names(self):
+        # distinct names are resolved once and the columns are remapped through categorical
+        # codes: incident_county is stored back as strings (as in the raw data) and the agency
+        # columns as categoricals; rows whose county is not kept (e.g., QUAY (NM)) are removed
+        if self.county_canonicalizer is not None:
+            counties = self.county_canonicalizer.remap(self.df['incident_county'])
+            is_dropped = pd.isnull(counties) & self.df['incident_county'].notnull().values
+            self.df = self.df.loc[~is_dropped].copy()
+            self.df['incident_county'] = np.asarray(counties, dtype=object)[~is_dropped]
+        if self.agency_canonicalizer is not None:
+            agency_cols = list(get_wide_cols(self.df, ['agency_name_']).get('agency_name',
+                                                                            dict()).values())
+            if len(agency_cols) > 0:
+                self.df[agency_cols] = self.agency_canonicalizer.remap_cols(self.df, agency_cols)
+
+    @instrument.step_method
     def check_county_names(self):
         non_existent_counties = set(self.df['incident_county']) - set(self.correct_county_names)
         if len(non_existent_counties) > 0:
             raise ValueError("Incorrect county names exist: {}".format(non_existent_counties))
 
+    @instrument.step_method
     def remove_duplicates(self):
-        df_civilian_unique, _ = get_duplicates_from_cols(
-            self.df,
-            ['civilian_name_full', 'date_incident'], 
-            what_to_keep='first'
-            )
+        if self.seen_keys is None:
+            df_civilian_unique, _ = get_duplicates_from_cols(self.df, duplicate_key_cols,
+                                                             what_to_keep='first')
+        else:
+            # also drop the rows whose key was already seen (e.g., in previous chunks)
+            df_civilian_unique = self.df.drop(index=self.seen_keys.add(self.df))
+
         self.df = df_civilian_unique
 
+    @instrument.step_method
     def add_death_indicator_col(self, death_injury_col_name):
         self.df['died'] = self.df[death_injury_col_name]=='DEATH'
 
+    @instrument.step_method
     def clean_incident_cause_str(self):
         self.df.loc[self.df['incident_result_of']=='EMERGENCY', 'incident_result_of'] = 'EMERGENCY CALL OR REQUEST FOR ASSISTANCE'
         self.df.loc[self.df['incident_result_of']=='EMERGENCY CALL OR REQUEST FOR ASSISTANCE, TRAFFIC STOP', 'incident_result_of'] = \
             'EMERGENCY CALL OR REQUEST FOR ASSISTANCE; TRAFFIC STOP'
         self.df['incident_result_of'] = self.df['incident_result_of'].str.strip()
 
-        df_causes_list = self.df['incident_result_of'].str.split(';')
-        df_causes_list_clean = df_causes_list.apply(lambda x: [clean_incident_causes(s) for s in x]).apply(pd.Series)
-        df_causes_list_clean_separated = df_causes_list_clean.stack().str.get_dummies().sum(level=0)[incident_causes_list]
+        df_causes = encode_incident_causes(self.df['incident_result_of'])
+        self.df = pd.concat([self.df, df_causes], axis=1)
 
-        self.df = pd.concat([self.df, df_causes_list_clean_separated], axis=1)
+    @instrument.step_method
+    def add_weapon_call_indicators(self):
+        df_indicators = encode_taxonomies(self.df, {'weapon': weapon_taxonomy,
+                                                    'call': call_taxonomy})
+        self.df = pd.concat([self.df, df_indicators], axis=1)
 
+    @instrument.step_method
     def add_age_groups(self):
-        bins = [5, 15, 25, 35, 45, 55, 65, 75, 100]
-        self.df['civilian_age_binned'] = np.digitize(self.df['civilian_age'], bins)
+        self.df['civilian_age_binned'] = np.digitize(self.df['civilian_age'], age_bins)
 
+    @instrument.step_method
     def compute_report_delay(self):
         self.df.loc[:, 'delay_days'] = (self.df['date_ag_received'] - self.df['date_incident']).dt.days
         self.df.loc[self.df['delay_days']<0, 'delay_days'] = np.nan
@@ -249,19 +518,24 @@ class Preprocess:
 
         self.df.loc[:, 'delay_bin_label'] = delay_bins
 
+    @instrument.step_method
     def get_civilian_data(self):
+        self.canonicalize_names()
         self.check_county_names()
         self.add_date_cols()
         self.select_rows_by_year()
         self.remove_duplicates()
         self.add_death_indicator_col(death_injury_col_name='civilian_died')
         self.clean_incident_cause_str()
+        self.add_weapon_call_indicators()
         self.add_age_groups()
         self.compute_report_delay()
 
         return self.df
 
+    @instrument.step_method
     def get_officer_data(self):
+        self.canonicalize_names()
         self.check_county_names()
         self.add_date_cols()
         self.select_rows_by_year()
@@ -269,4 +543,23 @@ class Preprocess:
         self.compute_report_delay()
 
         return self.df
-        
\ No newline at end of file
+
+    def get_civilian_tables(self):
+
+        """
+        Preprocess the civilian dataset and split it into a slim incident table and a long
+        officer/agency table (see to_long_format)
+        :return: (incident dataframe, officer/agency dataframe keyed by incident_id)
+        """
+
+        return to_long_format(self.get_civilian_data(), wide_col_prefixes['civilian'])
+
+    def get_officer_tables(self):
+
+        """
+        Preprocess the officer dataset and split it into a slim incident table and a long
+        agency table (see to_long_format)
+        :return: (incident dataframe, agency dataframe keyed by incident_id)
+        """
+
+        return to_long_format(self.get_officer_data(), wide_col_prefixes['officer'])
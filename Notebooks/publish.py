@@ -0,0 +1,224 @@
+import io
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from preprocess import incident_causes_list, report_delay_days_binnames, age_names
+
+# dims of the statewide cube of each dataset (one row per non-empty cell)
+cube_dims = {
+    'civilian': ['year', 'incident_county', 'civilian_race', 'civilian_gender',
+                 'civilian_age_binned', 'died', 'delay_bin_label'],
+    'officer': ['year', 'incident_county', 'officer_race', 'officer_gender', 'died',
+                'delay_bin_label'],
+}
+tiles_dir_default = 'Data/Tiles'
+statewide_name = 'TEXAS'
+
+
+def get_cube_table(df, data_type='civilian', dims=None):
+
+    """
+    Statewide count cube of a preprocessed dataset as a long table: no. incidents
+    (and incident cause indicator sums) of each non-empty cell of the cube dims
+    (missing values are kept as a level, so that the cells add up to the dataset)
+    :param pd.DataFrame df: preprocessed civilian or officer dataset
+    :param str data_type: 'civilian' or 'officer'
+    :param list dims: columns of the cube (if None, cube_dims of data_type)
+    :return: dataframe with categorical dims and int counts
+    """
+
+    dims = [col for col in (cube_dims[data_type] if dims is None else dims) if col in df.columns]
+    causes = [cause for cause in incident_causes_list if cause in df.columns]
+    df_cube = df[dims + causes].assign(incidents=1).groupby(dims, dropna=False, sort=True) \
+        [['incidents'] + causes].sum().reset_index()
+
+    for col in dims:
+        if pd.api.types.is_string_dtype(df_cube[col]) or df_cube[col].dtype == object:
+            df_cube[col] = df_cube[col].astype('category')
+    for col in ['incidents'] + causes:
+        df_cube[col] = df_cube[col].astype(np.int32)
+    for col, dtype in [('year', np.int16), ('month', np.int8), ('civilian_age_binned', np.int8),
+                       ('delay_bin_label', np.int8)]:
+        if col in df_cube.columns:
+            df_cube[col] = df_cube[col].astype(dtype)
+    return df_cube
+
+
+def count_by_year(df_cube, years, col=None, weights='incidents'):
+
+    """
+    Counts by year (and by the levels of a column) from the cube table
+    :param pd.DataFrame df_cube: cube table (see get_cube_table)
+    :param list years: years of the tile
+    :param str col: column to split the counts by (None: totals only)
+    :param str weights: count column to sum
+    :return: list of counts by year, or dict of level and list of counts by year
+    """
+
+    if col is None:
+        return df_cube.groupby('year')[weights].sum().reindex(years, fill_value=0).tolist()
+    counts = df_cube.groupby([col, 'year'], observed=True)[weights].sum().unstack() \
+        .reindex(columns=years).fillna(0).astype(int)
+    return {str(level): row.tolist() for level, row in counts.iterrows()}
+
+
+def get_tile(df_cube, years, name, delay_days=None):
+
+    """
+    Summary tile of a county (or the state) in the numbers of the report figures:
+    incidents by year and race, gender and age group, deaths and survival rate (%) by year,
+    report delays by bin and incident causes by year
+    :param pd.DataFrame df_cube: cube table rows of the county (see get_cube_table)
+    :param list years: years of the tile
+    :param str name: county name (or statewide_name)
+    :param pd.Series delay_days: report delay (days) of the incidents of the county
+    :return: dict (JSON serializable)
+    """
+
+    race_col = 'civilian_race' if 'civilian_race' in df_cube.columns else 'officer_race'
+    gender_col = race_col.replace('_race', '_gender')
+    incidents = count_by_year(df_cube, years)
+    deaths = count_by_year(df_cube[df_cube['died']], years)
+    delays = df_cube.groupby('delay_bin_label')['incidents'].sum()
+
+    tile = {
+        'name': name,
+        'years': list(years),
+        'incidents': incidents,
+        'incidents_by_race': count_by_year(df_cube, years, race_col),
+        'incidents_by_gender': count_by_year(df_cube, years, gender_col),
+        'deaths': deaths,
+        'survival_rate': [None if n == 0 else round(100 * (n - d) / n, 1)
+                          for n, d in zip(incidents, deaths)],
+        'report_delay': {
+            'bins': report_delay_days_binnames,
+            'incidents': delays.reindex(range(len(report_delay_days_binnames)),
+                                        fill_value=0).tolist(),
+            'unknown': int(delays.get(-1, 0)),
+            'median_days': None if delay_days is None or delay_days.count() == 0
+            else float(delay_days.median()),
+        },
+    }
+    if 'civilian_age_binned' in df_cube.columns:
+        ages = count_by_year(df_cube, years, 'civilian_age_binned')
+        zeros = [0] * len(years)
+        tile['incidents_by_age_bin'] = {
+            'bins': age_names,
+            'incidents': [ages.get(str(i), zeros) for i in range(len(age_names))],
+            'unknown': ages.get(str(len(age_names)), zeros),
+        }
+    causes = [cause for cause in incident_causes_list if cause in df_cube.columns]
+    if len(causes) > 0:
+        tile['incident_causes'] = {cause: count_by_year(df_cube, years, weights=cause)
+                                   for cause in causes}
+    return tile
+
+
+def get_tile_filename(name):
+    return '{}.json'.format(name.lower().replace(' ', '_'))
+
+
+def write_file(fname, data):
+
+    """
+    Write a tile file if its content changed (a temporary file is replaced,
+    so that a static host never serves a partial file)
+    :param str fname: file name
+    :param bytes data: file content
+    :return: True if written
+    """
+
+    if os.path.exists(fname):
+        with open(fname, 'rb') as f:
+            if f.read() == data:
+                return False
+    os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+    with open(fname + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(fname + '.tmp', fname)
+    return True
+
+
+def to_json_bytes(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def publish_tiles(df, tiles_dir, data_type='civilian', years=None):
+
+    """
+    Publish the pre-aggregated tiles of a preprocessed dataset for static hosting:
+    tiles_dir/<data_type>/cube.parquet (statewide cube table), texas.json (statewide tile),
+    counties/<county>.json (county tiles) and index.json (counties with their tile file
+    and no. incidents). Unchanged files are not rewritten.
+    :param pd.DataFrame df: preprocessed civilian or officer dataset
+    :param str tiles_dir: output directory
+    :param str data_type: 'civilian' or 'officer'
+    :param list years: years of the tiles (if None, the years of the dataset)
+    :return: dict summary (no. tiles, no. written files and bytes)
+    """
+
+    if data_type not in cube_dims:
+        raise ValueError('data_type should be "civilian" or "officer"')
+
+    out_dir = os.path.join(tiles_dir, data_type)
+    years = sorted(df['year'].unique().tolist()) if years is None else [int(y) for y in years]
+    df_cube = get_cube_table(df[df['year'].isin(years)], data_type)
+    delay_days = df.loc[df['year'].isin(years), ['incident_county', 'delay_days']]
+
+    buffer = io.BytesIO()
+    df_cube.to_parquet(buffer, index=False)
+    files = {os.path.join(out_dir, 'cube.parquet'): buffer.getvalue()}
+    files[os.path.join(out_dir, get_tile_filename(statewide_name))] = get_tile(
+        df_cube, years, statewide_name, delay_days['delay_days'])
+    index = []
+    delay_days_by_county = delay_days.groupby('incident_county')['delay_days']
+    for county, df_county in df_cube.groupby('incident_county', observed=True):
+        # tile paths in the index are relative URLs
+        url = 'counties/' + get_tile_filename(county)
+        files[os.path.join(out_dir, 'counties', get_tile_filename(county))] = get_tile(
+            df_county, years, county, delay_days_by_county.get_group(county))
+        index.append({'name': county, 'tile': url,
+                      'incidents': int(df_county['incidents'].sum())})
+    files[os.path.join(out_dir, 'index.json')] = {
+        'data_type': data_type,
+        'years': years,
+        'incidents': int(df_cube['incidents'].sum()),
+        'counties': sorted(index, key=lambda x: -x['incidents']),
+        'cube': {'file': 'cube.parquet', 'dims': [col for col in cube_dims[data_type]
+                                                   if col in df_cube.columns]},
+    }
+
+    n_written, n_bytes = 0, 0
+    for fname, obj in files.items():
+        data = obj if isinstance(obj, bytes) else to_json_bytes(obj)
+        n_written += write_file(fname, data)
+        n_bytes += len(data)
+    return {'data_type': data_type, 'tiles': len(files) - 2, 'written': n_written,
+            'bytes': n_bytes}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Publish pre-aggregated JSON/Parquet tiles of the OIS data for the website')
+    parser.add_argument('--df-cd-filename',
+                        default='Data/Preprocessed/civilian_preprocessed_20162020.pkl')
+    parser.add_argument('--df-os-filename',
+                        default='Data/Preprocessed/officer_preprocessed_20162020.pkl')
+    parser.add_argument('--years-from', type=int, default=2016)
+    parser.add_argument('--years-to', type=int, default=2020)
+    parser.add_argument('--tiles-dir', default=tiles_dir_default)
+    args = parser.parse_args()
+
+    years = list(range(args.years_from, args.years_to + 1))
+    for data_type, fname in [('civilian', args.df_cd_filename), ('officer', args.df_os_filename)]:
+        start = time.perf_counter()
+        summary = publish_tiles(pd.read_pickle(fname), args.tiles_dir, data_type, years)
+        print('{data_type}: {tiles} tiles ({written} files written, {bytes} bytes)'.format(
+            **summary), '{:.2f} sec'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+import json
+import time
+import argparse
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+from preprocess import incident_causes_list
+from publish import get_cube_table
+
+# query dims and their columns ({} is the data type)
+dim_cols = {
+    'year': 'year',
+    'month': 'month',
+    'county': 'incident_county',
+    'race': '{}_race',
+    'gender': '{}_gender',
+    'age_bin': 'civilian_age_binned',
+    'died': 'died',
+    'delay_bin': 'delay_bin_label',
+}
+measures = ['incidents', 'deaths', 'survival_rate', 'rate_per_100k']
+# dims that the census denominators (population by county and race) do not depend on
+rate_dims = ['year', 'month', 'county', 'race', 'died', 'delay_bin', 'cause']
+port_default = 8050
+
+
+class QueryIndex:
+
+    """
+    Precomputed aggregate index of the preprocessed datasets for ad hoc queries:
+    one count cube table per dataset (see publish.get_cube_table) by all the query dims,
+    which a query filters and groups. The results are kept in an LRU cache
+    (queries that only differ in the case or the order of the levels share a cache entry).
+    e.g., index.query('civilian', by=['race', 'year'], measure='deaths', county=['HARRIS'])
+    """
+
+    def __init__(self, datasets, df_census=None, cache_size=1024):
+
+        """
+        :param dict datasets: data type ('civilian' or 'officer') and preprocessed dataframe
+        :param pd.DataFrame df_census: census population by county (index) and race (columns)
+        for the rate_per_100k measure
+        :param int cache_size: max. no. cached query results
+        """
+
+        self.tables = dict()
+        self.levels = dict()
+        for data_type, df in datasets.items():
+            cols = [col.format(data_type) for col in dim_cols.values()]
+            df_table = get_cube_table(df, data_type, cols)
+            df_table['deaths'] = df_table['incidents'] * df_table['died']
+            self.tables[data_type] = df_table
+            # levels by their upper case string (query strings are not typed)
+            self.levels[data_type] = {
+                dim: {str(level).upper(): level for level in df_table[col].unique()}
+                for dim, col in self.get_dim_cols(data_type).items()}
+            causes = [cause for cause in incident_causes_list if cause in df_table.columns]
+            if len(causes) > 0:
+                self.levels[data_type]['cause'] = {cause.upper(): cause for cause in causes}
+
+        self.df_census = None
+        if df_census is not None:
+            self.df_census = df_census.rename_axis(index='county', columns='race') \
+                .stack().rename('population').reset_index()
+        self._query = functools.lru_cache(maxsize=cache_size)(self._run_query)
+        self.n_queries = 0
+        self._lock = threading.Lock()
+
+    def get_dim_cols(self, data_type):
+
+        """
+        Query dims of a dataset and their columns
+        :param str data_type: 'civilian' or 'officer'
+        :return: dict of dim and column
+        """
+
+        columns = self.tables[data_type].columns
+        return {dim: col.format(data_type) for dim, col in dim_cols.items()
+                if col.format(data_type) in columns}
+
+    def get_dims(self):
+
+        """
+        Levels of the query dims of each dataset
+        :return: dict of data type, dim and list of levels (JSON serializable)
+        """
+
+        return {data_type: {dim: sorted([to_json_value(level) for level in levels.values()],
+                                        key=lambda v: (v is None, type(v).__name__, v or 0))
+                            for dim, levels in dims.items()}
+                for data_type, dims in self.levels.items()}
+
+    def parse_levels(self, data_type, dim, values):
+
+        """
+        Levels of a dim from query values
+        :param str data_type: 'civilian' or 'officer'
+        :param str dim: query dim
+        :param values: a value or list of values (case insensitive strings or levels)
+        :return: tuple of levels (sorted as strings)
+        """
+
+        if np.ndim(values) == 0:
+            values = [values]
+        levels = self.levels[data_type][dim]
+        unknown = [value for value in values if str(value).upper() not in levels]
+        if len(unknown) > 0:
+            raise ValueError('Unknown levels of {}: {}'.format(dim, unknown))
+        return tuple(sorted(set(levels[str(value).upper()] for value in values), key=str))
+
+    def query(self, data_type='civilian', by=(), measure='incidents', **filters):
+
+        """
+        Filter, group and measure the incidents of a dataset (cached)
+        :param str data_type: 'civilian' or 'officer'
+        :param str or list by: dims to group by (see dim_cols, and 'cause')
+        :param str measure: 'incidents', 'deaths', 'survival_rate' (%) or 'rate_per_100k'
+        (incidents per 100k population of the selected counties and races)
+        :param filters: dim and a level or list of levels to select
+        :return: dict of the query, 'columns' and 'rows' (non-empty groups only)
+        """
+
+        if data_type not in self.tables:
+            raise ValueError('Unknown data type: {} (use one of {})'.format(
+                data_type, list(self.tables)))
+        by = [by] if isinstance(by, str) else list(by)
+        for dim in by + list(filters):
+            if dim not in self.levels[data_type]:
+                raise ValueError('Unknown dim: {} (use one of {})'.format(
+                    dim, list(self.levels[data_type])))
+        if measure not in measures:
+            raise ValueError('Unknown measure: {} (use one of {})'.format(measure, measures))
+        if measure == 'rate_per_100k':
+            if self.df_census is None:
+                raise ValueError('rate_per_100k needs the census population')
+            if any(dim not in rate_dims for dim in by + list(filters)):
+                raise ValueError('rate_per_100k only supports the dims {}'.format(rate_dims))
+
+        key = (data_type, tuple(by), measure,
+               tuple(sorted((dim, self.parse_levels(data_type, dim, values))
+                            for dim, values in filters.items())))
+        with self._lock:
+            self.n_queries += 1
+        return self._query(key)
+
+    def _run_query(self, key):
+        data_type, by, measure, filters = key
+        filters = dict(filters)
+        df = self.tables[data_type]
+        dim_cols_type = self.get_dim_cols(data_type)
+
+        if 'cause' in by or 'cause' in filters:
+            # one row per cell and cause (an incident with multiple causes counts once per cause)
+            causes = list(filters.get('cause', self.levels[data_type]['cause'].values()))
+            df = df.melt(id_vars=list(dim_cols_type.values()) + ['incidents', 'deaths'],
+                         value_vars=causes, var_name='cause', value_name='cause_incidents')
+            df = df.assign(deaths=df['cause_incidents'] * df['died'],
+                           incidents=df['cause_incidents'])
+            dim_cols_type = dict(dim_cols_type, cause='cause')
+
+        mask = np.ones(df.shape[0], dtype=bool)
+        for dim, levels in filters.items():
+            if dim != 'cause':
+                mask &= df[dim_cols_type[dim]].isin(levels).values
+        df = df[mask]
+
+        cols = [dim_cols_type[dim] for dim in by]
+        if len(cols) == 0:
+            df_result = df[['incidents', 'deaths']].sum().to_frame().T
+        else:
+            df_result = df.groupby(cols, observed=True, dropna=False)[['incidents', 'deaths']] \
+                .sum().reset_index()
+            df_result = df_result[df_result['incidents'] > 0]
+        df_result.columns = list(by) + ['incidents', 'deaths']
+
+        if measure == 'survival_rate':
+            df_result[measure] = 100 * (1 - df_result['deaths'] / df_result['incidents'])
+        elif measure == 'rate_per_100k':
+            df_result[measure] = 1e5 * df_result['incidents'] / self.get_population(
+                df_result, by, filters)
+
+        return {
+            'data_type': data_type,
+            'by': list(by),
+            'measure': measure,
+            'filters': {dim: [to_json_value(level) for level in levels]
+                        for dim, levels in filters.items()},
+            'columns': list(by) + [measure],
+            'rows': [[to_json_value(value) for value in row]
+                     for row in df_result[list(by) + [measure]].itertuples(index=False)],
+        }
+
+    def get_population(self, df_result, by, filters):
+
+        """
+        Census population of each result row (sum over the selected counties and races)
+        :param pd.DataFrame df_result: grouped query result
+        :param tuple by: grouped dims
+        :param dict filters: dim and tuple of levels
+        :return: np.array
+        """
+
+        df_census = self.df_census
+        for dim in ['county', 'race']:
+            if dim in filters:
+                df_census = df_census[df_census[dim].isin(filters[dim])]
+        cols = [dim for dim in ['county', 'race'] if dim in by]
+        if len(cols) == 0:
+            return np.full(df_result.shape[0], df_census['population'].sum())
+        population = df_census.groupby(cols)['population'].sum()
+        index = pd.MultiIndex.from_frame(df_result[cols].astype(str)) if len(cols) > 1 \
+            else df_result[cols[0]].astype(str)
+        # rows of counties or races without census data get nan
+        return population.reindex(index).values
+
+    def cache_info(self):
+        return dict(self._query.cache_info()._asdict(), queries=self.n_queries)
+
+
+def to_json_value(value):
+
+    """
+    JSON value of a result cell (numpy scalars to python, nan to None)
+    :param value:
+    :return: int, float, bool, str or None
+    """
+
+    if isinstance(value, (np.generic,)):
+        value = value.item()
+    if isinstance(value, float):
+        return None if np.isnan(value) else round(value, 4)
+    return value
+
+
+def parse_query_string(query_string):
+
+    """
+    Query arguments from a URL query string, e.g.,
+    data=civilian&by=race,year&measure=deaths&county=harris,dallas&died=true
+    :param str query_string:
+    :return: dict of the QueryIndex.query arguments
+    """
+
+    params = {name: ','.join(values) for name, values in parse_qs(query_string).items()}
+    args = {'data_type': params.pop('data', 'civilian'),
+            'by': [dim for dim in params.pop('by', '').split(',') if dim != ''],
+            'measure': params.pop('measure', 'incidents')}
+    args.update({dim: values.split(',') for dim, values in params.items()})
+    return args
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+
+    """
+    JSON endpoints of the query service (the server has the QueryIndex in server.index):
+    GET /query?<query string> (see parse_query_string), POST /query with a JSON body
+    {"data_type": ..., "by": [...], "measure": ..., "filters": {...}},
+    GET /dims (levels of the query dims) and GET /stats (cache statistics)
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/query':
+            self.respond_query(parse_query_string(url.query))
+        elif url.path == '/dims':
+            self.respond(200, self.server.index.get_dims())
+        elif url.path == '/stats':
+            self.respond(200, self.server.index.cache_info())
+        else:
+            self.respond(404, {'error': 'Unknown path: {}'.format(url.path)})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/query':
+            self.respond(404, {'error': 'Unknown path: {}'.format(self.path)})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            args = dict(body.get('filters', {}), data_type=body.get('data_type', 'civilian'),
+                        by=body.get('by', []), measure=body.get('measure', 'incidents'))
+        except (ValueError, AttributeError) as e:
+            self.respond(400, {'error': 'Invalid JSON body: {}'.format(e)})
+            return
+        self.respond_query(args)
+
+    def respond_query(self, args):
+        try:
+            result = self.server.index.query(**args)
+        except (ValueError, TypeError) as e:
+            self.respond(400, {'error': str(e)})
+            return
+        self.respond(200, result)
+
+    def respond(self, status, obj):
+        data = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class QueryServer(ThreadingHTTPServer):
+
+    # one thread per request, and a listen backlog for bursts of concurrent clients
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(index, host='127.0.0.1', port=port_default, verbose=False):
+
+    """
+    HTTP server of the query service (one thread per request)
+    :param QueryIndex index:
+    :param str host:
+    :param int port: (0: any free port)
+    :param bool verbose: if True, log the requests
+    :return: QueryServer (call serve_forever)
+    """
+
+    server = QueryServer((host, port), QueryHandler)
+    server.index = index
+    server.verbose = verbose
+    return server
+
+
+def load_index(df_cd_filename, df_os_filename, census_filename, cache_size=1024):
+
+    """
+    Load the preprocessed datasets and the census population once and build the query index
+    :param str df_cd_filename: preprocessed civilian dataset (pkl)
+    :param str df_os_filename: preprocessed officer dataset (pkl)
+    :param str census_filename: census population by county and race (pkl)
+    :param int cache_size: max. no. cached query results
+    :return: QueryIndex
+    """
+
+    return QueryIndex({'civilian': pd.read_pickle(df_cd_filename),
+                       'officer': pd.read_pickle(df_os_filename)},
+                      pd.read_pickle(census_filename), cache_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local HTTP/JSON query service of the OIS data')
+    parser.add_argument('--df-cd-filename',
+                        default='Data/Preprocessed/civilian_preprocessed_20162020.pkl')
+    parser.add_argument('--df-os-filename',
+                        default='Data/Preprocessed/officer_preprocessed_20162020.pkl')
+    parser.add_argument('--census-filename', default='Data/Interim/census_county_race_2010.pkl')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=port_default)
+    parser.add_argument('--cache-size', type=int, default=1024)
+    parser.add_argument('--verbose', action='store_true', help='log the requests')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = load_index(args.df_cd_filename, args.df_os_filename, args.census_filename,
+                       args.cache_size)
+    server = make_server(index, args.host, args.port, args.verbose)
+    print('Query index loaded in {:.2f} sec, serving on http://{}:{}/query'.format(
+        time.perf_counter() - start, *server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
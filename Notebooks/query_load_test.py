@@ -0,0 +1,114 @@
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+import numpy as np
+import pandas as pd
+
+# representative ad hoc queries of the notebooks (GET query strings)
+load_test_queries = [
+    'data=civilian&by=race,died,year',
+    'data=civilian&by=year&measure=survival_rate',
+    'data=civilian&by=county&measure=deaths',
+    'data=civilian&by=race&measure=rate_per_100k&county=harris,dallas,bexar,tarrant,travis',
+    'data=civilian&by=cause,year',
+    'data=civilian&by=age_bin,race&died=true',
+    'data=civilian&by=delay_bin,year',
+    'data=civilian&by=month&year=2019,2020',
+    'data=officer&by=year&measure=survival_rate',
+    'data=officer&by=race,county&measure=deaths',
+]
+
+
+def send_query(url, query_string):
+
+    """
+    Send a GET query and measure its latency
+    :param str url: service URL, e.g., http://127.0.0.1:8050
+    :param str query_string: query string (see query.parse_query_string)
+    :return: tuple of HTTP status and latency (sec)
+    """
+
+    start = time.perf_counter()
+    try:
+        with urlopen(Request('{}/query?{}'.format(url, query_string))) as response:
+            response.read()
+            status = response.status
+    except HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def run_load_test(url, queries=load_test_queries, n_requests=2000, concurrency=16, seed=0):
+
+    """
+    Send random queries from concurrent clients (threads)
+    :param str url: service URL
+    :param list queries: query strings to sample from
+    :param int n_requests: total no. requests
+    :param int concurrency: no. concurrent clients
+    :param int seed: random seed of the query sample
+    :return: dict summary (throughput, latency percentiles in ms and no. errors)
+    """
+
+    sample = np.random.RandomState(seed).choice(len(queries), n_requests)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda i: send_query(url, queries[i]), sample))
+    wall_time = time.perf_counter() - start
+
+    statuses, latencies = zip(*results)
+    latencies = np.array(latencies) * 1000
+    return {
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'errors': sum(status != 200 for status in statuses),
+        'wall_time': round(wall_time, 3),
+        'requests_per_sec': round(n_requests / wall_time, 1),
+        'latency_mean_ms': round(latencies.mean(), 3),
+        'latency_p50_ms': round(np.percentile(latencies, 50), 3),
+        'latency_p95_ms': round(np.percentile(latencies, 95), 3),
+        'latency_p99_ms': round(np.percentile(latencies, 99), 3),
+        'latency_max_ms': round(latencies.max(), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of the OIS query service')
+    parser.add_argument('--url', default=None,
+                        help='service URL (if None, a service is started in this process)')
+    parser.add_argument('--df-cd-filename',
+                        default='Data/Preprocessed/civilian_preprocessed_20162020.pkl')
+    parser.add_argument('--df-os-filename',
+                        default='Data/Preprocessed/officer_preprocessed_20162020.pkl')
+    parser.add_argument('--census-filename', default='Data/Interim/census_county_race_2010.pkl')
+    parser.add_argument('--n-requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        import query
+        server = query.make_server(query.load_index(
+            args.df_cd_filename, args.df_os_filename, args.census_filename), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://{}:{}'.format(*server.server_address[:2])
+
+    try:
+        summaries = [run_load_test(url, n_requests=args.n_requests, concurrency=concurrency)
+                     for concurrency in args.concurrency]
+        print(pd.DataFrame(summaries).set_index('concurrency').to_string())
+        with urlopen('{}/stats'.format(url)) as response:
+            print('Cache:', json.loads(response.read()))
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    main()
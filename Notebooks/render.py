@@ -0,0 +1,475 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import matplotlib
+import instrument
+from export import get_export_filenames
+from cache import hash_sources
+
+# same styling as the data summary and data insight notebooks
+report_rcparams = {
+    'font.family': 'sans-serif',
+    'font.sans-serif': 'Lato',
+    'font.weight': 'bold',
+    'font.size': 10,
+    'axes.labelsize': 10,
+    'axes.labelweight': 'bold',
+    'axes.titlesize': 10,
+    'axes.titleweight': 'bold',
+    'figure.dpi': 72,
+    'figure.titlesize': 10,
+    'figure.titleweight': 'bold',
+    'legend.frameon': False,
+    'legend.edgecolor': 'white',
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+}
+cols_race = ['#CE2827', '#3167AE', '#4C5151', '#B8BAB9']
+cols_gender = ['#183458', '#9b1f20']
+
+plot_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plot.py')
+manifest_filename = 'manifest.json'
+
+# datasets shared by the figures of a worker process (set by init_worker)
+_datasets = dict()
+
+
+def get_colors(name, values):
+
+    """
+    Sample colors from a matplotlib colormap without importing pyplot
+    :param str name: colormap name
+    :param np.array values: values between 0 and 1
+    :return: np.array of RGBA colors
+    """
+
+    return matplotlib.colormaps[name](values) if hasattr(matplotlib, 'colormaps') \
+        else matplotlib.cm.get_cmap(name)(values)
+
+
+def get_report_datasets(df_cd, df_os, df_census):
+
+    """
+    Create the data slices that the report figures use (e.g., civilian deaths, male civilians)
+    :param pd.DataFrame df_cd: preprocessed civilian dataset
+    :param pd.DataFrame df_os: preprocessed officer dataset
+    :param pd.DataFrame df_census: census population by county (index) and race (columns)
+    :return: dict of dataset name and dataframe
+    """
+
+    df_cd_died = df_cd[df_cd['died'] == 1]
+    datasets = {
+        'df_cd': df_cd,
+        'df_cd_died': df_cd_died,
+        'df_cd_male': df_cd[df_cd['civilian_gender'] == 'MALE'],
+        'df_cd_died_male': df_cd_died[df_cd_died['civilian_gender'] == 'MALE'],
+        'df_cd_female': df_cd[df_cd['civilian_gender'] == 'FEMALE'],
+        'df_cd_died_female': df_cd_died[df_cd_died['civilian_gender'] == 'FEMALE'],
+        'df_os': df_os,
+        'df_os_died': df_os[df_os['officer_harm'] == 'DEATH'],
+        'df_census': df_census,
+    }
+    return datasets
+
+
+def get_report_figures(years, width_heatmap=14):
+
+    """
+    List of the report figures. Each figure is a dict of
+    name (output file name), func (plot.py function name), data (dataset name),
+    args (names of additional datasets passed as positional arguments) and kwargs.
+    :param list or np.array years: years in the report
+    :param int width_heatmap: figure width of the heatmaps
+    :return: list of dict
+    """
+
+    cols_year = get_colors('magma', np.linspace(0.8, 0.3, len(years)))
+    years_str = '{}-{}'.format(min(years), max(years))
+
+    figures = [
+        dict(name='civilians_shot_race_year', func='plot_line_race_year', data='df_cd',
+             kwargs=dict(title='CIVILIANS SHOT BY RACE AND YEAR (STATE LEVEL)')),
+        dict(name='civilian_deaths_race_year', func='plot_line_race_year', data='df_cd_died',
+             kwargs=dict(title='CIVILIAN DEATHS BY RACE AND YEAR (STATE LEVEL)')),
+        dict(name='civilians_shot_year_county', func='plot_stackedbar_year_county', data='df_cd',
+             kwargs=dict(title='A. CIVILIANS SHOT BY YEAR (TOP 10 COUNTIES)', total_count=True,
+                         colors=cols_year, figsize=(10, 3))),
+        dict(name='civilian_deaths_year_county', func='plot_stackedbar_year_county',
+             data='df_cd_died',
+             kwargs=dict(title='B. CIVILIAN DEATHS BY YEAR (TOP 10 COUNTIES)', total_count=True,
+                         colors=cols_year, figsize=(10, 3))),
+        dict(name='civilians_shot_county_race_year', func='plot_heatmap_county_race_year',
+             data='df_cd',
+             kwargs=dict(n_county=5, figsize=(width_heatmap, 3.5),
+                         title='CIVILIANS SHOT BY YEAR (TOP 5 COUNTIES)')),
+        dict(name='civilian_deaths_county_race_year', func='plot_heatmap_county_race_year',
+             data='df_cd_died',
+             kwargs=dict(n_county=5, figsize=(width_heatmap, 3.5),
+                         title='B. CIVILIAN DEATHS BY YEAR (TOP 5 COUNTIES)')),
+        dict(name='civilians_shot_race_year_county', func='plot_line_race_year_county',
+             data='df_cd',
+             kwargs=dict(title='CIVILIANS SHOT BY YEAR (TOP 5 COUNTIES)')),
+        dict(name='race_incident_vs_population',
+             func='plot_scatter_compare_race_incident_vs_population',
+             data='df_cd', args=['df_census'],
+             kwargs=dict(title='RACE COMPOSITION COMPARISON ({})'.format(years_str))),
+        dict(name='civilians_shot_gender', func='plot_pie', data='df_cd',
+             kwargs=dict(col='civilian_gender', colors=cols_gender, remove_labels=True,
+                         title='A. CIVILIANS SHOT BY GENDER', figsize=(4, 4))),
+        dict(name='civilians_shot_race', func='plot_pie', data='df_cd',
+             kwargs=dict(col='civilian_race', colors=cols_race, remove_labels=True,
+                         title='B. CIVILIANS SHOT BY RACE', figsize=(4, 4),
+                         bbox_to_anchor=(1.5, 0.1))),
+        dict(name='male_civilians_shot_county_race_year', func='plot_heatmap_county_race_year',
+             data='df_cd_male',
+             kwargs=dict(figsize=(width_heatmap, 3), cmap='Blues',
+                         title='A. MALE CIVILIANS SHOT (TOP 10 COUNTIES)')),
+        dict(name='male_civilian_deaths_county_race_year',
+             func='plot_heatmap_county_race_year', data='df_cd_died_male',
+             kwargs=dict(figsize=(width_heatmap, 3), cmap='Blues',
+                         title='B. MALE CIVILIAN DEATHS (TOP 10 COUNTIES)')),
+        dict(name='female_civilians_shot_county_race_year',
+             func='plot_heatmap_county_race_year', data='df_cd_female',
+             kwargs=dict(figsize=(width_heatmap, 3), cmap='Blues',
+                         title='A. FEMALE CIVILIANS SHOT (TOP 10 COUNTIES)')),
+        dict(name='female_civilian_deaths_county_race_year',
+             func='plot_heatmap_county_race_year', data='df_cd_died_female',
+             kwargs=dict(figsize=(width_heatmap, 3), cmap='Blues',
+                         title='B. FEMALE CIVILIAN DEATHS (TOP 10 COUNTIES)')),
+        dict(name='civilians_shot_age_race_year', func='plot_heatmap_age_race_year',
+             data='df_cd',
+             kwargs=dict(figsize=(width_heatmap, 3), cmap='Blues',
+                         title='A. CIVILIAN SHOT BY AGE GROUP')),
+        dict(name='civilian_deaths_age_race_year', func='plot_heatmap_age_race_year',
+             data='df_cd_died',
+             kwargs=dict(figsize=(width_heatmap, 3), cmap='Blues',
+                         title='B. CIVILIAN DEATHS BY AGE GROUP')),
+        dict(name='civilians_shot_age_race_cause', func='plot_heatmap_age_race_cause',
+             data='df_cd',
+             kwargs=dict(figsize=(14, 3), cmap='Blues',
+                         title='A. CIVILIAN SHOT BY INCIDENT CAUSES AND AGE')),
+        dict(name='civilian_deaths_age_race_cause', func='plot_heatmap_age_race_cause',
+             data='df_cd_died',
+             kwargs=dict(figsize=(14, 3), cmap='Blues',
+                         title='A. CIVILIAN DEATHS BY INCIDENT CAUSES AND AGE')),
+        dict(name='officers_shot_year_county', func='plot_stackedbar_year_county', data='df_os',
+             kwargs=dict(title='B. OFFICERS SHOT (TOP 10 COUNTIES)', total_count=True,
+                         colors=cols_year, figsize=(6, 3), bbox_to_anchor=(1.2, 1))),
+        dict(name='officer_deaths_year_county', func='plot_stackedbar_year_county',
+             data='df_os_died',
+             kwargs=dict(title='C. OFFICER DEATHS (TOP 10 COUNTIES)', total_count=True,
+                         colors=cols_year, figsize=(6, 3), bbox_to_anchor=(1.2, 1))),
+        dict(name='officers_shot_gender', func='plot_pie', data='df_os',
+             kwargs=dict(col='officer_gender', colors=cols_gender, remove_labels=True,
+                         title='A. OFFICERS SHOT BY GENDER')),
+        dict(name='officers_shot_race', func='plot_pie', data='df_os',
+             kwargs=dict(col='officer_race', colors=cols_race, remove_labels=True,
+                         title='B. OFFICERS SHOT BY RACE', figsize=(4, 4),
+                         bbox_to_anchor=(1.5, 0.1))),
+        dict(name='officers_shot_county_race_year', func='plot_heatmap_county_race_year',
+             data='df_os',
+             kwargs=dict(df_type='officer', figsize=(width_heatmap, 3), cmap='Blues',
+                         title='A. OFFICERS SHOT (TOP 10 COUNTIES)')),
+        dict(name='officer_deaths_county_race_year', func='plot_heatmap_county_race_year',
+             data='df_os_died',
+             kwargs=dict(df_type='officer', figsize=(width_heatmap, 3), cmap='Blues',
+                         title='A. OFFICER DEATHS (TOP 10 COUNTIES)')),
+    ]
+    return figures
+
+
+def hash_value(value, h):
+
+    """
+    Update a hash object with a dataframe, array or (nested) python value
+    :param value: value to hash (pd.DataFrame, pd.Series, np.array, dict, list or scalar)
+    :param h: hashlib hash object
+    :return: the same hash object
+    """
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        h.update(repr(list(value.columns) if isinstance(value, pd.DataFrame)
+                      else value.name).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update(repr((value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value):
+            h.update(repr(key).encode())
+            hash_value(value[key], h)
+    elif isinstance(value, (list, tuple)):
+        h.update(repr((type(value).__name__, len(value))).encode())
+        for item in value:
+            hash_value(item, h)
+    else:
+        h.update(repr(value).encode())
+    return h
+
+
+def fingerprint_figure(figure, datasets, fmt='eps', rcparams=report_rcparams, source_hash=None):
+
+    """
+    Compute the fingerprint of a figure from its input data slices,
+    its arguments, the report styling and the source of plot.py and the local modules
+    it imports (e.g., cube.py, export.py and preprocess.py).
+    :param dict figure: figure specification (see get_report_figures)
+    :param dict datasets: dataset name and dataframe (see get_report_datasets)
+    :param str or list fmt: file format (extension) or list of formats of the figure
+    :param dict rcparams: matplotlib rcParams for the report styling
+    :param str source_hash: hash of the plot.py sources (computed if None, see
+    cache.hash_sources)
+    :return: hex digest (sha256)
+    """
+
+    if source_hash is None:
+        source_hash = hash_sources(plot_filename)
+
+    h = hashlib.sha256(source_hash.encode())
+    hash_value([figure['func'], fmt, rcparams, figure.get('kwargs', {})], h)
+    for name in [figure['data']] + list(figure.get('args', [])):
+        hash_value(datasets[name], h)
+    return h.hexdigest()
+
+
+def read_manifest(out_dir):
+
+    """
+    Read the manifest of the rendered figures (empty if there is no manifest yet)
+    :param str out_dir: directory of the figures
+    :return: dict of figure name and its record (fingerprint, fname, wall_time, stale)
+    """
+
+    fname = os.path.join(out_dir, manifest_filename)
+    if not os.path.exists(fname):
+        return dict()
+    with open(fname) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, out_dir):
+    fname = os.path.join(out_dir, manifest_filename)
+    with open(fname + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(fname + '.tmp', fname)
+
+
+def get_figure_filename(out_dir, name, fmt='eps'):
+
+    """
+    File name(s) of a figure
+    :param str out_dir: directory of the figures
+    :param str name: figure name
+    :param str or list fmt: file format (extension) or list of formats (see export.export_figure)
+    :return: str or list of str
+    """
+
+    if isinstance(fmt, str):
+        return os.path.join(out_dir, '{}.{}'.format(name, fmt))
+    return get_export_filenames(os.path.join(out_dir, name), fmt)
+
+
+def get_stale_figures(figures, datasets, out_dir, fmt='eps', rcparams=report_rcparams):
+
+    """
+    Find the figures whose inputs (data slices, arguments, styling, plot.py and its local
+    imports) changed since they were rendered, or whose files are missing, and mark them
+    in the manifest
+    :param list figures: figure specifications (see get_report_figures)
+    :param dict datasets: dataset name and dataframe (see get_report_datasets)
+    :param str out_dir: directory of the figures
+    :param str or list fmt: file format (extension) or list of formats of the figures
+    :param dict rcparams: matplotlib rcParams for the report styling
+    :return: list of the stale figures and dict of the fingerprints by figure name
+    """
+
+    source_hash = hash_sources(plot_filename)
+
+    manifest = read_manifest(out_dir)
+    fingerprints = dict()
+    stale_figures = []
+    for figure in figures:
+        name = figure['name']
+        fingerprints[name] = fingerprint_figure(figure, datasets, fmt, rcparams, source_hash)
+        record = manifest.get(name, dict())
+        fname = get_figure_filename(out_dir, name, fmt)
+        stale = record.get('fingerprint') != fingerprints[name] or \
+            not all(os.path.exists(s) for s in ([fname] if isinstance(fname, str) else fname))
+        if stale:
+            stale_figures.append(figure)
+        record.update(fname=fname, stale=stale)
+        manifest[name] = record
+
+    os.makedirs(out_dir, exist_ok=True)
+    write_manifest(manifest, out_dir)
+    return stale_figures, fingerprints
+
+
+def init_worker(datasets, rcparams=None, trace_memory=None):
+
+    """
+    Set up a process for rendering: Agg backend, report styling and the shared datasets
+    :param dict datasets: dataset name and dataframe (see get_report_datasets)
+    :param dict rcparams: matplotlib rcParams to apply after the plot.py style
+    :param bool trace_memory: if not None, enable the instrumentation in the process
+    (see instrument.enable)
+    """
+
+    if trace_memory is not None:
+        instrument.enable(trace_memory)
+    matplotlib.use('Agg', force=True)
+    import plot  # plot.py sets the ggplot style when it is imported
+    matplotlib.rcParams.update(rcparams or {})
+    _datasets.update(datasets)
+
+
+def render_figure(figure, out_dir, fmt='eps'):
+
+    """
+    Render a single figure with the datasets of the current process
+    :param dict figure: figure specification (see get_report_figures)
+    :param str out_dir: directory to save the figure
+    :param str or list fmt: file format (extension) or list of formats of the figure
+    :return: tuple of figure name, file name and wall time (sec)
+    """
+
+    import matplotlib.pyplot as plt
+    import plot
+
+    start = time.perf_counter()
+    fname = get_figure_filename(out_dir, figure['name'], fmt)
+    args = [_datasets[name] for name in figure.get('args', [])]
+    data = _datasets[figure['data']]
+    try:
+        with instrument.step('{} ({})'.format(figure['func'], figure['name']), 'figure',
+                             rows_in=instrument.count_rows(data)):
+            getattr(plot, figure['func'])(data, *args, fname=fname, **figure.get('kwargs', {}))
+    finally:
+        plt.close('all')
+
+    return figure['name'], fname, time.perf_counter() - start
+
+
+def render_figure_in_worker(figure, out_dir, fmt='eps'):
+
+    """
+    Render a single figure in a worker process (see render_figure)
+    :param dict figure: figure specification (see get_report_figures)
+    :param str out_dir: directory to save the figure
+    :param str or list fmt: file format (extension) or list of formats of the figure
+    :return: output of render_figure and the instrumentation events of the figure
+    """
+
+    return render_figure(figure, out_dir, fmt), instrument.pop_events()
+
+
+def render_figures(figures, datasets, out_dir, n_jobs=None, fmt='eps', rcparams=report_rcparams,
+                   incremental=False, verbose=True):
+
+    """
+    Render figures in a process pool (Agg backend). Each worker receives the datasets once.
+    In the incremental mode, only the figures whose fingerprint changed are rendered
+    (see get_stale_figures) and the manifest in out_dir is updated.
+    :param list figures: figure specifications (see get_report_figures)
+    :param dict datasets: dataset name and dataframe (see get_report_datasets)
+    :param str out_dir: directory to save the figures
+    :param int n_jobs: no. worker processes (None: no. cores, 1: render in this process)
+    :param str or list fmt: file format (extension) or list of formats of the figures
+    :param dict rcparams: matplotlib rcParams for the report styling
+    :param bool incremental: if True, skip the figures whose inputs have not changed
+    :param bool verbose: if True, print the wall time of each figure
+    :return: dataframe of file name and wall time (sec) by figure name (rendered figures only)
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    n_figures = len(figures)
+
+    if incremental:
+        figures, fingerprints = get_stale_figures(figures, datasets, out_dir, fmt, rcparams)
+        if verbose:
+            print('{} of {} figures are stale'.format(len(figures), n_figures))
+        # workers only need the datasets of the stale figures
+        names = set(name for figure in figures
+                    for name in [figure['data']] + list(figure.get('args', [])))
+        datasets = {name: datasets[name] for name in names}
+
+    if len(figures) == 0:
+        results = []
+    elif n_jobs == 1:
+        backend = matplotlib.get_backend()
+        try:
+            with matplotlib.rc_context():
+                init_worker(datasets, rcparams)
+                results = [render_figure(figure, out_dir, fmt) for figure in figures]
+        finally:
+            matplotlib.use(backend, force=True)
+    else:
+        # the workers send their instrumentation events back with the results
+        recorder = instrument.get_recorder()
+        trace_memory = None if recorder is None else recorder.trace_memory
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker,
+                                 initargs=(datasets, rcparams, trace_memory)) as executor:
+            futures = [executor.submit(render_figure_in_worker, figure, out_dir, fmt)
+                       for figure in figures]
+            results = []
+            for future in futures:
+                result, events = future.result()
+                results.append(result)
+                instrument.add_events(events)
+
+    df_results = pd.DataFrame(results, columns=['name', 'fname', 'wall_time']).set_index('name')
+
+    if incremental:
+        manifest = read_manifest(out_dir)
+        for name, fname, wall_time in results:
+            manifest[name] = dict(fingerprint=fingerprints[name], fname=fname,
+                                  wall_time=wall_time, stale=False)
+        write_manifest(manifest, out_dir)
+
+    if verbose:
+        if len(results) > 0:
+            print(df_results['wall_time'].round(2).to_string())
+        print('{} figures: {:.2f} sec in total (sum of figures: {:.2f} sec)'.format(
+            len(figures), time.perf_counter() - start, df_results['wall_time'].sum()))
+    return df_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the OIS report figures in parallel')
+    parser.add_argument('--df-cd-filename',
+                        default='Data/Preprocessed/civilian_preprocessed_20162020.pkl')
+    parser.add_argument('--df-os-filename',
+                        default='Data/Preprocessed/officer_preprocessed_20162020.pkl')
+    parser.add_argument('--census-filename', default='Data/Interim/census_county_race_2010.pkl')
+    parser.add_argument('--years-from', type=int, default=2016)
+    parser.add_argument('--years-to', type=int, default=2020)
+    parser.add_argument('--width-heatmap', type=float, default=14)
+    parser.add_argument('--out-dir', default='Figures/Notebook')
+    parser.add_argument('--fmt', nargs='+', default=['eps'],
+                        help='file format(s), e.g., --fmt eps pdf svg png')
+    parser.add_argument('--dpi', type=float, default=None, help='resolution of the raster formats')
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--incremental', action='store_true',
+                        help='only render the figures whose inputs changed')
+    args = parser.parse_args()
+
+    matplotlib.use('Agg')
+    datasets = get_report_datasets(pd.read_pickle(args.df_cd_filename),
+                                   pd.read_pickle(args.df_os_filename),
+                                   pd.read_pickle(args.census_filename))
+    figures = get_report_figures(np.arange(args.years_from, args.years_to + 1),
+                                 args.width_heatmap)
+    rcparams = dict(report_rcparams, **({} if args.dpi is None else {'savefig.dpi': args.dpi}))
+    render_figures(figures, datasets, args.out_dir, n_jobs=args.n_jobs,
+                   fmt=args.fmt[0] if len(args.fmt) == 1 else args.fmt, rcparams=rcparams,
+                   incremental=args.incremental)
+
+
+if __name__ == '__main__':
+    main()
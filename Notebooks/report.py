@@ -0,0 +1,332 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import matplotlib
+import preprocess
+import render
+import instrument
+
+# same colors as the data summary and data insight notebooks
+cols_oag_tji = ['#929596', '#000000']
+cols_incident_causes = ['#000000', '#4c5151', '#6f7574', '#929596', '#b7bab9']
+cols_deaths_injury = ['#9b1f20', '#183458']
+cols_shot_deaths = ['#000000', '#9b1f20']
+cols_bar = ['#6f7574']
+cols_civilian_officer = ['#9b1f20', '#183458']
+race_list = ['WHITE', 'BLACK', 'HISPANIC', 'OTHER']
+agency_names_cd = ['agency_name_' + str(n) for n in range(1, 12)]
+agency_names_os = ['agency_name_1', 'agency_name_2']
+# age groups of the mortality data compared in the data insight section (age 15-24 to 55-64)
+inds_age_binned = np.arange(2, 7)
+sections = ['data_summary', 'data_insight']
+
+
+def load_report_data(df_cd_filename, df_os_filename, census_filename, oag_report_filename,
+                     death_age_male_filename, death_county_filename):
+
+    """
+    Load the datasets of both report sections once
+    :param str df_cd_filename: preprocessed civilian dataset (pkl)
+    :param str df_os_filename: preprocessed officer dataset (pkl)
+    :param str census_filename: census population by county and race (pkl)
+    :param str oag_report_filename: summary of the OAG reports (csv)
+    :param str death_age_male_filename: male mortality by age and race (csv)
+    :param str death_county_filename: mortality by county and race (csv)
+    :return: dict of dataset name and dataframe (see render.get_report_datasets)
+    """
+
+    datasets = render.get_report_datasets(pd.read_pickle(df_cd_filename),
+                                          pd.read_pickle(df_os_filename),
+                                          pd.read_pickle(census_filename))
+
+    df_oag = pd.read_csv(oag_report_filename, index_col=0)
+    df_oag.columns = df_oag.columns.astype(int)
+    datasets['df_oag'] = df_oag
+    datasets['df_death_age_male'] = pd.read_csv(death_age_male_filename, index_col='Age',
+                                                encoding='utf-8-sig').iloc[1:, :]
+    datasets['df_death_county'] = pd.read_csv(death_county_filename, index_col='County',
+                                              encoding='utf-8-sig')
+
+    # data slices of the data insight section and the agency figure
+    df_cd, df_os = datasets['df_cd'], datasets['df_os']
+    top5_locs = df_cd['incident_county'].value_counts()[:5].index.values
+    datasets['df_cd_top5'] = df_cd.loc[df_cd['incident_county'].isin(top5_locs), :]
+    datasets['df_cd_black_youth_died'] = df_cd.loc[(df_cd['civilian_age_binned'] == 2) &
+                                                   (df_cd['civilian_race'] == 'BLACK') &
+                                                   (df_cd['civilian_gender'] == 'MALE') &
+                                                   (df_cd['died'] == 1), :]
+    datasets['df_agency'] = pd.concat([df_cd[agency_names_cd + ['year']],
+                                       df_os[agency_names_os + ['year']]], axis=0)
+    return datasets
+
+
+def get_report_tables(datasets):
+
+    """
+    Compute the tables of both report sections (also used as the data of the figures
+    that compare the OIS data with the census and mortality data)
+    :param dict datasets: dataset name and dataframe (see load_report_data)
+    :return: dict of table name and dataframe (or series)
+    """
+
+    df_cd, df_cd_died = datasets['df_cd'], datasets['df_cd_died']
+    df_os, df_os_died = datasets['df_os'], datasets['df_os_died']
+    df_census, df_oag = datasets['df_census'], datasets['df_oag']
+    df_death_age_male = datasets['df_death_age_male']
+    df_death_county = datasets['df_death_county']
+    incident_causes_list_sorted = list(df_cd[preprocess.incident_causes_list].sum(axis=0)
+                                       .sort_values(ascending=False).index)
+
+    top5_locs = df_cd['incident_county'].value_counts()[:5].index.values
+    df_cd_top5 = datasets['df_cd_top5']
+
+    tables = dict()
+    tables['incident_causes_sorted'] = pd.Series(incident_causes_list_sorted)
+
+    # data summary
+    tables['incidents_by_county'] = df_cd.groupby(['incident_county'])['date_incident'].count() \
+        .sort_values(ascending=False)
+    tables['incident_causes'] = df_cd[incident_causes_list_sorted].sum(axis=0)
+    tables['officer_age_median'] = pd.Series({'shot': df_os['officer_age'].median(),
+                                              'died': df_os_died['officer_age'].median()})
+    _, df_agency_count_plot = preprocess.count_agencies_by_year_type(
+        datasets['df_agency'], agency_names_cd, 5)
+    for key, df in df_agency_count_plot.items():
+        tables['agency_count_' + key] = df
+
+    # data insight
+    df_oag_sum = df_oag.loc[['C-DEATH', 'C-INJURY'], :].sum(axis=0)
+    df_cd_sum = df_cd.groupby('year')['date_incident'].count()
+    tables['oag_vs_tji'] = pd.concat([df_oag_sum, df_cd_sum], axis=1, keys=['OAG', 'TJI'])
+    tables['civilian_severity_by_year'] = df_cd.groupby(['year', 'civilian_died'])['date_incident'] \
+        .count().unstack()
+    tables['harm_civilian_vs_officer'] = pd.concat([df_cd['civilian_died'].value_counts(),
+                                                    df_os['officer_harm'].value_counts()], axis=1).T
+
+    tables['df_cd_race_county_top5_pct'] = preprocess.crosstab_by_topN_cities(
+        df_cd, 'civilian_race', 'incident_county', N=5, ratio=True)*100
+    tables['df_cd_race_county_top5_total'] = preprocess.crosstab_by_topN_cities(
+        df_cd, 'civilian_race', 'incident_county', N=5, ratio=False)['TOTAL']
+    tables['df_census_top5_pct'] = preprocess.pct(df_census, axis=1) \
+        .loc[tables['df_cd_race_county_top5_pct'].index, :]
+
+    df_cd_died_male = df_cd_died.loc[df_cd_died['civilian_gender'] == 'MALE', :]
+    df_cd_died_male_top5 = df_cd_died_male.groupby(['incident_county', 'civilian_race'])[
+        'date_incident'].count().unstack().fillna(0).loc[top5_locs, race_list]
+    tables['df_cd_died_male_top5_pct'] = preprocess.pct(df_cd_died_male_top5, 1)
+    tables['df_cd_died_male_top5_total'] = df_cd_died_male_top5.sum(axis=1).astype(int)
+    tables['df_census_died_top5_pct'] = preprocess.pct(df_death_county.drop('TOTAL', axis=1), 1) \
+        .loc[top5_locs, :]
+
+    df_cd_died_male_age = df_cd_died_male.groupby(['civilian_age_binned', 'civilian_race'])[
+        'date_incident'].count().unstack().fillna(0)[race_list]
+    df_cd_died_male_age_binned = df_cd_died_male_age.loc[inds_age_binned, :].drop('OTHER', axis=1)
+    df_death_age_male_binned = df_death_age_male.iloc[inds_age_binned, :].drop('TOTAL', axis=1)
+    age_names = ['Age {}'.format(s) for s in df_death_age_male.index.values[inds_age_binned]]
+    tables['df_cd_died_male_age_binned_pct'] = preprocess.pct(df_cd_died_male_age_binned, 1) \
+        .set_axis(age_names, axis=0)
+    tables['df_death_age_male_binned_pct'] = preprocess.pct(df_death_age_male_binned, 1) \
+        .set_axis(age_names, axis=0)
+    tables['df_cd_died_male_age_binned_total'] = df_cd_died_male_age_binned.sum(axis=1).astype(int)
+
+    tables['age_at_death_median'] = df_cd_died.groupby('civilian_race')['civilian_age'] \
+        .median()[race_list]
+    tables['incident_causes_race_top5'] = df_cd_top5.groupby('civilian_race')[
+        incident_causes_list_sorted].sum().loc[race_list, incident_causes_list_sorted]
+    tables['delay_days_median'] = pd.Series({'civilian': df_cd['delay_days'].median(),
+                                             'officer': df_os['delay_days'].median()})
+    return tables
+
+
+def get_data_summary_figures(datasets, years, width_heatmap=14):
+
+    """
+    List of the data summary figures (see render.get_report_figures for the format)
+    :param dict datasets: dataset name and dataframe (see load_report_data and get_report_tables)
+    :param list or np.array years: years in the report
+    :param int width_heatmap: figure width of the heatmaps
+    :return: list of dict
+    """
+
+    cols_year = render.get_colors('magma', np.linspace(0.8, 0.3, len(years)))
+    causes = list(datasets['incident_causes_sorted'])
+
+    figures = render.get_report_figures(years, width_heatmap) + [
+        dict(name='incident_causes', func='plot_donut_incident_causes', data='df_cd',
+             kwargs=dict(causes=causes, colors=cols_incident_causes)),
+        dict(name='civilians_shot_county_cause', func='plot_barh_county_cause', data='df_cd',
+             kwargs=dict(causes=causes, colors=cols_incident_causes,
+                         title='A. Civilians shot by incident causes'.upper())),
+        dict(name='civilian_deaths_county_cause', func='plot_barh_county_cause',
+             data='df_cd_died',
+             kwargs=dict(causes=causes, colors=cols_incident_causes,
+                         title='A. Civilian deaths by incident causes'.upper())),
+        dict(name='officers_shot_year', func='plot_bar_year', data='df_os',
+             kwargs=dict(title='A. Officers Shot'.upper(), color=cols_bar)),
+        dict(name='officer_age', func='plot_box_officer_age', data='df_os', args=['df_os_died'],
+             kwargs=dict(colors=cols_shot_deaths)),
+        dict(name='agencies_year_type', func='plot_barh_agency_year_type', data='df_agency',
+             kwargs=dict(agency_names=agency_names_cd, years=list(years), colors=cols_year)),
+    ]
+    return figures
+
+
+def get_data_insight_figures(datasets, years, width_heatmap=14):
+
+    """
+    List of the data insight figures (see render.get_report_figures for the format)
+    :param dict datasets: dataset name and dataframe (see load_report_data and get_report_tables)
+    :param list or np.array years: years in the report
+    :param int width_heatmap: figure width of the subplots by year
+    :return: list of dict
+    """
+
+    cols_year = render.get_colors('magma', np.linspace(0.8, 0.3, len(years)))
+    causes = list(datasets['incident_causes_sorted'])
+
+    figures = [
+        dict(name='oag_vs_tji_year', func='plot_bar_oag_tji_year', data='df_cd', args=['df_oag'],
+             kwargs=dict(colors=cols_oag_tji)),
+        dict(name='civilian_severity_year', func='plot_bar_severity_year', data='df_cd',
+             kwargs=dict(colors=cols_deaths_injury)),
+        dict(name='survival_rate', func='plot_bar_survival_rate', data='df_cd', args=['df_os'],
+             kwargs=dict(colors=cols_civilian_officer)),
+        dict(name='civilians_shot_race_severity_year', func='plot_bar_race_severity_year',
+             data='df_cd',
+             kwargs=dict(years=list(years), colors=cols_deaths_injury,
+                         figsize=(width_heatmap, 5),
+                         title='A. Civilians shot by race, year and severity (all counties)'
+                         .upper())),
+        dict(name='civilians_shot_race_severity_year_top5', func='plot_bar_race_severity_year',
+             data='df_cd',
+             kwargs=dict(years=list(years), colors=cols_deaths_injury, n_county=5,
+                         figsize=(width_heatmap, 5),
+                         title='A. Civilians shot by race, year and severity (top 5 counties)'
+                         .upper())),
+        dict(name='race_county_vs_population', func='plot_stackedbar_compare_ratio',
+             data='df_cd_race_county_top5_pct',
+             args=['df_census_top5_pct', 'df_cd_race_county_top5_total'],
+             kwargs=dict(legend=False, figsize=(10, 6))),
+        dict(name='male_deaths_race_county_vs_mortality', func='plot_stackedbar_compare_ratio',
+             data='df_cd_died_male_top5_pct',
+             args=['df_census_died_top5_pct', 'df_cd_died_male_top5_total'],
+             kwargs=dict(severity='Deaths', legend=False, figsize=(10, 6))),
+        dict(name='male_deaths_race_age_vs_mortality', func='plot_stackedbar_compare_ratio',
+             data='df_cd_died_male_age_binned_pct',
+             args=['df_death_age_male_binned_pct', 'df_cd_died_male_age_binned_total'],
+             kwargs=dict(severity='Deaths', legend=False, figsize=(10, 6))),
+        dict(name='black_male_youth_deaths_county_year', func='plot_barh_county_year',
+             data='df_cd_black_youth_died',
+             kwargs=dict(years=list(years), colors=cols_year,
+                         title='Deaths of Black Male Civilians with Ages 15-24'.upper())),
+        dict(name='age_at_death_race_year', func='plot_box_age_race_year', data='df_cd_died',
+             kwargs=dict(years=list(years), figsize=(width_heatmap, 4))),
+        dict(name='incident_causes_severity_year', func='plot_line_cause_year_severity',
+             data='df_cd',
+             kwargs=dict(causes=causes, years=list(years), colors=cols_incident_causes)),
+        dict(name='race_incident_causes_top5', func='plot_barh_race_cause', data='df_cd_top5',
+             kwargs=dict(causes=causes,
+                         title='Race demographics by incident (top 5 counties)'.upper())),
+        dict(name='report_delay_year', func='plot_barh_delay_year', data='df_cd',
+             kwargs=dict(years=list(years[1:]), color=cols_bar)),
+        dict(name='report_delay_county', func='plot_barh_delay_county', data='df_cd',
+             kwargs=dict(colors=cols_oag_tji)),
+    ]
+    return figures
+
+
+def save_tables(tables, out_dir):
+
+    """
+    Save the tables as csv files
+    :param dict tables: table name and dataframe (see get_report_tables)
+    :param str out_dir: directory to save the tables
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, table in tables.items():
+        table.to_csv(os.path.join(out_dir, '{}.csv'.format(name)))
+
+
+def run_report(datasets, years, out_dir, width_heatmap=14, fmt='eps', n_jobs=1,
+               incremental=False, report_sections=sections, verbose=True):
+
+    """
+    Create the figures and tables of the report sections from datasets that are loaded once.
+    The sections only read the datasets (derived data goes to the tables).
+    :param dict datasets: dataset name and dataframe (see load_report_data)
+    :param list or np.array years: years in the report
+    :param str out_dir: directory of the figures (tables are saved in out_dir/Tables)
+    :param int width_heatmap: figure width of the heatmaps
+    :param str or list fmt: file format (extension) or list of formats of the figures
+    :param int n_jobs: no. processes to render the figures (1: render in this process)
+    :param bool incremental: if True, skip the figures whose inputs have not changed
+    :param list report_sections: sections to create ('data_summary' and/or 'data_insight')
+    :param bool verbose: if True, print the progress
+    :return: dict of table name and dataframe
+    """
+
+    start = time.perf_counter()
+    tables = get_report_tables(datasets)
+    datasets = dict(datasets, **tables)
+    save_tables(tables, os.path.join(out_dir, 'Tables'))
+
+    figures = []
+    if 'data_summary' in report_sections:
+        figures += get_data_summary_figures(datasets, years, width_heatmap)
+    if 'data_insight' in report_sections:
+        figures += get_data_insight_figures(datasets, years, width_heatmap)
+    render.render_figures(figures, datasets, out_dir, n_jobs=n_jobs, fmt=fmt,
+                          incremental=incremental, verbose=verbose)
+
+    if verbose:
+        print('Report: {:.2f} sec'.format(time.perf_counter() - start))
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create the OIS report figures and tables')
+    parser.add_argument('--df-cd-filename',
+                        default='Data/Preprocessed/civilian_preprocessed_20162020.pkl')
+    parser.add_argument('--df-os-filename',
+                        default='Data/Preprocessed/officer_preprocessed_20162020.pkl')
+    parser.add_argument('--census-filename', default='Data/Interim/census_county_race_2010.pkl')
+    parser.add_argument('--oag-report-filename', default='Data/Interim/OAG_report_summary.csv')
+    parser.add_argument('--death-age-male-filename',
+                        default='Data/Raw/Census/mortality_rate_by_age_male.csv')
+    parser.add_argument('--death-county-filename',
+                        default='Data/Raw/Census/mortality_rate_by_county.csv')
+    parser.add_argument('--years-from', type=int, default=2016)
+    parser.add_argument('--years-to', type=int, default=2020)
+    parser.add_argument('--width-heatmap', type=float, default=14)
+    parser.add_argument('--out-dir', default='Figures/Notebook')
+    parser.add_argument('--fmt', nargs='+', default=['eps'],
+                        help='file format(s), e.g., --fmt eps pdf svg png')
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--incremental', action='store_true',
+                        help='only render the figures whose inputs changed')
+    parser.add_argument('--sections', nargs='+', default=sections, choices=sections)
+    parser.add_argument('--trace-filename', default=None,
+                        help='record the figure renders and save a Chrome trace file')
+    args = parser.parse_args()
+
+    matplotlib.use('Agg')
+    if args.trace_filename is not None:
+        instrument.enable()
+    datasets = load_report_data(args.df_cd_filename, args.df_os_filename, args.census_filename,
+                                args.oag_report_filename, args.death_age_male_filename,
+                                args.death_county_filename)
+    run_report(datasets, np.arange(args.years_from, args.years_to + 1), args.out_dir,
+               width_heatmap=args.width_heatmap,
+               fmt=args.fmt[0] if len(args.fmt) == 1 else args.fmt, n_jobs=args.n_jobs,
+               incremental=args.incremental, report_sections=args.sections)
+    if args.trace_filename is not None:
+        events = instrument.disable()
+        instrument.save_trace(events, args.trace_filename)
+        print(instrument.summarize(events).round(4).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+date_jitter_days = 15
+
+
+def get_group_index(codes):
+
+    """
+    Sort rows by group code so that the rows of a group can be sampled with one random number
+    :param np.array codes: group code of each row (0, ..., n_groups-1)
+    :return: (row positions sorted by group, start position of each group, size of each group)
+    """
+
+    order = np.argsort(codes, kind='stable')
+    sizes = np.bincount(codes)
+    starts = np.r_[0, np.cumsum(sizes)[:-1]]
+    return order, starts, sizes
+
+
+def sample_within_groups(rng, group_index, codes):
+
+    """
+    Sample a row of the same group for each code
+    :param np.random.Generator rng:
+    :param tuple group_index: output of get_group_index
+    :param np.array codes: group codes to sample for
+    :return: np.array of row positions
+    """
+
+    order, starts, sizes = group_index
+    offsets = np.floor(rng.random(len(codes)) * sizes[codes]).astype(int)
+    return order[starts[codes] + offsets]
+
+
+class SyntheticGenerator:
+
+    """
+    Generator of synthetic raw civilian or officer datasets (same columns as the raw csv)
+    that follow the distributions of a real raw dataset:
+    - the incident county, race, gender, harm and cause are sampled jointly (as a real row),
+    mixed with independent samples of each column (smoothing) to create new combinations
+    - age is sampled given the race, and the agency/officer columns given the county
+    (as the block of columns of a real row in the same county)
+    - the incident date is a real date with a jitter of a few days (same year), and the
+    report delay (date_ag_received) is sampled given the year
+    - the other columns are sampled independently from their distributions
+    """
+
+    def __init__(self, df, data_type=None, smoothing=0.1):
+
+        """
+        :param pd.DataFrame df: raw civilian or officer dataset (e.g., tji_civilians-shot_Apr2021.csv)
+        :param str data_type: 'civilian' or 'officer' (if None, inferred from the columns)
+        :param float smoothing: ratio of rows whose joint columns are sampled independently
+        """
+
+        if data_type is None:
+            data_type = 'civilian' if 'civilian_race' in df.columns else 'officer'
+        if data_type == 'civilian':
+            self.joint_cols = ['incident_county', 'civilian_race', 'civilian_gender',
+                               'civilian_died', 'incident_result_of']
+            self.age_col, self.race_col = 'civilian_age', 'civilian_race'
+            self.name_cols = ['civilian_name_first', 'civilian_name_last', 'civilian_name_full']
+            block_prefixes = ['agency_', 'officer_']
+        elif data_type == 'officer':
+            self.joint_cols = ['incident_county', 'officer_race', 'officer_gender', 'officer_harm']
+            self.age_col, self.race_col = 'officer_age', 'officer_race'
+            self.name_cols = ['officer_name_first', 'officer_name_last']
+            block_prefixes = ['agency_']
+        else:
+            raise ValueError('data_type should be "civilian" or "officer"')
+
+        self.df = df.reset_index(drop=True)
+        self.data_type = data_type
+        self.smoothing = smoothing
+        self.columns = list(df.columns)
+        self.block_cols = [col for col in self.columns
+                           if any(col.startswith(s) for s in block_prefixes)
+                           and col not in self.joint_cols + self.name_cols + [self.age_col]]
+
+        # incident dates and report delays (days)
+        self.date_format = self.get_date_format(df['date_incident'])
+        self.dates = pd.to_datetime(self.df['date_incident'])
+        self.delays = (pd.to_datetime(self.df['date_ag_received']) - self.dates).dt.days.values
+        self.date_received_format = self.get_date_format(df['date_ag_received'])
+
+        # row groups for the conditional sampling
+        # (codes of the uniques of pd.factorize, the missing values are the last group)
+        self.race_codes, self.races = pd.factorize(self.df[self.race_col])
+        self.county_codes, self.counties = pd.factorize(self.df['incident_county'])
+        self.year_codes, self.years = pd.factorize(self.dates.dt.year)
+        self.race_index = get_group_index(np.where(self.race_codes < 0, len(self.races),
+                                                   self.race_codes))
+        self.county_index = get_group_index(np.where(self.county_codes < 0, len(self.counties),
+                                                     self.county_codes))
+        self.year_index = get_group_index(np.where(self.year_codes < 0, len(self.years),
+                                                   self.year_codes))
+
+    @staticmethod
+    def get_date_format(s):
+
+        """
+        Guess the date format of a date column of the raw csv
+        :param pd.Series s: date strings
+        :return: str format for strftime
+        """
+
+        s = s.dropna()
+        if s.shape[0] > 0 and len(str(s.iloc[0])) > 10:
+            return '%Y-%m-%d %H:%M:%S'
+        return '%Y-%m-%d'
+
+    def sample(self, n_rows, rng):
+
+        """
+        Sample synthetic rows
+        :param int n_rows: no. rows
+        :param np.random.Generator rng: random generator
+        :return: dataframe with the columns of the raw dataset
+        """
+
+        n_fit = self.df.shape[0]
+        df = dict()
+
+        # joint columns: a real row, or each column independently for a ratio of rows
+        inds_joint = rng.integers(0, n_fit, n_rows)
+        is_smoothed = rng.random(n_rows) < self.smoothing
+        for col in self.joint_cols:
+            inds = inds_joint.copy()
+            inds[is_smoothed] = rng.integers(0, n_fit, is_smoothed.sum())
+            df[col] = self.df[col].values[inds]
+        race_codes = self.races.get_indexer(df[self.race_col])
+        race_codes = np.where(race_codes < 0, len(self.races), race_codes)
+        county_codes = self.counties.get_indexer(df['incident_county'])
+        county_codes = np.where(county_codes < 0, len(self.counties), county_codes)
+
+        # age given race, agency and officer columns given county
+        df[self.age_col] = self.df[self.age_col].values[
+            sample_within_groups(rng, self.race_index, race_codes)]
+        inds_block = sample_within_groups(rng, self.county_index, county_codes)
+        for col in self.block_cols:
+            df[col] = self.df[col].values[inds_block]
+
+        # incident date with a jitter (within the same year) and the report delay given the year
+        dates = self.dates.values[inds_joint]
+        dates_jittered = dates + rng.integers(-date_jitter_days, date_jitter_days + 1,
+                                              n_rows).astype('timedelta64[D]')
+        dates = pd.DatetimeIndex(np.where(pd.DatetimeIndex(dates_jittered).year ==
+                                          pd.DatetimeIndex(dates).year, dates_jittered, dates))
+        year_codes = self.year_codes[inds_joint]
+        year_codes = np.where(year_codes < 0, len(self.years), year_codes)
+        delays = self.delays[sample_within_groups(rng, self.year_index, year_codes)]
+        dates_received = dates + pd.to_timedelta(delays, unit='D')
+        df['date_incident'] = np.where(dates.isna(), None, dates.strftime(self.date_format))
+        df['date_ag_received'] = np.where(dates_received.isna(), None,
+                                          dates_received.strftime(self.date_received_format))
+
+        # names from independent first and last names
+        first_col, last_col = self.name_cols[:2]
+        for col in [first_col, last_col]:
+            df[col] = self.df[col].values[rng.integers(0, n_fit, n_rows)]
+        if len(self.name_cols) > 2:
+            df[self.name_cols[2]] = pd.Series(df[first_col]) + ' ' + pd.Series(df[last_col])
+
+        for col in self.columns:
+            if col not in df:
+                df[col] = self.df[col].values[rng.integers(0, n_fit, n_rows)]
+
+        return pd.DataFrame(df, columns=self.columns)
+
+    def to_csv(self, fname, n_rows, seed=0, chunksize=100000):
+
+        """
+        Write a synthetic dataset to csv chunk by chunk (the memory does not grow with n_rows).
+        The output is deterministic given the seed and chunksize.
+        :param str fname: output csv file
+        :param int n_rows: no. rows
+        :param int seed: random seed
+        :param int chunksize: no. rows to generate at once
+        """
+
+        os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+        for i, start in enumerate(range(0, n_rows, chunksize)):
+            rng = np.random.default_rng([seed, i])
+            df_chunk = self.sample(min(chunksize, n_rows - start), rng)
+            df_chunk.to_csv(fname, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic raw OIS dataset')
+    parser.add_argument('--raw-filename', default='Data/Raw/Website/tji_civilians-shot_Apr2021.csv')
+    parser.add_argument('--out-filename', required=True)
+    parser.add_argument('--n-rows', type=int, required=True)
+    parser.add_argument('--data-type', default=None, help='"civilian" or "officer"')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--smoothing', type=float, default=0.1)
+    parser.add_argument('--chunksize', type=int, default=100000)
+    args = parser.parse_args()
+
+    generator = SyntheticGenerator(pd.read_csv(args.raw_filename), args.data_type, args.smoothing)
+    generator.to_csv(args.out_filename, args.n_rows, seed=args.seed, chunksize=args.chunksize)
+
+
+if __name__ == '__main__':
+    main()
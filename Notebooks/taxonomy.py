@@ -0,0 +1,291 @@
+import re
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+# incident causes of incident_result_of in the priority order of clean_incident_causes
+# (each ';' separated cause gets the first category with a keyword in it)
+cause_taxonomy = {
+    'columns': ['incident_result_of'],
+    'separator': ';',
+    'mode': 'first',
+    'word_start': False,
+    'categories': [
+        ['Emergency/Request for Assistance', ['EMERGENCY']],
+        ['Hostage/Barricade/Other Emergency', ['HOSTAGE']],
+        ['Other', ['OTHER']],
+        ['Traffic Stop', ['TRAFFIC STOP']],
+        ['Execution of a Warrant', ['WARRANT']],
+    ],
+}
+
+# weapons of weapon_reported_by_media (or of weapon_reported_by_media_category if missing);
+# longer keywords take precedence over the keywords within them (e.g., BB GUN over GUN).
+# The indicator columns are prefixed with weapon_cat_ (and call_cat_ for the call types),
+# so that they do not mix with the raw weapon_reported_by_media* columns
+weapon_taxonomy = {
+    'columns': ['weapon_reported_by_media', 'weapon_reported_by_media_category'],
+    'mode': 'all',
+    'word_start': True,
+    'categories': [
+        ['weapon_cat_firearm', ['GUN', 'FIREARM', 'HANDGUN', 'PISTOL', 'REVOLVER', 'RIFLE',
+                                'SHOTGUN', 'LONG GUN', 'GLOCK']],
+        ['weapon_cat_replica', ['BB GUN', 'PELLET GUN', 'AIRSOFT', 'AIR SOFT GUN',
+                                'PRETEND GUN', 'REPLICA', 'REPLICA GUN', 'TOY GUN', 'FAKE GUN',
+                                'IMITATION', 'IMITATION WEAPON']],
+        ['weapon_cat_knife', ['KNIFE', 'KNIVES', 'CUTTING', 'MACHETE', 'HATCHET', 'BOX CUTTER',
+                              'SWORD', 'CLEAVER', 'AX', 'AXE', 'PICK AXE', 'PICKAXE',
+                              'SCISSORS', 'SHARP', 'BROKEN BOTTLE']],
+        ['weapon_cat_vehicle', ['VEHICLE', 'CAR', 'TRUCK']],
+        ['weapon_cat_blunt', ['BAT', 'CLUB', 'PIPE', 'BRICK', 'HAMMER', 'BATON', 'FRYING PAN',
+                              'SCREWDRIVER', 'ROCK', 'FLASHLIGHT']],
+        ['weapon_cat_taser', ['TASER', 'STUN GUN']],
+        ['weapon_cat_other', ['OTHER', 'BODY', 'WEAPON']],
+    ],
+}
+
+# call types of the free-text incident_call_other (an incident can have several)
+call_taxonomy = {
+    'columns': ['incident_call_other'],
+    'mode': 'all',
+    'word_start': True,
+    'categories': [
+        ['call_cat_robbery_burglary', ['ROBBERY', 'BURGLARY', 'THEFT', 'STOLEN']],
+        ['call_cat_disturbance', ['DISTURBANCE', 'DOMESTIC', 'FAMILY VIOLENCE', 'ROAD RAGE',
+                                  'FIGHT', 'ASSAULT']],
+        ['call_cat_mental_health', ['SUICID', 'MENTAL', 'CRISIS']],
+        ['call_cat_suspicious', ['SUSPICIOUS']],
+        ['call_cat_armed_person', ['WITH A GUN', 'WITH A KNIFE', 'ARMED', 'SHOTS FIRED',
+                                   'ACTIVE SHOOTER', 'SHOOTING', 'DEADLY WEAPON']],
+        ['call_cat_hostage_barricade', ['HOSTAGE', 'BARRICADE']],
+        ['call_cat_pursuit', ['PURSUIT', 'CHASE', 'FLED', 'FLEEING']],
+        ['call_cat_warrant', ['WARRANT', 'FUGITIVE']],
+        ['call_cat_traffic', ['TRAFFIC', 'PEDESTRIAN STOP', 'VEHICLE STOP']],
+        ['call_cat_accidental_discharge', ['ACCIDENTAL DISCHARGE']],
+        ['call_cat_other', ['OTHER - SPECIFY']],
+    ],
+}
+
+taxonomies = {'cause': cause_taxonomy, 'weapon': weapon_taxonomy, 'call': call_taxonomy}
+
+
+class AhoCorasick:
+
+    """
+    Multi-pattern automaton (Aho-Corasick) that finds all the occurrences of a set of
+    keywords in a single scan of a text
+    """
+
+    def __init__(self, keywords):
+
+        """
+        :param list keywords: keywords (str); the match ids are the positions in the list
+        """
+
+        self.keywords = list(keywords)
+        self.goto = [dict()]
+        self.fail = [0]
+        self.output = [[]]
+
+        for i, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append(dict())
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(i)
+
+        # failure links in breadth-first order (the outputs of the fail state are inherited)
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail > 0 and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0) \
+                    if self.goto[fail].get(char, 0) != next_state else 0
+                self.output[next_state] = self.output[next_state] + \
+                    self.output[self.fail[next_state]]
+
+    def find_all(self, text):
+
+        """
+        All (overlapping) occurrences of the keywords in a text
+        :param str text:
+        :return: list of (start, end, keyword id)
+        """
+
+        matches = []
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state > 0 and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for i in self.output[state]:
+                matches.append((end - len(self.keywords[i]), end, i))
+        return matches
+
+
+def select_longest(matches):
+
+    """
+    Leftmost-longest non-overlapping subset of matches
+    :param list matches: (start, end, keyword id)
+    :return: list of (start, end, keyword id)
+    """
+
+    selected = []
+    last_end = 0
+    for start, end, i in sorted(matches, key=lambda m: (m[0], -m[1])):
+        if start >= last_end:
+            selected.append((start, end, i))
+            last_end = end
+    return selected
+
+
+class Taxonomy:
+
+    """
+    Rule-driven categorization of a text column: the keywords of all the categories are
+    compiled into one automaton (keywords starting with 're:' are regular expressions).
+    In the 'first' mode, each segment of a text (split by the separator) gets the category
+    of the highest priority (order of the categories) among all its matches and a segment
+    without a match raises a ValueError (as clean_incident_causes). In the 'all' mode,
+    a text gets every category of its leftmost-longest matches.
+    """
+
+    def __init__(self, categories, columns, mode='all', separator=None, word_start=True):
+
+        """
+        :param list categories: pairs of category name and list of keywords (priority order)
+        :param list columns: text columns (the first non-missing value of a row is used)
+        :param str mode: 'first' or 'all'
+        :param str separator: separator of the segments ('first' mode)
+        :param bool word_start: if True, keywords only match from the start of a word
+        """
+
+        if mode not in ['first', 'all']:
+            raise ValueError('mode should be "first" or "all"')
+        self.names = [name for name, _ in categories]
+        self.columns = list(columns)
+        self.mode = mode
+        self.separator = separator
+        self.word_start = word_start
+
+        keywords, self.keyword_categories, self.regexes = [], [], []
+        for i, (_, patterns) in enumerate(categories):
+            for pattern in patterns:
+                if pattern.startswith('re:'):
+                    self.regexes.append((re.compile(pattern[3:]), i))
+                else:
+                    keywords.append(pattern.upper())
+                    self.keyword_categories.append(i)
+        self.automaton = AhoCorasick(keywords)
+
+    @classmethod
+    def from_dict(cls, taxonomy):
+        return cls(taxonomy['categories'], taxonomy['columns'], taxonomy.get('mode', 'all'),
+                   taxonomy.get('separator'), taxonomy.get('word_start', True))
+
+    def match(self, text):
+
+        """
+        Categories of the matches in a text
+        :param str text: upper case text
+        :return: list of category ids (in the order of the matches)
+        """
+
+        matches = self.automaton.find_all(text)
+        if self.word_start:
+            matches = [m for m in matches if m[0] == 0 or not text[m[0] - 1].isalnum()]
+        if self.mode == 'all':
+            matches = select_longest(matches)
+        categories = [self.keyword_categories[i] for _, _, i in matches]
+        categories += [i for regex, i in self.regexes if regex.search(text)]
+        return categories
+
+    def classify(self, text):
+
+        """
+        Count of each category in a text
+        :param str text:
+        :return: np.array of uint8 counts (one per category)
+        """
+
+        counts = np.zeros(len(self.names), dtype=np.uint8)
+        text = text.upper()
+        if self.mode == 'all':
+            counts[list(set(self.match(text)))] = 1
+            return counts
+        for segment in text.split(self.separator) if self.separator else [text]:
+            categories = self.match(segment)
+            if len(categories) == 0:
+                raise ValueError('No category of "{}" matches "{}"'.format(
+                    ', '.join(self.names), segment))
+            counts[min(categories)] += 1
+        return counts
+
+    def encode(self, df):
+
+        """
+        Indicator (count) columns of the categories. Each distinct text is classified only
+        once into a lookup table, which is broadcast to the rows through the factorized
+        codes. Rows without text get all-zero rows.
+        :param pd.DataFrame df: dataset with the text columns
+        :return: dataframe with the category names as columns (uint8)
+        """
+
+        texts = df[self.columns[0]]
+        for col in self.columns[1:]:
+            texts = texts.fillna(df[col])
+        codes, uniques = pd.factorize(texts)
+
+        # the last row of the lookup table is kept empty for missing values (code -1)
+        table = np.zeros((len(uniques) + 1, len(self.names)), dtype=np.uint8)
+        for i, text in enumerate(uniques):
+            table[i] = self.classify(str(text))
+        return pd.DataFrame(table[codes], index=df.index, columns=self.names)
+
+
+def encode_taxonomies(df, taxonomy_specs=taxonomies):
+
+    """
+    Indicator columns of several taxonomies (e.g., causes, weapons and call types),
+    skipping the taxonomies whose columns are not in the dataset
+    :param pd.DataFrame df:
+    :param dict taxonomy_specs: taxonomy name and dict spec (see cause_taxonomy)
+    :return: dataframe of the indicator columns
+    """
+
+    dfs = [Taxonomy.from_dict(spec).encode(df) for spec in taxonomy_specs.values()
+           if all(col in df.columns for col in spec['columns'])]
+    if len(dfs) == 0:
+        return pd.DataFrame(index=df.index)
+    return pd.concat(dfs, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Categorize the incident causes, weapons and call types of a dataset')
+    parser.add_argument('--df-filename',
+                        default='Data/Preprocessed/civilian_preprocessed_20162020.pkl')
+    parser.add_argument('--taxonomy-filename', default=None,
+                        help='JSON file of the taxonomies (default: the taxonomies of taxonomy.py)')
+    args = parser.parse_args()
+
+    taxonomy_specs = taxonomies
+    if args.taxonomy_filename is not None:
+        with open(args.taxonomy_filename) as f:
+            taxonomy_specs = json.load(f)
+    df = pd.read_pickle(args.df_filename)
+    df_indicators = encode_taxonomies(df, taxonomy_specs)
+    print(df_indicators.astype(bool).sum().to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from taxonomy import Taxonomy, taxonomies
+
+# declarative schemas of the raw datasets (see validate): not-null columns, county columns
+# (domain of the census county names), parseable dates, ordered date pairs (first <= second),
+# numeric ranges [min, max], value domains, text vocabularies (taxonomy name of taxonomy.py
+# whose 'first' mode categories must match every segment) and name columns (first, last, full)
+civilian_schema = {
+    'not_null': ['date_incident', 'incident_county', 'incident_result_of', 'civilian_died'],
+    'county': ['incident_county'],
+    'dates': ['date_incident', 'date_ag_received'],
+    'date_order': [['date_incident', 'date_ag_received']],
+    'ranges': {'civilian_age': [0, 110]},
+    'values': {'civilian_died': ['DEATH', 'INJURY'],
+               'civilian_race': ['WHITE', 'BLACK', 'HISPANIC', 'OTHER'],
+               'civilian_gender': ['MALE', 'FEMALE']},
+    'vocabulary': {'incident_result_of': 'cause'},
+    'names': [['civilian_name_first', 'civilian_name_last', 'civilian_name_full']],
+}
+officer_schema = {
+    'not_null': ['date_incident', 'incident_county', 'officer_harm'],
+    'county': ['incident_county'],
+    'dates': ['date_incident', 'date_ag_received'],
+    'date_order': [['date_incident', 'date_ag_received']],
+    'ranges': {'officer_age': [15, 90]},
+    'values': {'officer_harm': ['DEATH', 'INJURY'],
+               'officer_race': ['WHITE', 'BLACK', 'HISPANIC', 'OTHER'],
+               'officer_gender': ['MALE', 'FEMALE'],
+               'civilian_harm': ['DEATH', 'INJURY', 'NONE']},
+}
+schemas = {'civilian': civilian_schema, 'officer': officer_schema}
+report_cols = ['rule', 'column', 'row', 'value', 'message']
+# rules of the schemas with a list or a dict of column specs
+list_rules = ['not_null', 'county', 'dates', 'date_order', 'names']
+dict_rules = ['ranges', 'values', 'vocabulary']
+
+
+def get_violations(df, mask, rule, column, message, value_col=None):
+
+    """
+    Violations of a rule for the masked rows
+    :param pd.DataFrame df:
+    :param np.array or pd.Series mask: bool mask of the rows that violate the rule
+    :param str rule:
+    :param str column: column checked
+    :param str or pd.Series message: message of all the rows or of each row
+    :param str value_col: column of the reported values (default: column)
+    :return: dataframe with report_cols
+    """
+
+    mask = np.asarray(mask, dtype=bool)
+    values = df[value_col or column].values[mask]
+    return pd.DataFrame({
+        'rule': rule,
+        'column': column,
+        'row': df.index[mask],
+        'value': pd.Series(values, dtype=object).where(pd.notnull(values), None).values,
+        'message': message[mask].values if isinstance(message, pd.Series) else message,
+    }, columns=report_cols)
+
+
+def check_not_null(df, cols):
+    return [get_violations(df, df[col].isna(), 'not_null', col, 'Missing value')
+            for col in cols]
+
+
+def check_county(df, cols, county_names):
+    return [get_violations(df, df[col].notna() & ~df[col].isin(county_names), 'county', col,
+                           'Not a county name') for col in cols]
+
+
+def parse_dates(df, cols):
+    return {col: pd.to_datetime(df[col], errors='coerce') for col in cols}
+
+
+def check_dates(df, cols, dates):
+    return [get_violations(df, df[col].notna() & dates[col].isna(), 'dates', col,
+                           'Date cannot be parsed') for col in cols]
+
+
+def check_date_order(df, pairs, dates):
+    violations = []
+    for col_first, col_second in pairs:
+        mask = dates[col_second] < dates[col_first]  # NaT compares False
+        message = '{} is before {} ('.format(col_second, col_first) + \
+            dates[col_first].dt.strftime('%Y-%m-%d').fillna('') + ')'
+        violations.append(get_violations(df, mask, 'date_order', col_second, message))
+    return violations
+
+
+def check_ranges(df, ranges):
+    violations = []
+    for col, (min_value, max_value) in ranges.items():
+        values = pd.to_numeric(df[col], errors='coerce')
+        violations.append(get_violations(df, df[col].notna() & values.isna(), 'ranges', col,
+                                         'Not a number'))
+        violations.append(get_violations(df, (values < min_value) | (values > max_value),
+                                         'ranges', col,
+                                         'Out of [{}, {}]'.format(min_value, max_value)))
+    return violations
+
+
+def check_values(df, domains):
+    return [get_violations(df, df[col].notna() & ~df[col].isin(values), 'values', col,
+                           'Not one of {}'.format(', '.join(values)))
+            for col, values in domains.items()]
+
+
+def check_vocabulary(df, vocabularies, taxonomy_specs=taxonomies):
+
+    """
+    Segments of the text columns without a category of their taxonomy (the raw strings are
+    factorized, so each distinct string is checked only once)
+    :param pd.DataFrame df:
+    :param dict vocabularies: column and taxonomy name
+    :param dict taxonomy_specs: taxonomy name and dict spec (see taxonomy.cause_taxonomy)
+    :return: list of violation dataframes
+    """
+
+    violations = []
+    for col, name in vocabularies.items():
+        taxonomy = Taxonomy.from_dict(taxonomy_specs[name])
+        codes, uniques = pd.factorize(df[col])
+        messages = []
+        for text in uniques:
+            segments = str(text).upper().split(taxonomy.separator) if taxonomy.separator \
+                else [str(text).upper()]
+            unknown = [s.strip() for s in segments if len(taxonomy.match(s)) == 0]
+            messages.append('No {} category matches "{}"'.format(name, '", "'.join(unknown))
+                            if len(unknown) > 0 else None)
+        # the last message is kept for missing values (code -1)
+        messages = pd.Series(np.array(messages + [None], dtype=object)[codes], index=df.index)
+        violations.append(get_violations(df, messages.notna(), 'vocabulary', col, messages))
+    return violations
+
+
+def check_names(df, name_cols):
+
+    """
+    Consistency of the full names with the first and last names (full name = first and
+    last name separated by a space, or the only one that is given), when any is given
+    :param pd.DataFrame df:
+    :param list name_cols: triplets of the first, last and full name columns
+    :return: list of violation dataframes
+    """
+
+    violations = []
+    for col_first, col_last, col_full in name_cols:
+        first, last, full = df[col_first], df[col_last], df[col_full]
+        expected = first.str.cat(last, sep=' ').fillna(first).fillna(last)
+        violations.append(get_violations(
+            df, full.isna() & expected.notna(), 'names', col_full,
+            'Missing full name of "' + expected.fillna('') + '"', value_col=col_first))
+        violations.append(get_violations(
+            df, full.notna() & expected.notna() & (full.str.strip() != expected.str.strip()),
+            'names', col_full,
+            'Does not match the first and last names "' + expected.fillna('') + '"'))
+    return violations
+
+
+def get_schema_cols(schema):
+
+    """
+    Columns of the rules of a schema
+    :param dict schema: see civilian_schema
+    :return: list of column names
+    """
+
+    cols = []
+    for spec in schema.values():
+        for entry in spec:  # column names, or lists of them (dict specs: the keys)
+            cols += entry if isinstance(entry, list) else [entry]
+    return list(dict.fromkeys(cols))
+
+
+def validate(df, schema, county_names):
+
+    """
+    Check a raw dataset against a schema in one pass and report every violation (instead
+    of stopping at the first error as Preprocess does). The schema columns that are not in
+    the dataset are reported as 'columns' violations (row None) and their rules are skipped.
+    :param pd.DataFrame df: raw civilian or officer dataset
+    :param dict schema: see civilian_schema
+    :param list or pd.Index county_names: correct county names
+    :return: dataframe of the violations (rule, column, row label, value and message)
+    """
+
+    missing_cols = [col for col in get_schema_cols(schema) if col not in df.columns]
+    # rules of the schema without the entries of the missing columns
+    rules = dict()
+    for rule in list_rules + dict_rules:
+        spec = schema.get(rule, dict() if rule in dict_rules else [])
+        if rule in dict_rules:
+            rules[rule] = {col: value for col, value in spec.items() if col not in missing_cols}
+        else:
+            rules[rule] = [entry for entry in spec if len(set(
+                entry if isinstance(entry, list) else [entry]) & set(missing_cols)) == 0]
+
+    dates = parse_dates(df, get_schema_cols({'dates': rules['dates'],
+                                             'date_order': rules['date_order']}))
+    violations = [pd.DataFrame({'rule': 'columns', 'column': missing_cols, 'row': None,
+                                'value': None, 'message': 'Missing column'},
+                               columns=report_cols)]
+    violations += check_not_null(df, rules['not_null'])
+    violations += check_county(df, rules['county'], county_names)
+    violations += check_dates(df, rules['dates'], dates)
+    violations += check_date_order(df, rules['date_order'], dates)
+    violations += check_ranges(df, rules['ranges'])
+    violations += check_values(df, rules['values'])
+    violations += check_vocabulary(df, rules['vocabulary'])
+    violations += check_names(df, rules['names'])
+
+    return pd.concat(violations, axis=0, ignore_index=True)
+
+
+def summarize_report(report, n_examples=3):
+
+    """
+    No. violations and distinct values of each rule and column
+    :param pd.DataFrame report: see validate
+    :param int n_examples: no. example rows and values
+    :return: dataframe indexed by rule and column
+    """
+
+    def join(values):
+        values = pd.unique(values.dropna().astype(str))
+        return ', '.join(values[:n_examples]) + (', ...' if len(values) > n_examples else '')
+
+    if report.shape[0] == 0:
+        return pd.DataFrame(columns=['n_rows', 'n_values', 'rows', 'values'])
+    return report.groupby(['rule', 'column'], sort=False).agg(
+        n_rows=('row', 'size'), n_values=('value', 'nunique'), rows=('row', join),
+        values=('value', join))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Report every schema violation of a raw OIS dataset in one pass')
+    parser.add_argument('--raw-filename', default='Data/Raw/Website/tji_civilians-shot_Apr2021.csv')
+    parser.add_argument('--data-type', default='civilian', help='"civilian" or "officer"')
+    parser.add_argument('--census-filename', default='Data/Interim/census_county_race_2010.pkl')
+    parser.add_argument('--out-filename', default=None,
+                        help='csv of all the violations (default: Data/Interim/'
+                             'validation_<data type>.csv)')
+    args = parser.parse_args()
+
+    if args.data_type not in schemas:
+        raise ValueError('data_type should be "civilian" or "officer"')
+    out_filename = args.out_filename or 'Data/Interim/validation_{}.csv'.format(args.data_type)
+
+    df = pd.read_csv(args.raw_filename)
+    report = validate(df, schemas[args.data_type], pd.read_pickle(args.census_filename).index)
+    print('{} violations in {} rows of {} rows'.format(
+        report.shape[0], report['row'].nunique(), df.shape[0]))
+    print(summarize_report(report).to_string())
+
+    os.makedirs(os.path.dirname(out_filename) or '.', exist_ok=True)
+    report.to_csv(out_filename, index=False)
+
+
+if __name__ == '__main__':
+    main()